@@ -38,7 +38,8 @@ module AHB_BUS
   //parameter logic [AW-1:0] S_ADDR_START [NSLAVES],    // This style doesn't seem to work in DC 
   //parameter logic [AW-1:0] S_ADDR_END [NSLAVES]       // This style doesn't seem to work in DC 
   parameter logic [(NSLAVES*AW)-1:0] S_ADDR_START,    
-  parameter logic [(NSLAVES*AW)-1:0] S_ADDR_END       
+  parameter logic [(NSLAVES*AW)-1:0] S_ADDR_END,      
+  parameter logic [(NSLAVES*AW)-1:0] S_ADDR_MASK = '0   // Optional: non-zero selects a mask-compare decode for that slave
 )
 (
   input logic HCLK, HRESETn,
@@ -88,11 +89,20 @@ end
 // Address Decoder
 //---------------------------------------------------------
 
+// A slave with a non-zero S_ADDR_MASK is a power-of-two sized region aligned
+// to its size, so only the address bits above the region size are compared
+// against the start address: one equality compare instead of two magnitude
+// compares.  vgen_memmap.py generates the masks for the aligned regions.
 generate for (i=0; i<NSLAVES; i=i+1) begin
-  assign S[i].HSEL =    // ignore if start and end are zero
-                        ~((S_ADDR_START[(i*AW)+AW-1:(i*AW)]==32'h0000_0000) & (S_ADDR_END[(i*AW)+AW-1:(i*AW)]==32'h0000_0000)) &
-                        // assert HSEL if address is within this range
-                        (M.HADDR[31:0] >= S_ADDR_START[(i*AW)+AW-1:(i*AW)]) & (M.HADDR[31:0] <= S_ADDR_END[(i*AW)+AW-1:(i*AW)]);
+  if (S_ADDR_MASK[(i*AW)+AW-1:(i*AW)] != '0) begin : g_mask_decode
+    assign S[i].HSEL =    // assert HSEL if the masked address matches the start address
+                          ((M.HADDR[31:0] & S_ADDR_MASK[(i*AW)+AW-1:(i*AW)]) == S_ADDR_START[(i*AW)+AW-1:(i*AW)]);
+  end else begin : g_range_decode
+    assign S[i].HSEL =    // ignore if start and end are zero
+                          ~((S_ADDR_START[(i*AW)+AW-1:(i*AW)]==32'h0000_0000) & (S_ADDR_END[(i*AW)+AW-1:(i*AW)]==32'h0000_0000)) &
+                          // assert HSEL if address is within this range
+                          (M.HADDR[31:0] >= S_ADDR_START[(i*AW)+AW-1:(i*AW)]) & (M.HADDR[31:0] <= S_ADDR_END[(i*AW)+AW-1:(i*AW)]);
+  end
 //  assign S[i].HSEL =    // ignore if start and end are zero
 //                        ~((S_ADDR_START[i]==32'h0000_0000) & (S_ADDR_END[i]==32'h0000_0000)) &
 //                        // assert HSEL if address is within this range
@@ -81,7 +81,7 @@ logic [7:0] hmselbuf_data, decerrbuf_data;
 logic [7:0] hrdatabuf_data, ahberrbuf_data;
 logic tx_work, echo_out;
 logic sm_hmsel, sm_decerr, sm_ahbrd;
-logic sm_readout, sm_ahberr, sm_done;
+logic sm_readout, sm_ahberr, sm_done, sm_burst;
 
 uartfront u_uartfront (
 .clk, .rstn,
@@ -116,14 +116,15 @@ uartfront u_uartfront (
 .sm_decerr,             // state=DECODE_ERR
 .sm_ahbrd,              // state=AHB_READ
 .sm_readout,            // state=READ_OUT
-.sm_ahberr              // state=AHB_ERR
+.sm_ahberr,             // state=AHB_ERR
+.sm_burst               // burst read in progress
 );
 
 //---------------------------------------------------------
 // Decoder
 //---------------------------------------------------------
 logic [31:0] addr_uart, wrdata_uart;
-logic we_uart, sm_start_uart;
+logic we_uart, inc_uart, burst_uart, sm_start_uart;
 logic decode_err_uart;
 logic [15:0] err_code_uart;
 
@@ -139,6 +140,8 @@ decoder u_decoder(
 .addr_uart,         // Decoded Address
 .wrdata_uart,       // Decoded Write Data
 .we_uart,           // Decoded Write Enable
+.inc_uart,          // Decoded Auto-Increment Write
+.burst_uart,        // Decoded Burst Read
 .decode_err_uart,   // Decode err
 .sm_start_uart,     // Start signal for FSM in backend
 .err_code_uart      // err code
@@ -179,7 +182,7 @@ scanfront u_scanfront (
 // UART_SCAN_MUX
 //---------------------------------------------------------
 logic [31:0] addr, wrdata;
-logic we, sm_start, scanxfer;
+logic we, inc, burst, sm_start, scanxfer;
 logic decode_err;
 logic [15:0] err_code;
 
@@ -191,6 +194,8 @@ frontmux u_frontmux (
 .addr_uart,         // Decoded Address
 .wrdata_uart,       // Decoded Write Data
 .we_uart,           // Decoded Write Enable
+.inc_uart,          // Decoded Auto-Increment Write
+.burst_uart,        // Decoded Burst Read
 .decode_err_uart,   // Decode err
 .sm_start_uart,     // Start signal for FSM in backend
 .err_code_uart,     // err code
@@ -207,6 +212,8 @@ frontmux u_frontmux (
 .addr,              // Decoded Address
 .wrdata,            // Decoded Write Data
 .we,                // Decoded Write Enable
+.inc,               // Decoded Auto-Increment Write
+.burst,             // Decoded Burst Read
 .decode_err,        // Decode err
 .err_code,          // err code
 .scanxfer           // Flag bit to tell whether scan is xfering
@@ -239,6 +246,8 @@ backend u_backend(
 .addr,                  // Decoded Address
 .wrdata,                // Decoded Write Data
 .we,                    // Decoded Write Enable
+.inc,                   // Decoded Auto-Increment Write
+.burst,                 // Decoded Burst Read
 .decode_err,            // Decode err
 .err_code,              // err code
 .scanxfer,              // Flag bit to tell whether scan is xfering
@@ -262,6 +271,7 @@ backend u_backend(
 .sm_ahbrd,              // state=AHB_READ
 .sm_readout,            // state=READ_OUT
 .sm_ahberr,             // state=AHB_ERR
+.sm_burst,              // burst read in progress
 
 // interface to scanfront
 .hmsel_scan,            // hmsel to scan master
@@ -26,6 +26,8 @@ import comm_defs_pkg::*;
   input  logic [31:0] addr,           // Decoded Address
   input  logic [31:0] wrdata,         // Decoded Write Data
   input  logic        we,             // Decoded Write Enable
+  input  logic        inc,            // Decoded Auto-Increment Write
+  input  logic        burst,          // Decoded Burst Read (count in wrdata)
   input  logic        decode_err,     // Decode err
   input  logic [15:0] err_code,       // err code
   input  logic        scanxfer,       // Flag bit to tell whether scan is xfering
@@ -53,7 +55,8 @@ import comm_defs_pkg::*;
   output logic        sm_decerr,      // state=DECODE_ERR
   output logic        sm_ahbrd,       // state=AHB_READ
   output logic        sm_readout,     // state=READ_OUT
-  output logic        sm_ahberr       // state=AHB_ERR
+  output logic        sm_ahberr,      // state=AHB_ERR
+  output logic        sm_burst        // burst read in progress
 );
 
 //---------------------------------------------------------------------------------
@@ -64,7 +67,10 @@ import comm_defs_pkg::*;
 // IRQ                  (IDLE=>IRQ=>DONE)
 // AHB Write Transaction(IDLE=>AHB_ADDR=>AHB_WRITE=>DONE)
 // AHB Read Transaction (IDLE=>AHB_ADDR=>AHB_READ=>READ_OUT=>DONE)
+// AHB Burst Read       (IDLE=>AHB_ADDR=>AHB_READ=>READ_OUT=>AHB_ADDR=>...=>DONE)
 // AHB Transaction err  (IDLE=>AHB_ADDR=>AHB_READ/AHB_WRITE=>AHB_ERR=>DONE)
+// Auto-increment writes (I) are AHB Write Transactions to the address after
+// the last AHB transfer, so they have no address and never select HMSEL/IRQ.
 //---------------------------------------------------------------------------------
 
 /////////////////////////////////////
@@ -73,13 +79,13 @@ import comm_defs_pkg::*;
 // Control signals for state machine
 logic rd_done, wr_done, readout_done, irq_done;
 logic hmsel_done, decerr_done, ahberr_done, irq_o_done;
-logic bus_err, c_decode_err;
+logic bus_err, c_decode_err, burst_more;
 logic c_hmsel_update, c_ahb_xfer, c_irq;
 
 always_comb begin
 c_decode_err   = (sm_start&&decode_err);
-c_hmsel_update = (sm_start&&(!decode_err)&&(addr==32'h10000000));
-c_irq          = (sm_start&&(!decode_err)&&(addr==32'h10000004));
+c_hmsel_update = (sm_start&&(!decode_err)&&(!inc)&&(addr==32'h10000000));
+c_irq          = (sm_start&&(!decode_err)&&(!inc)&&(addr==32'h10000004));
 c_ahb_xfer     = (sm_start&&(!decode_err)&&(hmsel==2'b00));
 end
 
@@ -113,7 +119,8 @@ AHB_WRITE:
 state_nxt = (bus_err) ? AHB_ERR :
             (wr_done)   ? DONE : AHB_WRITE;
 READ_OUT:
-state_nxt = (readout_done) ? DONE : READ_OUT;
+state_nxt = (!readout_done) ? READ_OUT :
+            (burst_more) ? AHB_ADDR : DONE;
 AHB_ERR:
 state_nxt = (ahberr_done) ? DONE : AHB_ERR;
 DONE:
@@ -254,13 +261,46 @@ always_comb irq_done = (!sm_irq) ? 1'b0 : 1'b1;
 // AHB TRANSACTIONS (WRITE, READ, ERR, READ_OUT)
 ////////////////////////////////////////////////////
 
+//---------------------------------------------------------
+// Transfer Address (auto-increment and burst)
+//---------------------------------------------------------
+// inc_addr is the address after the last AHB transfer, used by I; it
+// also steps past a transfer that got an AHB error, so the I after a
+// failed W or R does not write next to an earlier successful transfer
+// burst_addr/burst_cnt step through a burst read, burst_cnt counts
+// the words left after the current one (a count of 0 reads 1 word)
+logic [31:0] xfer_addr;
+logic [31:0] inc_addr, inc_addr_nxt;
+logic [31:0] burst_addr, burst_addr_nxt;
+logic [31:0] burst_cnt, burst_cnt_nxt;
+logic burst_start, burst_step;
+
+always_comb begin
+burst_start = (state==IDLE)&&c_ahb_xfer&&burst&&(!c_hmsel_update)&&(!c_irq);
+burst_more  = burst&&(burst_cnt!=32'd0);
+burst_step  = sm_readout&&readout_done&&burst_more;
+sm_burst    = burst&&(state!=IDLE);
+xfer_addr   = (inc) ? inc_addr :
+              (burst) ? burst_addr : addr;
+end
+
+always_comb begin
+burst_addr_nxt = (burst_start) ? addr : burst_addr+32'd4;
+burst_cnt_nxt  = (burst_start) ? ((wrdata==32'd0) ? 32'd0 : wrdata-32'd1) : burst_cnt-32'd1;
+inc_addr_nxt   = xfer_addr+32'd4;
+end
+
+`FF(burst_addr_nxt,burst_addr,clk,(burst_start|burst_step),rstn,32'd0);
+`FF(burst_cnt_nxt,burst_cnt,clk,(burst_start|burst_step),rstn,32'd0);
+`FF(inc_addr_nxt,inc_addr,clk,(wr_done|rd_done|bus_err),rstn,32'd0);
+
 //---------------------------------------------------------
 // STATE = AHB_ADDR (AHB Address Phase)
 //---------------------------------------------------------
 // haddr, hsize, hwrite, htrans is set in AHB_ADDR state
 // Currently, 32-bit bus xfer is only supported. (hsize=2'b10)
 always_comb begin
-haddr  = (sm_ahbaddr)  ? addr   : 32'd0;
+haddr  = (sm_ahbaddr)  ? xfer_addr : 32'd0;
 hsize  = (sm_ahbaddr)  ? 2'b10  : 2'b00;
 hwrite = (sm_ahbaddr)  ? we     : 1'b0;
 htrans = (sm_ahbaddr)  ? 3'b010 : 3'b000;
@@ -376,14 +416,14 @@ ahberrbuf_nxt[15:11] = HADDR_STR;                 // HADDR
 ahberrbuf_nxt[16]    = ASCII_EQUAL;               // =
 ahberrbuf_nxt[17]    = ASCII_0;                   // 0
 ahberrbuf_nxt[18]    = ASCII_x;                   // x
-ahberrbuf_nxt[19]    = num_to_ascii(addr[31:28]); // addr_7
-ahberrbuf_nxt[20]    = num_to_ascii(addr[27:24]); // addr_6
-ahberrbuf_nxt[21]    = num_to_ascii(addr[23:20]); // addr_5
-ahberrbuf_nxt[22]    = num_to_ascii(addr[19:16]); // addr_4
-ahberrbuf_nxt[23]    = num_to_ascii(addr[15:12]); // addr_3
-ahberrbuf_nxt[24]    = num_to_ascii(addr[11: 8]); // addr_2
-ahberrbuf_nxt[25]    = num_to_ascii(addr[7 : 4]); // addr_1
-ahberrbuf_nxt[26]    = num_to_ascii(addr[3 : 0]); // addr_0
+ahberrbuf_nxt[19]    = num_to_ascii(xfer_addr[31:28]); // addr_7
+ahberrbuf_nxt[20]    = num_to_ascii(xfer_addr[27:24]); // addr_6
+ahberrbuf_nxt[21]    = num_to_ascii(xfer_addr[23:20]); // addr_5
+ahberrbuf_nxt[22]    = num_to_ascii(xfer_addr[19:16]); // addr_4
+ahberrbuf_nxt[23]    = num_to_ascii(xfer_addr[15:12]); // addr_3
+ahberrbuf_nxt[24]    = num_to_ascii(xfer_addr[11: 8]); // addr_2
+ahberrbuf_nxt[25]    = num_to_ascii(xfer_addr[7 : 4]); // addr_1
+ahberrbuf_nxt[26]    = num_to_ascii(xfer_addr[3 : 0]); // addr_0
 ahberrbuf_nxt[27]    = ASCII_CR;                  // CR
 ahberrbuf_nxt[28]    = ASCII_LF;                  // LF
 end
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+# baud_solver.py - Baud divider design space and baudmux table generator
+#
+# The UART (uart.sv) counts baud_div clocks per tick, and samples each bit
+# every OSR ticks (OSR = 4 in the RTL), so the bit rate is f / (OSR * baud_div).
+# This tool computes the baud error of every clock x target x divider x OSR
+# combination at once with NumPy, picks the 16 dividers that cover the most
+# (clock, target) pairs within tolerance, and writes the baudmux.sv case table
+# and a CSV of the best table entry for each (clock, target).
+#
+# Other OSR values can be compared with --osr, but they need a change to
+# uart.sv: the table is always solved and written for the RTL OSR.
+#
+# A pair is usable if the baud error is within --tol, and the receiver still
+# samples the stop bit inside the bit: over the 9.5 bit periods from the start
+# edge to the stop bit sample, the drift plus one clock of start edge
+# uncertainty must stay below half a bit (the margin column).
+
+from __future__ import print_function
+
+import argparse
+import re
+import sys
+
+import numpy as np
+
+
+CLOCKS = [10, 20, 25, 30, 40, 50, 60, 70, 75, 80, 90, 100]          # MHz
+BAUDS = [9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600,
+         1000000, 1250000, 1500000, 2000000, 2500000, 3000000]
+OSR = 4                   # ticks per bit in uart.sv
+DIV_MIN = 2
+DIV_MAX = 4095            # baud_div is 12 bits
+ENTRIES = 16              # baud_sel is 4 bits
+SAMPLE_BITS = 9.5         # start edge to the middle of the stop bit
+
+
+###############################################################################
+# Design space
+###############################################################################
+
+def baud_error(clocks,bauds,divs,osrs):
+  """
+  Relative baud error for every combination, as an array indexed [clock, baud, div, osr].
+  clocks are in MHz.
+  """
+  f = np.asarray(clocks,float)[:,None,None,None] * 1e6
+  b = np.asarray(bauds,float)[None,:,None,None]
+  d = np.asarray(divs,float)[None,None,:,None]
+  o = np.asarray(osrs,float)[None,None,None,:]
+  return f / (o * d) / b - 1.0
+
+
+def sample_margin(err,divs,osrs):
+  """ Fraction of a bit left at the stop bit sample point (negative: the byte is lost). """
+  d = np.asarray(divs,float)[None,None,:,None]
+  o = np.asarray(osrs,float)[None,None,None,:]
+  return 0.5 - SAMPLE_BITS * np.abs(err) - 1.0 / (o * d)
+
+
+def usable(clocks,bauds,divs,osrs,tol):
+  """ Boolean array [clock, baud, div, osr] of usable combinations, and the error array. """
+  err = baud_error(clocks,bauds,divs,osrs)
+  return (np.abs(err) <= tol) & (sample_margin(err,divs,osrs) > 0), err
+
+
+###############################################################################
+# Table selection
+###############################################################################
+
+def choose_table(clocks,bauds,osr,tol,entries=ENTRIES,div_min=DIV_MIN,div_max=DIV_MAX,weights=None):
+  """
+  Choose up to entries dividers covering the most (clock, baud) pairs, each pair
+  counted with its weight (weights[baud index], default 1).
+  Greedy weighted set cover, then single swaps while they improve the coverage.
+  Ties go to the smaller total error.  Returns (sorted dividers, covered pairs).
+  """
+  divs = np.arange(div_min,div_max + 1)
+  ok, err = usable(clocks,bauds,divs,[osr],tol)
+  ok, err = ok[...,0], np.abs(err[...,0])
+  cover = ok.reshape(-1,len(divs)).T                   # [div, pair]
+  cost = np.where(ok,err,0).reshape(-1,len(divs)).T.sum(axis=1)
+  cand = np.flatnonzero(cover.any(axis=1))
+  cover, cost, cand_divs = cover[cand], cost[cand], divs[cand]
+  w = np.tile(np.ones(len(bauds)) if weights is None else np.asarray(weights,float),len(clocks))
+
+  def score(sel):
+    return (cover[sel].any(axis=0) * w).sum()
+
+  chosen = []
+  covered = np.zeros(cover.shape[1],bool)
+  while len(chosen) < min(entries,len(cand)):
+    gain = ((cover & ~covered) * w).sum(axis=1)
+    gain[chosen] = -1
+    best = np.flatnonzero(gain == gain.max())
+    k = best[np.argmin(cost[best])]
+    if gain[k] <= 0:
+      break
+    chosen.append(k)
+    covered |= cover[k]
+
+  improved = True
+  while improved:
+    improved = False
+    base = score(chosen)
+    for i in range(len(chosen)):
+      rest = chosen[:i] + chosen[i+1:]
+      others = cover[rest].any(axis=0)
+      gains = ((cover | others) * w).sum(axis=1)
+      gains[chosen] = -1
+      k = int(np.argmax(gains))
+      if gains[k] > base + 1e-9:
+        chosen[i] = k
+        improved = True
+        break
+
+  covered = cover[chosen].any(axis=0)
+  return sorted(cand_divs[chosen].tolist(),reverse=True), int(covered.sum())
+
+
+def table_matches(clocks,bauds,divs,osr,tol):
+  """ For each divider and clock, the closest usable baud rate (or None). """
+  ok, err = usable(clocks,bauds,divs,[osr],tol)
+  err = np.where(ok[...,0],np.abs(err[...,0]),np.inf)           # [clock, baud, div]
+  best = np.argmin(err,axis=1)                                  # [clock, div]
+  found = np.isfinite(np.min(err,axis=1))
+  return [[bauds[best[c,d]] if found[c,d] else None for c in range(len(clocks))] for d in range(len(divs))]
+
+
+###############################################################################
+# Output
+###############################################################################
+
+def baud_label(b):
+  if b >= 1000000:
+    return '%.3fM' % (b / 1e6)
+  return '%.1fK' % (b / 1e3)
+
+
+def gen_baudmux(fo,clocks,bauds,divs,osr,tol):
+  """ Write baudmux.sv with the given dividers, in the format of the existing module. """
+  matches = table_matches(clocks,bauds,divs,osr,tol)
+  fo.write('// baudmux.sv - Baud Divider Mux for UART\n')
+  fo.write('// HKL 01 2016\n')
+  fo.write('// Divider table generated by baud_analyze/baud_solver.py (OSR=%d, tolerance %.1f%%)\n' % (osr, 100 * tol))
+  fo.write('\n')
+  fo.write('module baudmux\n')
+  fo.write('import comm_defs_pkg::*;\n')
+  fo.write('(\n')
+  fo.write('  input  logic [3:0] baud_sel, // select for baud dividers\n')
+  fo.write('  output logic [11:0] baud_div // selected baud divider\n')
+  fo.write(');\n')
+  fo.write('\n')
+  fo.write('//---------------------------------------------------------\n')
+  fo.write('// Set Baud Rates\n')
+  fo.write('//|  SEL | DIV |' + ''.join('%4d  |' % c for c in clocks) + '\n')
+  for i, (div, row) in enumerate(zip(divs,matches)):
+    sel = "4'd%d" % i
+    fo.write('//| %-5s|%5d|' % (sel, div) + ''.join('%6s|' % (baud_label(b) if b else '') for b in row) + '\n')
+  fo.write('//---------------------------------------------------------\n')
+  fo.write('always_comb\n')
+  fo.write('case(baud_sel)\n')
+  for i, div in enumerate(divs):
+    fo.write("%-5s: baud_div = 12'd%d;\n" % ("4'd%d" % i, div))
+  fo.write("default: baud_div = 'x;\n")
+  fo.write('endcase\n')
+  fo.write('\n')
+  fo.write('endmodule\n')
+
+
+def gen_csv(fo,clocks,bauds,divs,osr,tol):
+  """
+  One row per clock and baud: the table entry with the smallest error among the
+  usable ones (or overall, if none is usable), its actual baud rate, error and sample margin.
+  """
+  ok, err = usable(clocks,bauds,divs,[osr],tol)
+  margin = sample_margin(err,divs,[osr])[...,0]
+  ok, err = ok[...,0], err[...,0]                               # [clock, baud, div]
+  best = np.where(ok.any(axis=2),np.argmin(np.where(ok,np.abs(err),np.inf),axis=2),np.argmin(np.abs(err),axis=2))
+  fo.write('clock_mhz,baud,baud_sel,div,actual_baud,error_pct,margin_bits,usable\n')
+  for c in range(len(clocks)):
+    for b in range(len(bauds)):
+      d = best[c,b]
+      fo.write('%g,%d,%d,%d,%.1f,%.3f,%.3f,%d\n' % (clocks[c], bauds[b], d, divs[d],
+        clocks[c] * 1e6 / (osr * divs[d]), 100 * err[c,b,d], margin[c,b,d], ok[c,b,d]))
+
+
+def gen_markdown(fo,clocks,divs,osr):
+  """ Baud rate of each entry at each clock, for the README. """
+  fo.write('|Baud Sel|Baud Div|' + ''.join('%d MHz|' % c for c in clocks) + '\n')
+  fo.write('|:---:|:---:|' + ':---:|' * len(clocks) + '\n')
+  for i, div in enumerate(divs):
+    fo.write("|4'd%-2d|%d|" % (i, div) + ''.join('{:,}|'.format(int(round(c * 1e6 / (osr * div)))) for c in clocks) + '\n')
+
+
+def read_baudmux(path):
+  """ Dividers of an existing baudmux.sv, in baud_sel order. """
+  divs = {}
+  with open(path,'r') as fi:
+    for line in fi:
+      m = re.match(r"\s*4'd(\d+)\s*:\s*baud_div\s*=\s*12'd(\d+)",line)
+      if m:
+        divs[int(m.group(1))] = int(m.group(2))
+  return [divs[i] for i in sorted(divs)]
+
+
+###############################################################################
+#
+###############################################################################
+
+def parse_list(text,kind=float):
+  return [kind(x) for x in text.split(',')]
+
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Solve for the baudmux divider table.')
+  parser.add_argument('-c','--clocks', default=CLOCKS, type=parse_list, help='Clock frequencies in MHz (comma separated).')
+  parser.add_argument('-b','--bauds', default=BAUDS, type=lambda x: parse_list(x,int), help='Target baud rates (comma separated).')
+  parser.add_argument('--osr', default=[OSR], type=lambda x: parse_list(x,int), help='Oversampling ratios to compare (comma separated).  Only OSR %d matches uart.sv.' % OSR)
+  parser.add_argument('--tol', default=3.0, type=float, help='Maximum baud error in percent.')
+  parser.add_argument('--entries', default=ENTRIES, type=int, help='Number of table entries.')
+  parser.add_argument('--weight', default='equal', choices=['equal','log'], help='Weight of each baud rate: equal, or growing with log2 of the rate (prefers fast links).')
+  parser.add_argument('--eval', metavar='BAUDMUX_SV', help='Evaluate the dividers of an existing baudmux.sv instead of solving.')
+  parser.add_argument('--sv', help='Write baudmux.sv to this file.')
+  parser.add_argument('--csv', help='Write the best table entry for each clock and baud rate to this file.')
+  parser.add_argument('--md', action='store_true', help='Print a markdown table of the baud rates.')
+  args = parser.parse_args()
+  tol = args.tol / 100
+
+  # Solve for each OSR; the table is for the RTL OSR, the others are for comparison
+  pairs = len(args.clocks) * len(args.bauds)
+  results = {}
+  for osr in sorted(set(args.osr) | set([OSR])):
+    if args.eval:
+      divs = read_baudmux(args.eval)
+      ok, err = usable(args.clocks,args.bauds,divs,[osr],tol)
+      covered = int(ok[...,0].any(axis=2).sum())
+    else:
+      weights = None
+      if args.weight == 'log':
+        weights = 1 + np.log2(np.asarray(args.bauds,float) / min(args.bauds))
+      divs, covered = choose_table(args.clocks,args.bauds,osr,tol,args.entries,weights=weights)
+    note = '' if osr == OSR else ' (requires an RTL change: uart.sv uses OSR %d)' % OSR
+    print('OSR %d: %d of %d clock/baud pairs within %.1f%%, dividers %s%s' % (osr, covered, pairs, args.tol, divs, note))
+    results[osr] = (covered, divs)
+  osr = OSR
+  covered, divs = results[osr]
+
+  matches = table_matches(args.clocks,args.bauds,divs,osr,tol)
+  missing = [b for b in args.bauds if not any(b in row for row in matches)]
+  if missing:
+    print('Baud rates not reachable at any clock: %s' % ', '.join(baud_label(b) for b in missing))
+
+  if args.sv:
+    with open(args.sv,'w') as fo:
+      gen_baudmux(fo,args.clocks,args.bauds,divs,osr,tol)
+  else:
+    gen_baudmux(sys.stdout,args.clocks,args.bauds,divs,osr,tol)
+  if args.csv:
+    with open(args.csv,'w') as fo:
+      gen_csv(fo,args.clocks,args.bauds,divs,osr,tol)
+  if args.md:
+    gen_markdown(sys.stdout,args.clocks,divs,osr)
+
+
+if __name__ == "__main__":
+  main()
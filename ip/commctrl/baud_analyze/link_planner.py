@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+# link_planner.py - COMMCTRL transfer time planner
+#
+# Estimates how long a job (writes, reads and image loads) takes on the
+# COMMCTRL link at every baudmux setting for a given clock, and recommends the
+# fastest setting the host can match reliably.  The baud error model is the
+# one used by baud_solver.py.
+#
+# Link model (8N2, 11 bits per byte, full duplex, instructions pipelined):
+#
+#   write  25 bytes to the chip, 25 bytes of echo back
+#   read   14 bytes to the chip, 14 bytes of echo + 20 bytes of HRDATA back
+#   inc    14 bytes to the chip, 14 bytes of echo back (write_block after the first word)
+#   burst  25 bytes to the chip, 25 bytes of echo + 20 bytes of HRDATA per word back
+#
+# Both directions run concurrently, so a job takes the time of the busier
+# direction.  Without pipelining, every instruction also waits for its echo
+# and response before the next is sent.  Settings the host cannot match
+# reliably are not timed.
+
+from __future__ import print_function
+
+import argparse
+import os
+
+import numpy as np
+
+from baud_solver import BAUDS, OSR, usable, sample_margin, read_baudmux
+
+
+BITS_PER_BYTE = 11
+WRITE_TX, WRITE_RX = 25, 25
+READ_TX, READ_RX = 14, 34
+INC_TX, INC_RX = 14, 14
+BURST_TX, BURST_RX, BURST_WORD_RX = 25, 25, 20
+BURST_WORDS = 256         # words per burst read in read_block
+
+BAUDMUX = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','baudmux.sv')
+
+
+###############################################################################
+# Job
+###############################################################################
+
+def read_job(path,block=False):
+  """
+  Read a job description: one item per line, '#' starts a comment.
+    write N         N single word writes
+    read N          N single word reads
+    image SIZE|FILE load an image of SIZE bytes (or the size of FILE)
+    verify SIZE|FILE read back an image
+  Images are loaded and verified with single word writes and reads, or with
+  write_block/read_block if block is set.
+  Returns (writes, reads, block_writes, block_reads), the last two being lists of block sizes in words.
+  """
+  writes = reads = 0
+  block_writes, block_reads = [], []
+  with open(path,'r') as fi:
+    for n, line in enumerate(fi):
+      f = line.split('#')[0].split()
+      if not f:
+        continue
+      assert len(f) == 2, 'Expected "<kind> <count>" at line %d of %s' % (n+1, path)
+      kind, arg = f[0].lower(), f[1]
+      if kind in ['image','verify']:
+        words = (image_bytes(arg) + 3) // 4
+        if block:
+          (block_writes if kind == 'image' else block_reads).append(words)
+        elif kind == 'image':
+          writes += words
+        else:
+          reads += words
+      elif kind == 'write':
+        writes += int(arg,0)
+      elif kind == 'read':
+        reads += int(arg,0)
+      else:
+        raise ValueError('Unknown job item "%s" at line %d of %s' % (kind, n+1, path))
+  return writes, reads, block_writes, block_reads
+
+
+def image_bytes(arg):
+  """ Size in bytes from a number (with optional K/M suffix) or a file name. """
+  if os.path.exists(arg):
+    return os.path.getsize(arg)
+  scale = {'K': 1024, 'M': 1024 * 1024}.get(arg[-1].upper(),1)
+  return int(arg[:-1] if scale != 1 else arg,0) * scale
+
+
+###############################################################################
+# Plan
+###############################################################################
+
+def link_bytes(writes,reads,block_writes=(),block_reads=(),burst=BURST_WORDS):
+  """
+  Bytes to and from the chip for single word writes and reads, and for
+  write_block/read_block calls of the given sizes in words.  Returns (tx, rx).
+  """
+  tx = writes * WRITE_TX + reads * READ_TX
+  rx = writes * WRITE_RX + reads * READ_RX
+  for n in block_writes:
+    if n:
+      tx += WRITE_TX + (n - 1) * INC_TX
+      rx += WRITE_RX + (n - 1) * INC_RX
+  for n in block_reads:
+    bursts = (n + burst - 1) // burst
+    tx += bursts * BURST_TX
+    rx += bursts * BURST_RX + n * BURST_WORD_RX
+  return tx, rx
+
+
+def plan(clock,divs,writes,reads,bauds=BAUDS,osr=OSR,tol=0.03,max_baud=None,pipelined=True,block_writes=(),block_reads=()):
+  """
+  Transfer time of the job at each divider.  Returns a list of dicts, in baud_sel order.
+  The host baud rate is the closest rate in bauds; a setting is reliable if the
+  chip rate is within tol of it with a positive sample margin.  Unreliable
+  settings have no time, since the host has no rate that works with them.
+  """
+  divs = np.asarray(divs)
+  ok, err = usable([clock],bauds,divs,[osr],tol)
+  ok, err = ok[0,:,:,0], err[0,:,:,0]                           # [baud, div]
+  margin = sample_margin(err[None,:,:,None],divs,[osr])[0,:,:,0]
+  best = np.argmin(np.abs(err),axis=0)                          # closest host rate per div
+  tx, rx = link_bytes(writes,reads,block_writes,block_reads)
+  words = writes + reads + sum(block_writes) + sum(block_reads)
+  rows = []
+  for i, div in enumerate(divs):
+    b = best[i]
+    host = bauds[b]
+    byte_rate = host / float(BITS_PER_BYTE)
+    reliable = bool(ok[b,i]) and (max_baud is None or host <= max_baud)
+    if not reliable:
+      t = None
+    elif pipelined:
+      t = max(tx,rx) / byte_rate
+    else:
+      t = (tx + rx) / byte_rate             # each instruction waits for its echo and response
+    rows.append({
+      'sel': i,
+      'div': int(div),
+      'chip_baud': clock * 1e6 / (osr * div),
+      'host_baud': host,
+      'error': err[b,i],
+      'margin': margin[b,i],
+      'reliable': reliable,
+      'link_bytes': max(tx,rx),
+      'byte_rate': byte_rate,
+      'payload_rate': 4 * words / t if t else None,
+      'time': t,
+    })
+  return rows
+
+
+def recommend(rows):
+  """ The fastest reliable setting, or None. """
+  reliable = [x for x in rows if x['reliable']]
+  return min(reliable,key=lambda x: (x['time'], x['sel'])) if reliable else None
+
+
+def format_time(t):
+  if t is None:
+    return '-'
+  if t >= 3600:
+    return '%.1f h' % (t / 3600)
+  if t >= 60:
+    return '%.1f min' % (t / 60)
+  return '%.2f s' % t
+
+
+###############################################################################
+#
+###############################################################################
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Estimate COMMCTRL transfer time for a job at every baud setting.')
+  parser.add_argument('-c','--clock', required=True, type=float, help='Clock frequency in MHz.')
+  parser.add_argument('-w','--writes', default=0, type=lambda x: int(x,0), help='Number of single word writes.')
+  parser.add_argument('-r','--reads', default=0, type=lambda x: int(x,0), help='Number of single word reads.')
+  parser.add_argument('-i','--image', action='append', default=[], help='Image to load: size in bytes (K/M suffix) or file (repeatable).')
+  parser.add_argument('--verify', action='store_true', help='Read back every image after loading.')
+  parser.add_argument('-j','--job', help='Job description file (write/read/image/verify lines).')
+  parser.add_argument('--baudmux', default=BAUDMUX, help='baudmux.sv to take the dividers from.')
+  parser.add_argument('--tol', default=3.0, type=float, help='Maximum baud error in percent.')
+  parser.add_argument('--max-baud', type=int, help='Fastest baud rate the host adapter supports.')
+  parser.add_argument('--block', action='store_true', help='Load and verify images with write_block/read_block (I and B instructions).')
+  parser.add_argument('--no-pipeline', action='store_true', help='Host waits for each response before sending the next instruction.')
+  args = parser.parse_args()
+
+  writes, reads = args.writes, args.reads
+  block_writes, block_reads = [], []
+  for arg in args.image:
+    words = (image_bytes(arg) + 3) // 4
+    if args.block:
+      block_writes.append(words)
+      if args.verify:
+        block_reads.append(words)
+    else:
+      writes += words
+      if args.verify:
+        reads += words
+  if args.job:
+    w, r, bw, br = read_job(args.job,args.block)
+    writes, reads = writes + w, reads + r
+    block_writes += bw
+    block_reads += br
+
+  rows = plan(args.clock,read_baudmux(args.baudmux),writes,reads,tol=args.tol / 100,max_baud=args.max_baud,
+              pipelined=not args.no_pipeline,block_writes=block_writes,block_reads=block_reads)
+  words = writes + reads + sum(block_writes) + sum(block_reads)
+  print('Job: %d writes, %d reads, %d block words (%d payload bytes) at %g MHz' % (writes, reads,
+    sum(block_writes) + sum(block_reads), 4 * words, args.clock))
+  print('|Sel|Div|Chip baud|Host baud|Error|Margin|Reliable|Link bytes/s|Payload bytes/s|Time|')
+  print('|:---:|:---:|---:|---:|---:|---:|:---:|---:|---:|---:|')
+  for x in rows:
+    payload = '-' if x['payload_rate'] is None else '%.0f' % x['payload_rate']
+    print("|4'd%d|%d|%.0f|%d|%+.2f%%|%.2f|%s|%.0f|%s|%s|" % (x['sel'], x['div'], x['chip_baud'], x['host_baud'],
+      100 * x['error'], x['margin'], 'yes' if x['reliable'] else 'no', x['byte_rate'], payload, format_time(x['time'])))
+  best = recommend(rows)
+  if best is None:
+    print('No reliable setting at %g MHz' % args.clock)
+  else:
+    print("Recommended: baud_sel=4'd%d (div %d), host baud %d, %s" % (best['sel'], best['div'], best['host_baud'], format_time(best['time'])))
+
+
+if __name__ == "__main__":
+  main()
@@ -37,6 +37,9 @@ localparam ASCII_W = 8'h57;
 localparam ASCII_w = 8'h77;
 localparam ASCII_R = 8'h52;
 localparam ASCII_r = 8'h72;
+localparam ASCII_I = 8'h49;
+localparam ASCII_i = 8'h69;
+localparam ASCII_b = 8'h62;
 localparam ASCII_SPACE = 8'h20;
 localparam ASCII_EQUAL = 8'h3D;
 localparam ASCII_COLON = 8'h3A;
@@ -17,6 +17,8 @@ import comm_defs_pkg::*;
   output logic [31:0]  addr_uart,       // Decoded Address
   output logic [31:0]  wrdata_uart,     // Decoded Write Data
   output logic         we_uart,         // Decoded Write Enable
+  output logic         inc_uart,        // Decoded Auto-Increment Write
+  output logic         burst_uart,      // Decoded Burst Read
   output logic         decode_err_uart, // Decode err
   output logic         sm_start_uart,   // Start signal for FSM in backend
   output logic [15:0]  err_code_uart    // err code
@@ -30,11 +32,19 @@ import comm_defs_pkg::*;
 // 2. READ
 // | 0 |1|2| 3 |4 - 11|12|13|
 // |R/r| |0|X/x|RDADDR|CR|LF|
+// 3. AUTO-INCREMENT WRITE (to the address after the last AHB transfer)
+// | 0 |1|2| 3 |4 - 11|12|13|
+// |I/i| |0|X/x|WRDATA|CR|LF|
+// 4. BURST READ (COUNT words from RDADDR, 0 reads 1 word)
+// | 0 |1|2| 3 |4 - 11|12|13|14|15- 22|23|24|
+// |B/b| |0|X/x|RDADDR|  | 0| x|COUNT |CR|LF|
 //---------------------------------------------------------
 // Decode Address, Data, Write Enable, err
 logic [31:0] addr, addr_nxt;
 logic [31:0] wrdata, wrdata_nxt;
 logic        we, we_nxt;
+logic        inc, inc_nxt;
+logic        burst, burst_nxt;
 logic        decode_done;
 logic        decode_err, decode_err_nxt;
 logic [15:0] err_code, err_code_nxt;
@@ -53,11 +63,21 @@ always_comb crlf_err =
     !((ibuf_dec[ibuf_cnt_dec-2]==ASCII_LF)||
      ({ibuf_dec[ibuf_cnt_dec-2],ibuf_dec[ibuf_cnt_dec-1]}=={ASCII_CR,ASCII_LF}));
 
-// W/w or R/r
+// W/w, R/r, I/i or B/b
+logic is_w, is_r, is_i, is_b;
+always_comb begin
+is_w = ((ibuf_dec[0]==ASCII_W)||(ibuf_dec[0]==ASCII_w));
+is_r = ((ibuf_dec[0]==ASCII_R)||(ibuf_dec[0]==ASCII_r));
+is_i = ((ibuf_dec[0]==ASCII_I)||(ibuf_dec[0]==ASCII_i));
+is_b = ((ibuf_dec[0]==ASCII_B)||(ibuf_dec[0]==ASCII_b));
+end
+
 logic rw_err;
-always_comb rw_err =
-    !((ibuf_dec[0]==ASCII_W)||(ibuf_dec[0]==ASCII_w)||
-     (ibuf_dec[0]==ASCII_R)||(ibuf_dec[0]==ASCII_r));
+always_comb rw_err = !(is_w||is_r||is_i||is_b);
+
+// Long format (W, B) has a second field, short format (R, I) has one
+logic long_fmt;
+always_comb long_fmt = (is_w||is_b);
 
 // Separator ( 0x)
 logic sep_err0;
@@ -117,18 +137,22 @@ wrdata_err_0 = ascii_to_num_err(ibuf_dec[22]);
 end
 
 // Next values after decoded
-// Write Enable
-always_comb we_nxt = ((ibuf_dec[0]==ASCII_W)||(ibuf_dec[0]==ASCII_w));
+// Write Enable, Auto-Increment, Burst
+always_comb we_nxt    = (is_w||is_i);
+always_comb inc_nxt   = is_i;
+always_comb burst_nxt = is_b;
 
 // Address
 always_comb addr_nxt = {addr_7,addr_6,addr_5,addr_4,addr_3,addr_2,addr_1,addr_0};
 
-// Wrdata
-always_comb wrdata_nxt = {wrdata_7,wrdata_6,wrdata_5,wrdata_4,wrdata_3,wrdata_2,wrdata_1,wrdata_0};
+// Wrdata (the first field for I, the burst count for B)
+always_comb wrdata_nxt = (is_i) ?
+    {addr_7,addr_6,addr_5,addr_4,addr_3,addr_2,addr_1,addr_0} :
+    {wrdata_7,wrdata_6,wrdata_5,wrdata_4,wrdata_3,wrdata_2,wrdata_1,wrdata_0};
 
 // Decode err
 always_comb begin
-if (we_nxt) begin // Write Decode err
+if (long_fmt) begin // Write/Burst Decode err
 decode_err_nxt =
     crlf_err    |rw_err      |sep_err0    |sep_err1    |
     addr_err_7  |addr_err_6  |addr_err_5  |addr_err_4  |
@@ -136,7 +160,7 @@ decode_err_nxt =
     wrdata_err_7|wrdata_err_6|wrdata_err_5|wrdata_err_4|
     wrdata_err_3|wrdata_err_2|wrdata_err_1|wrdata_err_0;
 end
-else begin // Read Decode err
+else begin // Read/Increment Decode err
 decode_err_nxt =
     crlf_err  |rw_err    |sep_err0  |
     addr_err_7|addr_err_6|addr_err_5|addr_err_4|
@@ -145,11 +169,12 @@ end
 end
 
 // err Code
+// For I, codes 30-37 refer to the write data digits
 always_comb begin
-if(we_nxt) begin // Write Decode err Code
+if(long_fmt) begin // Write/Burst Decode err Code
 err_code_nxt =
     (wr_size_err)  ? {ASCII_0,ASCII_1} : // CODE 10 : Write Instruction Size err
-    (rw_err)       ? {ASCII_1,ASCII_1} : // CODE 12 : W/w err
+    (rw_err)       ? {ASCII_1,ASCII_1} : // CODE 11 : W/w/B/b err
     (sep_err0)     ? {ASCII_0,ASCII_2} : // CODE 20 : First (Space)0x err
     (sep_err1)     ? {ASCII_1,ASCII_2} : // CODE 21 : Second (Space)0x err
     (crlf_err)     ? {ASCII_2,ASCII_2} : // CODE 22 : Line Break err
@@ -171,10 +196,10 @@ err_code_nxt =
     (wrdata_err_7) ? {ASCII_7,ASCII_4} : // CODE 47 : Wrdata_7 NaN err
                      {ASCII_0,ASCII_0};  // No err
 end
-else begin  // Read Decode err Code
+else begin  // Read/Increment Decode err Code
 err_code_nxt =
     (rd_size_err)  ? {ASCII_0,ASCII_1} : // CODE 10 : Write Instruction Size err
-    (rw_err)       ? {ASCII_1,ASCII_1} : // CODE 11 : R/r err
+    (rw_err)       ? {ASCII_1,ASCII_1} : // CODE 11 : R/r/I/i err
     (sep_err0)     ? {ASCII_0,ASCII_2} : // CODE 20 : First (Space)0x err
     (crlf_err)     ? {ASCII_2,ASCII_2} : // CODE 22 : Line Break err
     (addr_err_0)   ? {ASCII_0,ASCII_3} : // CODE 30 : Address_0 NaN err
@@ -194,6 +219,8 @@ end
 `FF(addr_nxt,addr,clk,decode_done,rstn,32'd0);
 `FF(wrdata_nxt,wrdata,clk,decode_done,rstn,32'd0);
 `FF(we_nxt,we,clk,decode_done,rstn,1'b0);
+`FF(inc_nxt,inc,clk,decode_done,rstn,1'b0);
+`FF(burst_nxt,burst,clk,decode_done,rstn,1'b0);
 `FF(decode_err_nxt,decode_err,clk,decode_done,rstn,1'b0);
 `FF(err_code_nxt,err_code,clk,decode_done,rstn,22'd0);
 
@@ -213,6 +240,8 @@ always_comb begin
 addr_uart       = addr;
 wrdata_uart     = wrdata;
 we_uart         = we;
+inc_uart        = inc;
+burst_uart      = burst;
 sm_start_uart   = sm_start;
 decode_err_uart = decode_err;
 err_code_uart   = err_code;
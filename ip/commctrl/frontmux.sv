@@ -11,6 +11,8 @@ import comm_defs_pkg::*;
   input logic [31:0]  addr_uart,         // Decoded Address
   input logic [31:0]  wrdata_uart,       // Decoded Write Data
   input logic         we_uart,           // Decoded Write Enable
+  input logic         inc_uart,          // Decoded Auto-Increment Write
+  input logic         burst_uart,        // Decoded Burst Read
   input logic         decode_err_uart,   // Decode err
   input logic         sm_start_uart,     // Start signal for FSM in backend
   input logic [15:0]  err_code_uart,     // err code
@@ -27,6 +29,8 @@ import comm_defs_pkg::*;
   output logic [31:0] addr,              // Decoded Address
   output logic [31:0] wrdata,            // Decoded Write Data
   output logic        we,                // Decoded Write Enable
+  output logic        inc,               // Decoded Auto-Increment Write
+  output logic        burst,             // Decoded Burst Read
   output logic        decode_err,        // Decode err
   output logic [15:0] err_code,          // err code
   output logic        scanxfer           // Flag bit to tell whether scan is xfering
@@ -39,6 +43,8 @@ sm_start     = (fesel) ? sm_start_scan     : sm_start_uart;
 addr         = (fesel) ? addr_scan         : addr_uart;
 wrdata       = (fesel) ? wrdata_scan       : wrdata_uart;
 we           = (fesel) ? we_scan           : we_uart;
+inc          = (fesel) ? 1'b0              : inc_uart;
+burst        = (fesel) ? 1'b0              : burst_uart;
 decode_err   = (fesel) ? 1'b0              : decode_err_uart;
 err_code     = (fesel) ? {ASCII_0,ASCII_0} : err_code_uart;
 scanxfer     = (fesel) ? scanxfer_scan     : 1'b0;
@@ -38,7 +38,8 @@ import comm_defs_pkg::*;
   input  logic       sm_decerr,       // state=DECODE_ERR
   input  logic       sm_ahbrd,        // state=AHB_READ
   input  logic       sm_readout,      // state=READ_OUT
-  input  logic       sm_ahberr        // state=AHB_ERR
+  input  logic       sm_ahberr,       // state=AHB_ERR
+  input  logic       sm_burst         // burst read in progress
 );
 
 //---------------------------------------------------------
@@ -203,7 +204,8 @@ always_comb tx_byte_nxt =
 //---------------------------------------------------------
 // Handshake (rts)
 //---------------------------------------------------------
+// held for a whole burst read, so no instruction arrives between its words
 always_comb rts = (sm_hmsel||sm_decerr||sm_ahbrd||
-                   sm_readout||sm_ahberr||echobuf_flush);
+                   sm_readout||sm_ahberr||sm_burst||echobuf_flush);
 
 endmodule
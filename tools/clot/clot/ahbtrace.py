@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+
+# ahbtrace.py - Streaming AHB transaction analyzer for simulation dumps
+#
+# Reads a VCD dump (plain or gzipped) of one AHB interface, e.g. MOUT of
+# AHB_MASTER_MUX, the master port of AHB_BUS or one of its slave ports, and
+# rebuilds the AHB-Lite transfers from HTRANS, HADDR, HWRITE, HSIZE, HREADY and
+# HRESP sampled on the rising edges of HCLK.  Values that change at the time of
+# an edge are taken to change after it, as with non-blocking assignments.
+#
+# A transfer is issued in the first cycle its address phase is driven (HTRANS
+# NONSEQ or SEQ, and HSEL on a slave port), accepted at the first edge after
+# that with HREADY high, and completes at the next edge with HREADY high.  For
+# each transfer:
+#
+#   wait     cycles the address phase is held by the previous data phase
+#   stall    wait states of its own data phase (HREADY low)
+#   latency  cycles from issue to completion, 1 for a zero wait state transfer
+#
+# Transfers are attributed to a master from HMASTER (AHB_MASTER_MUX) or HMSEL
+# in the address phase, and to a slave region by looking HADDR up in the VGEN
+# memory map (the generated Python module or the memmap CSV).  Only the
+# current value of the selected signals and one open transfer are kept, and
+# statistics are accumulated into fixed size histograms, so dumps of any size
+# are analyzed in constant memory.
+
+import argparse
+import bisect
+import collections
+import csv
+import gzip
+import importlib.util
+import re
+import sys
+import time
+
+from clot.model import parse_num
+from clot.trace import Histogram, format_time
+
+
+HTRANS_NONSEQ = 2          # HTRANS[1] set: NONSEQ or SEQ
+CHUNK = 1 << 20            # characters of dump per read
+
+# Signals of the bus interface (True: required)
+BUS_SIGNALS = collections.OrderedDict([
+  ('HTRANS', True), ('HADDR', True), ('HREADY', True),
+  ('HWRITE', False), ('HSIZE', False), ('HRESP', False), ('HSEL', False),
+])
+MASTER_SIGNALS = ('HMASTER', 'HMSEL')
+
+_TIMESCALE_RE = re.compile(r'(\d+)\s*([munpf]?s)')
+_UNITS = {'s': 1.0, 'ms': 1e-3, 'us': 1e-6, 'ns': 1e-9, 'ps': 1e-12, 'fs': 1e-15}
+
+
+###############################################################################
+# VCD reader
+###############################################################################
+
+def open_dump(path):
+  if path == '-':
+    return sys.stdin
+  if path.endswith('.gz'):
+    return gzip.open(path,'rt',encoding='latin-1')
+  return open(path,'r',encoding='latin-1')
+
+
+class VcdReader(object):
+  """
+  Streaming VCD reader.  The header is read on construction: vars maps the
+  hierarchical name of every signal (without its bit range) to (id code, width).
+  samples() then streams the value changes and yields the selected signals at
+  each rising edge of a clock.
+  """
+
+  def __init__(self,fi):
+    self.fi = fi
+    self.vars = collections.OrderedDict()
+    self.timescale = 1e-9
+    self._header()
+
+  def _tokens(self):
+    for line in self.fi:
+      for tok in line.split():
+        yield tok
+
+  def _header(self):
+    scope = []
+    toks = self._tokens()
+    for tok in toks:
+      if tok == '$scope':
+        next(toks)                                # module, interface, begin...
+        scope.append(next(toks))
+      elif tok == '$upscope':
+        scope.pop()
+      elif tok == '$var':
+        body = self._until_end(toks)
+        width, code, name = int(body[1]), body[2], body[3]
+        self.vars.setdefault('.'.join(scope + [name.split('[')[0]]),(code, width))
+        continue
+      elif tok == '$timescale':
+        m = _TIMESCALE_RE.match(''.join(self._until_end(toks)))
+        assert m, 'Unknown timescale'
+        self.timescale = int(m.group(1)) * _UNITS[m.group(2)]
+        continue
+      elif tok == '$enddefinitions':
+        self._until_end(toks)
+        return
+      elif tok.startswith('$') and tok != '$end':
+        self._until_end(toks)                     # $date, $version, $comment
+        continue
+    raise AssertionError('No $enddefinitions in the VCD header')
+
+  @staticmethod
+  def _until_end(toks):
+    body = []
+    for tok in toks:
+      if tok == '$end':
+        return body
+      body.append(tok)
+    return body
+
+  def find(self,name,scopes=('',)):
+    """
+    Full name of the signal name, looked up in each of scopes in turn (name may
+    also be a full name, or a suffix of one).  None if it is not in the dump.
+    """
+    for scope in scopes:
+      full = scope + '.' + name if scope else name
+      if full in self.vars:
+        return full
+    matches = [x for x in self.vars if x.endswith('.' + name)]
+    return matches[0] if len(matches) == 1 else None
+
+  def scopes(self,signals):
+    """ Scopes holding all of signals. """
+    found = collections.defaultdict(set)
+    for full in self.vars:
+      scope, _, name = full.rpartition('.')
+      if name in signals:
+        found[scope].add(name)
+    return [s for s in found if found[s] >= set(signals)]
+
+  def samples(self,clock,signals,chunk=CHUNK):
+    """
+    Yield (time, values) at each rising edge of clock, with values the list of
+    the binary strings of signals (None for signals never set) just before the edge.
+
+    The dump is read a chunk at a time and scanned with a regular expression
+    matching only the time steps and the changes of the selected id codes, so
+    the changes of the other signals cost no Python code.
+    """
+    clk_code = self.vars[clock][0]
+    index = collections.defaultdict(list)
+    for i, name in enumerate(signals):
+      index[self.vars[name][0]].append(i)
+    index[clk_code]
+    index = dict(index)
+    codes = '|'.join(re.escape(x) for x in sorted(index,key=len,reverse=True))
+    change = re.compile(r'^(?:#(\d+)|(?:[bB]([01xzXZ]+) |([01xzXZ]))(%s))[ \t\r]*$' % codes,re.M)
+    values = [None] * len(signals)
+    clk, t, pending, rose = None, 0, [], False
+    rest = ''
+    while True:
+      data = self.fi.read(chunk)
+      buf = rest + data
+      if data:
+        n = buf.rfind('\n') + 1
+        buf, rest = buf[:n], buf[n:]
+      for step, vec, bit, code in change.findall(buf):
+        if step:
+          if rose:
+            yield t, values
+          for i, v in pending:
+            values[i] = v
+          pending, rose = [], False
+          t = int(step)
+          continue
+        v = vec or bit
+        if code == clk_code:
+          rose = rose or (clk == '0' and v == '1')
+          clk = v
+        for i in index[code]:
+          pending.append((i, v))
+      if not data:
+        break
+    if rose:
+      yield t, values
+
+
+def to_int(v):
+  """ Integer value of a binary string, None if unknown (x/z). """
+  try:
+    return int(v,2)
+  except (TypeError, ValueError):
+    return None
+
+
+###############################################################################
+# Memory map
+###############################################################################
+
+def read_memmap(path):
+  """
+  (base, end, name, port) regions sorted by base, from the Python module generated
+  by vgen_memmap.py (REGIONS) or from the memory map CSV.
+  """
+  if path.endswith('.py'):
+    spec = importlib.util.spec_from_file_location('_memmap',path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return sorted(mod.REGIONS)
+  regions = []
+  with open(path) as fi:
+    rows = [l for l in fi if l.strip() and not l.startswith('#')]
+  for row in csv.DictReader(rows):
+    base, size = parse_num(row['base']), parse_num(row['size'])
+    port = row.get('port','').strip()
+    regions.append((base, base + size - 1, row['name'].upper(), int(port) if port else -1))
+  return sorted(regions)
+
+
+class RegionMap(object):
+  """ Name of the slave region decoding an address: DEFAULT outside the map, 256MB blocks without one. """
+
+  DEFAULT = 'DEFAULT'
+
+  def __init__(self,regions=None):
+    self.regions = regions
+    self.bases = [r[0] for r in regions] if regions else None
+
+  def find(self,addr):
+    if self.regions is None:
+      return '0x%08X' % (addr & 0xF0000000)
+    i = bisect.bisect_right(self.bases,addr) - 1
+    if i >= 0 and addr <= self.regions[i][1]:
+      return self.regions[i][2]
+    return self.DEFAULT
+
+
+###############################################################################
+# Analyzer
+###############################################################################
+
+class BusStats(object):
+  """ Transfer statistics of one master or slave region. """
+
+  def __init__(self):
+    self.reads = 0
+    self.writes = 0
+    self.bytes = 0
+    self.errors = 0
+    self.wait = 0
+    self.stall = 0
+    self.busy = 0                                 # data phase cycles
+    self.latency = Histogram(lo=1,octaves=16,per_octave=1)
+
+  def add(self,nbytes,write,wait,stall,error):
+    if write:
+      self.writes += 1
+    else:
+      self.reads += 1
+    self.bytes += nbytes
+    self.errors += error
+    self.wait += wait
+    self.stall += stall
+    self.busy += stall + 1
+    self.latency.add(wait + stall + 1)
+
+  def transfers(self):
+    return self.reads + self.writes
+
+
+class AhbAnalyzer(object):
+  """
+  Rebuilds AHB-Lite transfers from per-cycle samples of one bus interface and
+  accumulates BusStats per master, per region and in total.
+  """
+
+  def __init__(self,regions=None,masters=None,on_txn=None):
+    self.regions = RegionMap(regions)
+    self.masters = masters or []
+    self.on_txn = on_txn
+    self.total = BusStats()
+    self.by_master = collections.defaultdict(BusStats)
+    self.by_region = collections.defaultdict(BusStats)
+    self.cycles = 0
+    self.t_first = None
+    self.t_last = None
+    self.unknown = 0                              # cycles with HTRANS or HREADY unknown
+    self._issue = None                            # cycle the open address phase was issued
+    self._dphase = None                           # (issue, accept, master, addr, nbytes, write)
+
+  def master_name(self,m):
+    if m is None:
+      return '-'
+    return self.masters[m] if m < len(self.masters) else 'M%d' % m
+
+  def cycle(self,t,htrans,haddr,hready,hwrite=None,hsize=None,hresp=None,hsel=None,master=None):
+    """ Samples of the cycle ending at the edge at time t (ints, None when unknown or not dumped). """
+    c = self.cycles
+    self.cycles += 1
+    if self.t_first is None:
+      self.t_first = t
+    self.t_last = t
+    if htrans is None or hready is None:
+      self.unknown += 1
+    ready = hready == 1
+
+    # Data phase
+    if self._dphase is not None and ready:
+      self._complete(c,hresp == 1)
+
+    # Address phase
+    if htrans is not None and htrans & HTRANS_NONSEQ and hsel != 0:
+      if self._issue is None:
+        self._issue = c
+      if ready:
+        nbytes = 1 << hsize if hsize is not None else 4
+        self._dphase = (self._issue, c, master, haddr, nbytes, hwrite == 1)
+        self._issue = None
+    else:
+      self._issue = None
+
+  def _complete(self,c,error):
+    issue, accept, master, addr, nbytes, write = self._dphase
+    self._dphase = None
+    wait, stall = accept - issue, c - accept - 1
+    mname = self.master_name(master)
+    region = self.regions.find(addr) if addr is not None else '?'
+    for s in (self.total, self.by_master[mname], self.by_region[region]):
+      s.add(nbytes,write,wait,stall,error)
+    if self.on_txn:
+      self.on_txn(c,mname,region,addr,nbytes,write,wait,stall,error)
+
+  def period(self):
+    """ Clock period in dump time units, from the first and last edges. """
+    if self.cycles < 2:
+      return None
+    return (self.t_last - self.t_first) / float(self.cycles - 1)
+
+
+def bus_signals(vcd,bus=None,clock=None,master=None):
+  """
+  Pick the signals of one bus interface in the dump: (clock, {signal: full name}, master).
+  bus is a scope or the end of one, e.g. u_master_mux.MOUT; without it, the dump must
+  hold a single scope with HTRANS, HADDR and HREADY.
+  """
+  required = [s for s, req in BUS_SIGNALS.items() if req]
+  candidates = vcd.scopes(required)
+  if bus:
+    candidates = [s for s in candidates if s == bus or s.endswith('.' + bus)]
+  assert candidates, 'No bus scope%s with %s in the dump' % (' matching ' + bus if bus else '', ', '.join(required))
+  assert len(candidates) == 1, 'Several bus scopes, choose one with --bus:\n  ' + '\n  '.join(candidates)
+  scope = candidates[0]
+  parents = [scope.rsplit('.',i)[0] for i in range(scope.count('.') + 1)]
+  sigs = collections.OrderedDict()
+  for s in BUS_SIGNALS:
+    if scope + '.' + s in vcd.vars:
+      sigs[s] = scope + '.' + s
+  clock = vcd.find(clock or 'HCLK',parents)
+  assert clock, 'No clock found for %s, specify it with --clock' % scope
+  if master:
+    m = vcd.find(master,parents)
+    assert m, 'Master select %s is not in the dump' % master
+    master = m
+  else:
+    master = next((m for m in (vcd.find(x,parents[1:]) for x in MASTER_SIGNALS) if m),None)
+  return clock, sigs, master
+
+
+def analyze(vcd,ana,clock,sigs,master=None,start=None,end=None):
+  """ Feed the rising edges of clock in [start, end) dump time units to the analyzer. """
+  names = list(sigs.values()) + ([master] if master else [])
+  keys = [s.lower() for s in sigs] + (['master'] if master else [])
+  cycle = ana.cycle
+  last, kw = None, None
+  for t, values in vcd.samples(clock,names):
+    if start is not None and t < start:
+      continue
+    if end is not None and t >= end:
+      break
+    if values != last:                            # idle and stalled cycles repeat the last values
+      last = list(values)
+      kw = dict(zip(keys,map(to_int,values)))
+    cycle(t,**kw)
+  return ana
+
+
+###############################################################################
+# Report
+###############################################################################
+
+def format_rate(b):
+  if b >= 1e9:
+    return '%.2f GB/s' % (b / 1e9)
+  if b >= 1e6:
+    return '%.2f MB/s' % (b / 1e6)
+  return '%.1f kB/s' % (b / 1e3)
+
+
+def report(ana,timescale,fo=sys.stdout,histograms=False):
+  period = ana.period()
+  seconds = period * timescale * ana.cycles if period else 0.0
+  t = ana.total
+  fo.write('%d cycles' % ana.cycles)
+  if period:
+    fo.write(' at %.1f MHz (%s)' % (1e-6 / (period * timescale), format_time(seconds)))
+  fo.write(', %d transfers (%d reads, %d writes), %d bytes\n' % (t.transfers(), t.reads, t.writes, t.bytes))
+  if ana.cycles:
+    fo.write('Utilisation %.1f%% (data phase cycles), %.1f%% transferring, %.3f bytes/cycle' % (
+      100.0 * t.busy / ana.cycles, 100.0 * t.transfers() / ana.cycles, t.bytes / float(ana.cycles)))
+    if seconds:
+      fo.write(', %s' % format_rate(t.bytes / seconds))
+    fo.write('\n')
+  if t.errors:
+    fo.write('AHB errors: %d\n' % t.errors)
+  if ana.unknown:
+    fo.write('Cycles with HTRANS or HREADY unknown: %d\n' % ana.unknown)
+  for title, stats in (('Master', ana.by_master), ('Region', ana.by_region)):
+    if not stats:
+      continue
+    fo.write('%-12s %10s %10s %12s %12s %7s %10s %10s %6s %6s %6s\n' % (title, 'reads', 'writes', 'bytes',
+      'bandwidth', 'busy', 'wait', 'stall', 'lat', 'p99', 'max'))
+    for name, s in sorted(stats.items(), key=lambda x: -x[1].bytes):
+      fo.write('%-12s %10d %10d %12d %12s %6.1f%% %10d %10d %6.2f %6d %6d\n' % (name, s.reads, s.writes, s.bytes,
+        format_rate(s.bytes / seconds) if seconds else '-', 100.0 * s.busy / max(ana.cycles,1), s.wait, s.stall,
+        s.latency.mean(), s.latency.percentile(0.99), s.latency.max))
+  if histograms:
+    for title, stats in (('master', ana.by_master), ('region', ana.by_region)):
+      for name, s in sorted(stats.items()):
+        fo.write('Latency %s %s: n=%d\n' % (title, name, s.latency.n))
+        for lo, hi, n in s.latency.rows():
+          lo = max(lo,1)                          # bins of whole cycles: [lo, hi)
+          fo.write('  %14s %d\n' % ('%d' % lo if hi - lo <= 1 else '%d-%d' % (lo, hi - 1), n))
+
+
+def list_txn(c,master,region,addr,nbytes,write,wait,stall,error,fo=sys.stdout):
+  fo.write('%10d %-8s %-12s %s 0x%08X %d%s%s%s\n' % (c, master, region, 'W' if write else 'R', addr or 0, nbytes,
+    '  wait %d' % wait if wait else '', '  stall %d' % stall if stall else '', '  ! ERROR' if error else ''))
+
+
+###############################################################################
+#
+###############################################################################
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Analyze the AHB transfers of a bus interface in a VCD dump.')
+  parser.add_argument('vcd', help='VCD dump (.vcd or .vcd.gz, - for stdin).')
+  parser.add_argument('--bus', help='Scope of the bus interface, or the end of it, e.g. u_ahb_master_mux.MOUT.')
+  parser.add_argument('--clock', help='Clock signal (default: HCLK in the bus scope or above).')
+  parser.add_argument('--master', help='Master select signal (default: HMASTER or HMSEL above the bus scope).')
+  parser.add_argument('--masters', help='Comma-separated master names, in HMASTER order.')
+  parser.add_argument('-m','--memmap', help='VGEN memory map: generated Python module or memmap CSV.')
+  parser.add_argument('--start', type=int, help='Skip edges before this time, in dump time units.')
+  parser.add_argument('--end', type=int, help='Stop at this time, in dump time units.')
+  parser.add_argument('--scopes', action='store_true', help='List the bus scopes in the dump and exit.')
+  parser.add_argument('-l','--list', action='store_true', help='Print every transfer.')
+  parser.add_argument('--histograms', action='store_true', help='Print the latency histograms.')
+  args = parser.parse_args()
+
+  vcd = VcdReader(open_dump(args.vcd))
+  if args.scopes:
+    for s in vcd.scopes([s for s, req in BUS_SIGNALS.items() if req]):
+      print(s)
+    return
+  clock, sigs, master = bus_signals(vcd,args.bus,args.clock,args.master)
+  print('Bus %s, clock %s, master %s' % (sigs['HTRANS'].rpartition('.')[0], clock, master or '-'))
+  regions = read_memmap(args.memmap) if args.memmap else None
+  masters = args.masters.split(',') if args.masters else None
+  ana = AhbAnalyzer(regions,masters,list_txn if args.list else None)
+  t0 = time.time()
+  analyze(vcd,ana,clock,sigs,master,args.start,args.end)
+  elapsed = time.time() - t0
+  report(ana,vcd.timescale,histograms=args.histograms)
+  print('Analyzed in %.1fs (%.0f cycles/s)' % (elapsed, ana.cycles / max(elapsed,1e-9)))
+
+
+if __name__ == "__main__":
+  main()
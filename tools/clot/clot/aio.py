@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+# aio.py - Asyncio COMMCTRL driver for running many boards from one process
+#
+# Each board has its own serial port and its own AsyncCommctrl, which uses the
+# same Link state machine as the blocking driver (commctrl.py), so pipelining
+# and response matching behave identically.  Ports are plain file descriptors
+# driven by the event loop, so a serial device, a pseudo-terminal served by the
+# model (model.serve_pty) or a socket can stand in for each other.
+#
+# run_boards() runs a job coroutine on every board concurrently, and reports
+# throughput and instruction latency per board.
+
+import argparse
+import array
+import asyncio
+import collections
+import os
+import sys
+import time
+
+from clot.commctrl import Link, Transaction, CommctrlTimeout, LinkError, WINDOW, LENGTHS, POSTED, BURST_WORDS, \
+                          HMSEL_ADDR, IRQ_ADDR
+from clot.image import read_image, word_blocks
+from clot.model import parse_region
+
+
+###############################################################################
+# Ports
+###############################################################################
+
+class AsyncPort(object):
+  """ Non-blocking port over a file descriptor (serial device, pty or socket). """
+
+  def __init__(self,fd,name='',close=True):
+    self.fd = fd
+    self.name = name or 'fd%d' % fd
+    self._close = close
+    os.set_blocking(fd,False)
+
+  async def read(self,size=4096):
+    """ Wait for data and return what is available. """
+    loop = asyncio.get_running_loop()
+    while True:
+      try:
+        return os.read(self.fd,size)
+      except BlockingIOError:
+        pass
+      fut = loop.create_future()
+      loop.add_reader(self.fd,fut.set_result,None)
+      try:
+        await fut
+      finally:
+        loop.remove_reader(self.fd)
+
+  async def write(self,data):
+    """ Write all of data, waiting while the port (or the flow control) holds it back. """
+    loop = asyncio.get_running_loop()
+    view = memoryview(data)
+    while view:
+      try:
+        view = view[os.write(self.fd,view):]
+        continue
+      except BlockingIOError:
+        pass
+      fut = loop.create_future()
+      loop.add_writer(self.fd,fut.set_result,None)
+      try:
+        await fut
+      finally:
+        loop.remove_writer(self.fd)
+
+  def close(self):
+    if self._close:
+      os.close(self.fd)
+
+
+def open_tty(device,baud=115200,rtscts=True):
+  """ Open a serial device (or pty) with the COMMCTRL UART settings: raw, 8N2, optional RTS/CTS. """
+  import termios
+  import tty
+  fd = os.open(device,os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+  tty.setraw(fd)
+  attr = termios.tcgetattr(fd)
+  attr[2] = (attr[2] & ~(termios.PARENB | termios.CSIZE)) | termios.CS8 | termios.CSTOPB | termios.CLOCAL | termios.CREAD
+  if rtscts:
+    attr[2] |= termios.CRTSCTS
+  else:
+    attr[2] &= ~termios.CRTSCTS
+  speed = getattr(termios,'B%d' % baud,None)
+  if speed is not None:
+    attr[4] = attr[5] = speed
+  termios.tcsetattr(fd,termios.TCSANOW,attr)
+  return AsyncPort(fd,device)
+
+
+###############################################################################
+# Driver
+###############################################################################
+
+class AsyncCommctrl(object):
+  """
+  Asyncio COMMCTRL driver with pipelining.  The API mirrors the blocking
+  Commctrl, with coroutines: writes are posted, reads and flush() wait.
+  Instruction latency (submit to completion) is recorded for stats().
+  """
+
+  def __init__(self,port,window=WINDOW,timeout=2.0,name=None):
+    self.port = port
+    self.name = name or port.name
+    self.window = window
+    self.timeout = timeout
+    self.link = Link()
+    self.errors = []
+    self.latency = array.array('d')
+    self.count = collections.Counter()
+    self.words = collections.Counter()     # words transferred by bursts
+    self.t_start = time.time()
+    self.t_rx = self.t_start
+    self.link_error = None
+    self._progress = asyncio.Event()
+    self._reader = asyncio.ensure_future(self._read_loop())
+
+  async def _read_loop(self):
+    while True:
+      try:
+        data = await self.port.read()
+      except OSError as e:                      # a pty reads EIO once the other end is closed
+        data, reason = b'', str(e)
+      else:
+        reason = 'end of file'
+      if not data:
+        self.link_error = LinkError('%s: port closed (%s, %d bytes in flight)' % (self.name, reason, self.link.in_flight()))
+        self._progress.set()
+        return
+      self.t_rx = time.time()
+      for txn in self.link.feed(data):
+        self.latency.append(txn.t_done - txn.t_submit)
+        if txn.error is not None and txn.kind in POSTED:
+          self.errors.append(txn.error)
+      self._progress.set()
+
+  async def _wait_until(self,cond):
+    while not cond():
+      if self.link_error:
+        raise self.link_error
+      self._progress.clear()
+      try:
+        await asyncio.wait_for(self._progress.wait(),self.timeout)
+      except asyncio.TimeoutError:
+        if time.time() - self.t_rx > self.timeout:
+          raise CommctrlTimeout('%s: no response from COMMCTRL (%d bytes in flight)' % (self.name, self.link.in_flight()))
+
+  def _raise_errors(self):
+    if self.errors:
+      error, self.errors = self.errors[0], []
+      raise error
+
+  async def submit(self,kind,addr,data=0):
+    """ Queue an instruction without waiting for it.  Returns the Transaction. """
+    if self.link_error:
+      raise self.link_error
+    txn = Transaction(kind,addr,data)
+    n = LENGTHS[kind]
+    if self.link.in_flight() + n > self.window:
+      await self._wait_until(lambda: self.link.in_flight() + n <= self.window)
+    if not self.link.pending:
+      self.t_rx = time.time()                   # nothing was outstanding, so restart the timeout
+    await self.port.write(self.link.submit(txn))
+    self.count[kind] += 1
+    if kind == 'B':
+      self.words[kind] += txn.words()
+    return txn
+
+  async def wait(self,txn):
+    """ Wait for a transaction to complete and return its result. """
+    await self._wait_until(lambda: txn.done)
+    self._raise_errors()
+    return txn.result()
+
+  async def write32(self,addr,data):
+    """ Posted write of a 32b word. """
+    await self.submit('W',addr,data)
+
+  async def read32(self,addr):
+    """ Read a 32b word. """
+    return await self.wait(await self.submit('R',addr))
+
+  async def write_many(self,pairs):
+    """ Posted writes of a sequence of (addr, data) pairs. """
+    for addr, data in pairs:
+      await self.submit('W',addr,data)
+
+  async def read_many(self,addrs):
+    """ Read a sequence of addresses with all reads pipelined.  Returns a list. """
+    txns = [await self.submit('R',x) for x in addrs]
+    return [await self.wait(x) for x in txns]
+
+  async def write_block(self,addr,words):
+    """ Posted writes of consecutive words from addr: one W, then an auto-increment I for each following word. """
+    for i, data in enumerate(words):
+      await self.submit('I' if i else 'W',addr + 4*i,data)
+
+  async def read_block(self,addr,n,burst=BURST_WORDS):
+    """ Read n consecutive words from addr with burst reads of up to burst words, pipelined.  Returns a list. """
+    end = addr + 4*n
+    assert not (addr <= HMSEL_ADDR < end or addr <= IRQ_ADDR < end), \
+      'Range 0x%08X-0x%08X includes the COMMCTRL registers' % (addr, end)
+    txns = [await self.submit('B',addr + 4*i,min(burst,n - i)) for i in range(0,n,burst)]
+    return [x for txn in txns for x in await self.wait(txn)]
+
+  async def flush(self):
+    """ Wait for every queued instruction, raising any error from a posted write. """
+    if self.link.pending:
+      await self.wait(await self.submit('R',HMSEL_ADDR))
+    self._raise_errors()
+
+  async def close(self):
+    self._reader.cancel()
+    try:
+      await self._reader
+    except asyncio.CancelledError:
+      pass
+    self.port.close()
+
+  def stats(self):
+    """ Link throughput and instruction latency since the driver was created. """
+    elapsed = max(time.time() - self.t_start,1e-9)
+    lat = sorted(self.latency)
+    def pct(p):
+      return lat[min(int(p * len(lat)),len(lat) - 1)] if lat else 0.0
+    writes = self.count['W'] + self.count['I']
+    reads = self.count['R'] + self.words['B']
+    return {
+      'writes': writes,
+      'reads': reads,
+      'tx_bytes': self.link.tx_bytes,
+      'rx_bytes': self.link.rx_bytes,
+      'elapsed': elapsed,
+      'payload_rate': 4 * (writes + reads) / elapsed,
+      'latency_mean': sum(lat) / len(lat) if lat else 0.0,
+      'latency_p50': pct(0.5),
+      'latency_p99': pct(0.99),
+      'latency_max': lat[-1] if lat else 0.0,
+    }
+
+
+###############################################################################
+# Jobs
+###############################################################################
+
+async def register_test(cc,base,count,seed=0):
+  """ Write a pattern to count words from base and read it back.  Returns the number of mismatches. """
+  pattern = [((base + 4*i) * 2654435761 + seed) & 0xFFFFFFFF for i in range(count)]
+  await cc.write_many((base + 4*i, x) for i, x in enumerate(pattern))
+  actual = await cc.read_many(base + 4*i for i in range(count))
+  return sum(1 for x, y in zip(pattern,actual) if x != y)
+
+
+async def load_image(cc,path,fmt=None,base=0,fill=None):
+  """ Stream an image file to the board (see loader.py).  Returns the number of words written. """
+  written = 0
+  for addr, words in word_blocks(read_image(path,fmt,base)):
+    pairs = [(addr + 4*i, w) for i, w in enumerate(words) if w != fill]
+    await cc.write_many(pairs)
+    written += len(pairs)
+  await cc.flush()
+  return written
+
+
+async def readback(cc,base,nbytes,block=1024):
+  """ Read nbytes from base.  Returns an array of words. """
+  words = array.array('I')
+  for addr in range(base,base + nbytes,4 * block):
+    n = min(block,(base + nbytes - addr) // 4)
+    words.extend(await cc.read_many(addr + 4*i for i in range(n)))
+  return words
+
+
+###############################################################################
+# Scheduler
+###############################################################################
+
+async def run_boards(drivers,job):
+  """
+  Run job(cc) on every driver concurrently.
+  Returns a list of (driver, result or exception), in the order of drivers.
+  """
+  results = await asyncio.gather(*[job(cc) for cc in drivers],return_exceptions=True)
+  return list(zip(drivers,results))
+
+
+def report(results,fo=sys.stdout):
+  """ Print the result, throughput and latency of each board. """
+  fo.write('%-24s %-12s %10s %10s %10s %10s\n' % ('Board', 'Result', 'kB/s', 'lat p50', 'lat p99', 'lat max'))
+  total = 0.0
+  for cc, result in results:
+    s = cc.stats()
+    total += s['payload_rate']
+    fo.write('%-24s %-12s %10.1f %8.2fms %8.2fms %8.2fms\n' % (cc.name, result if not isinstance(result,Exception) else type(result).__name__,
+      s['payload_rate'] / 1e3, 1e3 * s['latency_p50'], 1e3 * s['latency_p99'], 1e3 * s['latency_max']))
+  fo.write('%-24s %-12s %10.1f\n' % ('Total', '', total / 1e3))
+
+
+###############################################################################
+#
+###############################################################################
+
+async def _main(args):
+  ports = []
+  servers = []
+  if args.model:
+    from clot.model import AhbSpace, CommctrlModel, serve_pty
+    for k in range(args.boards):
+      space = AhbSpace()
+      for text in args.model:
+        space.map_ram(*parse_region(text))
+      server, name = serve_pty(CommctrlModel(space),args.baud)
+      servers.append(server)
+      ports.append(open_tty(name,args.baud,rtscts=False))
+  for device in args.port or []:
+    ports.append(open_tty(device,args.baud,rtscts=not args.no_rtscts))
+  if not ports:
+    raise SystemExit('No port specified.  Please specify --port or --model')
+
+  drivers = [AsyncCommctrl(p) for p in ports]
+  if args.regs:
+    base, count = parse_region(args.regs)
+    job = lambda cc: register_test(cc,base,count)
+  elif args.load:
+    job = lambda cc: load_image(cc,args.load,base=int(args.base,0))
+  else:
+    base, size = parse_region(args.readback)
+    async def job(cc):
+      return len(await readback(cc,base,size))
+  results = await run_boards(drivers,job)
+  report(results)
+  for cc in drivers:
+    await cc.close()
+  for server in servers:
+    server.stop()
+  return results
+
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Run a COMMCTRL job on several boards concurrently.')
+  parser.add_argument('-p','--port', action='append', help='Serial port device (repeatable, one per board).')
+  parser.add_argument('-b','--baud', default=115200, type=int, help='Baud rate.')
+  parser.add_argument('--no-rtscts', action='store_true', help='Disable RTS/CTS flow control.')
+  parser.add_argument('--model', action='append', metavar='BASE:SIZE', help='Add model boards with this RAM region, served on ptys (repeatable).')
+  parser.add_argument('-n','--boards', default=1, type=int, help='Number of model boards.')
+  job = parser.add_mutually_exclusive_group(required=True)
+  job.add_argument('--regs', metavar='BASE:COUNT', help='Write and read back COUNT words from BASE.')
+  job.add_argument('--load', metavar='IMAGE', help='Load an image file.')
+  job.add_argument('--readback', metavar='BASE:SIZE', help='Read back SIZE bytes from BASE.')
+  parser.add_argument('--base', default='0', help='Load address for .bin and $readmemh images.')
+  args = parser.parse_args()
+
+  results = asyncio.run(_main(args))
+  if any(isinstance(r,Exception) or (args.regs and r) for cc, r in results):
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# cache.py - Last-known memory image cache for delta loading
+#
+# Keeps a copy of the last image loaded into each board and target, so a
+# reload only needs to write the words that changed.  The cache for a target
+# is a directory holding one flat file of 32b little-endian words per
+# contiguous address range, and a meta.json file listing the ranges:
+#
+#   <root>/<board>/<target>/meta.json
+#   <root>/<board>/<target>/XXXXXXXX.bin      (XXXXXXXX = range base address)
+#
+# meta.json is marked dirty before the chip is written, and clean again only
+# once the load has completed, so an interrupted load is never trusted.
+
+import array
+import bisect
+import json
+import os
+import re
+import sys
+
+
+def default_root():
+  return os.environ.get('CLOT_CACHE',os.path.join(os.path.expanduser('~'),'.cache','clot'))
+
+
+def _safe(name):
+  return re.sub(r'[^A-Za-z0-9_.-]','_',str(name)) or '_'
+
+
+def _read_words(fi,n):
+  w = array.array('I')
+  w.fromfile(fi,n)
+  if sys.byteorder != 'little':
+    w.byteswap()
+  return w
+
+
+class ImageCache(object):
+  """
+  Cache of the memory image last loaded into one board and target.
+  board is any identifier that is unique to the board (serial number, ID register, port).
+  """
+
+  def __init__(self,board,target='default',root=None):
+    self.path = os.path.join(root or default_root(),_safe(board),_safe(target))
+    self.meta = {'ranges': [], 'dirty': False}
+    try:
+      with open(os.path.join(self.path,'meta.json'),'r') as fi:
+        self.meta = json.load(fi)
+    except (IOError, ValueError):
+      pass
+    self._cached = self._valid_ranges()     # ranges that can be trusted, fixed for the duration of a load
+    self._files = {}
+    self._new = None
+
+  def _save_meta(self):
+    os.makedirs(self.path,exist_ok=True)
+    tmp = os.path.join(self.path,'meta.json.tmp')
+    with open(tmp,'w') as fo:
+      json.dump(self.meta,fo,indent=2)
+    os.replace(tmp,os.path.join(self.path,'meta.json'))
+
+  def _range_file(self,base,suffix=''):
+    return os.path.join(self.path,'%08X.bin%s' % (base, suffix))
+
+
+  ###########################################################################
+  # Lookup
+  ###########################################################################
+
+  def _valid_ranges(self):
+    return [tuple(x) for x in self.meta['ranges']] if not self.meta['dirty'] else []
+
+  def valid(self):
+    """ True if the cache holds a completely loaded image. """
+    return bool(self._cached)
+
+  def ranges(self):
+    """ Cached (base, nbytes) ranges, sorted by address. """
+    return self._cached
+
+  def lookup(self,addr,n,default=None):
+    """ Cached values of the n words from addr, with default for words not in the cache. """
+    values = [default] * n
+    ranges = self.ranges()
+    i = max(bisect.bisect([b for b, size in ranges],addr) - 1,0)
+    end = addr + 4*n
+    for base, size in ranges[i:]:
+      if base >= end:
+        break
+      lo, hi = max(base,addr), min(base + size,end)
+      if lo >= hi:
+        continue
+      if base not in self._files:
+        self._files[base] = open(self._range_file(base),'rb')
+      fi = self._files[base]
+      fi.seek(lo - base)
+      values[(lo-addr)//4:(hi-addr)//4] = _read_words(fi,(hi-lo)//4)
+    return values
+
+  def sentinels(self,n):
+    """ Up to n (addr, value) pairs spread evenly over the cached image. """
+    total = sum(size for base, size in self.ranges()) // 4
+    if total == 0 or n <= 0:
+      return []
+    pairs = []
+    ranges = iter(self.ranges())
+    base, size = next(ranges)
+    k = 0                                 # words in the ranges before base
+    for j in sorted(set(i * total // n for i in range(n))):
+      while j >= k + size // 4:
+        k += size // 4
+        base, size = next(ranges)
+      addr = base + 4 * (j - k)
+      pairs.append((addr, self.lookup(addr,1)[0]))
+    return pairs
+
+
+  ###########################################################################
+  # Update
+  ###########################################################################
+
+  def begin(self):
+    """ Start recording a new image.  Marks the cache dirty until commit(), and removes the files of an aborted load. """
+    self.meta['dirty'] = True
+    self._save_meta()
+    for name in os.listdir(self.path):
+      if name.endswith('.bin.new'):
+        os.remove(os.path.join(self.path,name))
+    self._new = []
+
+  def record(self,addr,words):
+    """ Record a block of words being loaded.  Consecutive blocks are merged into one range. """
+    if self._new and self._new[-1][0] + self._new[-1][1] == addr:
+      base, size, fo = self._new[-1]
+      self._new[-1] = (base, size + 4*len(words), fo)
+    else:
+      fo = open(self._range_file(addr,'.new'),'wb')
+      self._new.append((addr, 4*len(words), fo))
+    w = array.array('I',words)
+    if sys.byteorder != 'little':
+      w.byteswap()
+    w.tofile(fo)
+
+  def commit(self):
+    """ The recorded image is now in the chip: make it the cached image. """
+    self.close()
+    old = set(base for base, size in self.meta['ranges'])
+    ranges = []
+    for base, size, fo in self._new or []:
+      fo.close()
+      os.replace(self._range_file(base,'.new'),self._range_file(base))
+      ranges.append([base, size])
+      old.discard(base)
+    for base in old:
+      if os.path.exists(self._range_file(base)):
+        os.remove(self._range_file(base))
+    self._new = None
+    self.meta = {'ranges': sorted(ranges), 'dirty': False}
+    self._save_meta()
+    self._cached = self._valid_ranges()
+
+  def discard(self):
+    """ Forget the cached image, e.g. when a sentinel or verify read disagrees with it. """
+    self.close()
+    for base, size, fo in self._new or []:
+      fo.close()
+      os.remove(self._range_file(base,'.new'))
+    self._new = None
+    for base, size in self.meta['ranges']:
+      if os.path.exists(self._range_file(base)):
+        os.remove(self._range_file(base))
+    self.meta = {'ranges': [], 'dirty': False}
+    self._save_meta()
+    self._cached = []
+
+  def close(self):
+    for fi in self._files.values():
+      fi.close()
+    self._files = {}
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+
+# commctrl.py - Pipelined host driver for the COMMCTRL UART AHB master
+#
+# The instruction set is defined in ip/commctrl/decoder.sv:
+#
+#   W 0xAAAAAAAA 0xDDDDDDDD<CR><LF>     (25 bytes) write a 32b word
+#   R 0xAAAAAAAA<CR><LF>                (14 bytes) read a 32b word
+#   I 0xDDDDDDDD<CR><LF>                (14 bytes) write the word after the last transfer
+#   B 0xAAAAAAAA 0xNNNNNNNN<CR><LF>     (25 bytes) read N words (0 reads 1), one response each
+#
+# Every byte received by COMMCTRL is echoed back.  A response is only sent once
+# the echo buffer has drained (backend.sv), and always as one contiguous string:
+#
+#   HRDATA: 0xDDDDDDDD<CR><LF>          read data
+#   HMSEL: N<CR><LF>                    read of the HMSEL register (0x10000000)
+#   DECODE_ERROR: NN<CR><LF>            see the error code table in ip/commctrl/README.md
+#   AHB_ERROR: HADDR=0xAAAAAAAA<CR><LF> bus error response
+#
+# The echo is what makes pipelining safe: by counting echoed bytes, the host
+# knows exactly which instructions COMMCTRL has received when a response starts,
+# so responses can be matched to instructions in order without waiting for a
+# round trip per word.  COMMCTRL raises RTS while it is busy (read out, errors,
+# echo buffer full), so the serial port must be opened with RTS/CTS flow control.
+
+import argparse
+import collections
+import os
+import re
+import select
+import sys
+import time
+
+
+###############################################################################
+# Protocol definitions
+###############################################################################
+
+WRITE_LEN = 25            # W 0x00000000 0x00000000<CR><LF>
+READ_LEN = 14             # R 0x00000000<CR><LF>
+INC_LEN = 14              # I 0x00000000<CR><LF>
+BURST_LEN = 25            # B 0x00000000 0x00000000<CR><LF>
+LENGTHS = {'W': WRITE_LEN, 'R': READ_LEN, 'I': INC_LEN, 'B': BURST_LEN}
+POSTED = ('W', 'I')       # instructions without a response: errors are raised later
+BITS_PER_BYTE = 11        # 1 start bit, 8 data bits, 2 stop bits
+
+HMSEL_ADDR = 0x10000000   # Reads/writes the HMSEL master select, not the bus
+IRQ_ADDR = 0x10000004     # Writes pulse IRQ_COMMCTRL, reads return nothing
+
+# Decode error codes, in priority order (decoder.sv)
+ERROR_CODES = {
+  10: 'Instruction Size',
+  11: 'Instruction Type',
+  20: 'Separator 0',
+  21: 'Separator 1',
+  22: 'Line Break',
+  30: 'Address Byte 0',
+  31: 'Address Byte 1',
+  32: 'Address Byte 2',
+  33: 'Address Byte 3',
+  34: 'Address Byte 4',
+  35: 'Address Byte 5',
+  36: 'Address Byte 6',
+  37: 'Address Byte 7',
+  40: 'Write Data Byte 0',
+  41: 'Write Data Byte 1',
+  42: 'Write Data Byte 2',
+  43: 'Write Data Byte 3',
+  44: 'Write Data Byte 4',
+  45: 'Write Data Byte 5',
+  46: 'Write Data Byte 6',
+  47: 'Write Data Byte 7',
+}
+
+# Response strings sent by backend.sv.  '#' is a hex digit (upper case).
+RESPONSES = [
+  b'HRDATA: 0x########\r\n',
+  b'HMSEL: #\r\n',
+  b'DECODE_ERROR: ##\r\n',
+  b'AHB_ERROR: HADDR=0x########\r\n',
+]
+_HEX = b'0123456789ABCDEF'
+_RESPONSE_RE = re.compile(b'|'.join(
+  b'(' + re.escape(x).replace(b'\\#', b'#').replace(b'#', b'[0-9A-F]') + b')' for x in RESPONSES))
+_RESPONSE_MAXLEN = max(len(x) for x in RESPONSES)
+
+
+def encode_write(addr,data):
+  """ Encode a write instruction. """
+  return b'W 0x%08X 0x%08X\r\n' % (addr & 0xFFFFFFFF, data & 0xFFFFFFFF)
+
+def encode_read(addr):
+  """ Encode a read instruction. """
+  return b'R 0x%08X\r\n' % (addr & 0xFFFFFFFF)
+
+def encode_inc(data):
+  """ Encode an auto-increment write instruction. """
+  return b'I 0x%08X\r\n' % (data & 0xFFFFFFFF)
+
+def encode_burst(addr,count):
+  """ Encode a burst read instruction of count words. """
+  return b'B 0x%08X 0x%08X\r\n' % (addr & 0xFFFFFFFF, count & 0xFFFFFFFF)
+
+
+def _could_be_response(tail):
+  """ True if tail is the start of a response string that has not fully arrived yet. """
+  for resp in RESPONSES:
+    if len(tail) >= len(resp):
+      continue
+    for x, y in zip(tail,resp):
+      if (y == 0x23 and x not in _HEX) or (y != 0x23 and x != y):
+        break
+    else:
+      return True
+  return False
+
+
+###############################################################################
+# Errors
+###############################################################################
+
+class CommctrlError(Exception):
+  """ Base class for errors reported by, or about, COMMCTRL. """
+  pass
+
+class DecodeError(CommctrlError):
+  """ COMMCTRL could not decode an instruction. """
+  def __init__(self,code,txn=None):
+    self.code = code
+    self.txn = txn
+    CommctrlError.__init__(self,'DECODE_ERROR: %d (%s) for %r' % (code, ERROR_CODES.get(code,'unknown'), txn))
+
+class AhbError(CommctrlError):
+  """ The AHB transfer got an error response. """
+  def __init__(self,addr,txn=None):
+    self.addr = addr
+    self.txn = txn
+    CommctrlError.__init__(self,'AHB_ERROR: HADDR=0x%08X for %r' % (addr, txn))
+
+class ProtocolError(CommctrlError):
+  """ The response stream does not match the instructions sent. """
+  pass
+
+class CommctrlTimeout(CommctrlError):
+  """ No progress on the link within the timeout. """
+  pass
+
+class LinkError(CommctrlError):
+  """ The port was closed or failed. """
+  pass
+
+
+###############################################################################
+# Protocol state (independent of the port)
+###############################################################################
+
+class Transaction(object):
+  """ One instruction sent to COMMCTRL and its outcome. """
+
+  __slots__ = ('kind','addr','data','end','expects','done','value','error','t_submit','t_done')
+
+  def __init__(self,kind,addr,data=0):
+    self.kind = kind              # 'W', 'R', 'I' (addr is the expected address) or 'B' (data is the count)
+    self.addr = addr
+    self.data = data
+    self.end = 0                  # link byte count at the end of the instruction
+    self.expects = (kind in 'RB') and (addr != IRQ_ADDR)
+    self.done = False
+    self.value = [] if kind == 'B' else None
+    self.error = None
+    self.t_submit = None
+    self.t_done = None
+
+  def encode(self):
+    if self.kind == 'W':
+      return encode_write(self.addr,self.data)
+    if self.kind == 'I':
+      return encode_inc(self.data)
+    if self.kind == 'B':
+      return encode_burst(self.addr,self.data)
+    return encode_read(self.addr)
+
+  def words(self):
+    """ Number of HRDATA responses expected. """
+    return max(self.data,1) if self.kind == 'B' else 1
+
+  def result(self):
+    """ Return the read data, or raise the error reported for this transaction. """
+    assert self.done, 'Transaction has not completed: %r' % self
+    if self.error is not None:
+      raise self.error
+    return self.value
+
+  def __repr__(self):
+    if self.kind == 'W':
+      return 'W 0x%08X 0x%08X' % (self.addr, self.data)
+    if self.kind == 'I':
+      return 'I 0x%08X (0x%08X)' % (self.data, self.addr)
+    if self.kind == 'B':
+      return 'B 0x%08X 0x%08X' % (self.addr, self.data)
+    return 'R 0x%08X' % self.addr
+
+
+class Link(object):
+  """
+  Tracks instructions in flight and matches the received byte stream to them.
+  This holds no port, so the same state machine serves blocking and asyncio drivers.
+  """
+
+  def __init__(self):
+    self.pending = collections.deque()
+    self.tx_bytes = 0             # bytes sent
+    self.rx_bytes = 0             # bytes received
+    self.echo_bytes = 0           # bytes received that were echo
+    self._buf = bytearray()
+    self._burst = None            # burst read with responses still to come
+
+  def in_flight(self):
+    """ Bytes sent that have not been echoed yet. """
+    return self.tx_bytes - self.echo_bytes
+
+  def submit(self,txn):
+    """ Queue a transaction, returning the bytes to send. """
+    data = txn.encode()
+    self.tx_bytes += len(data)
+    txn.end = self.tx_bytes
+    txn.t_submit = time.time()
+    self.pending.append(txn)
+    return data
+
+  def _complete(self,txn,value=None,error=None):
+    txn.value = value
+    txn.error = error
+    txn.done = True
+    txn.t_done = time.time()
+
+  def _echo(self,n,done):
+    # Instructions with no response are complete once a later instruction has been
+    # received in full, because any error response would have come before it.
+    self.echo_bytes += n
+    while len(self.pending) >= 2 and not self.pending[0].expects and self.pending[1].end <= self.echo_bytes:
+      txn = self.pending.popleft()
+      self._complete(txn)
+      done.append(txn)
+
+  def _response(self,m,done):
+    # The response belongs to the last instruction received before it started,
+    # or to the burst read still in progress (RTS holds the host off meanwhile).
+    if self._burst is not None:
+      owner, self._burst = self.pending.popleft(), None       # kept at the front of pending
+    else:
+      owner = None
+      while self.pending and self.pending[0].end <= self.echo_bytes:
+        txn = self.pending.popleft()
+        if owner is not None:
+          if owner.expects:
+            self._complete(owner,error=ProtocolError('No response for %r' % owner))
+          else:
+            self._complete(owner)
+          done.append(owner)
+        owner = txn
+    if owner is None:
+      raise ProtocolError('Unexpected response %r' % bytes(m.group(0)))
+    text = m.group(0)
+    if m.group(1):
+      if owner.kind == 'R':
+        self._complete(owner,value=int(text[10:18],16))
+      elif owner.kind == 'B':
+        owner.value.append(int(text[10:18],16))
+        if len(owner.value) < owner.words():
+          self._burst = owner
+          self.pending.appendleft(owner)
+          return
+        self._complete(owner,value=owner.value)
+      else:
+        self._complete(owner,error=ProtocolError('Read data for %r' % owner))
+    elif m.group(2):
+      self._complete(owner,value=int(text[7:8],16))
+    elif m.group(3):
+      self._complete(owner,error=DecodeError(int(text[14:16]),owner))
+    else:
+      self._complete(owner,error=AhbError(int(text[19:27],16),owner))
+    done.append(owner)
+
+  def feed(self,data):
+    """ Process received bytes.  Returns the list of transactions completed. """
+    done = []
+    self.rx_bytes += len(data)
+    self._buf += data
+    buf = self._buf
+    pos = 0
+    for m in _RESPONSE_RE.finditer(buf):
+      self._echo(m.start() - pos,done)
+      self._response(m,done)
+      pos = m.end()
+    # Hold back a tail that may be the start of a response
+    keep = len(buf)
+    for i in range(max(pos,len(buf) - _RESPONSE_MAXLEN + 1),len(buf)):
+      if buf[i] in b'HDA' and _could_be_response(buf[i:]):
+        keep = i
+        break
+    self._echo(keep - pos,done)
+    del buf[:keep]
+    return done
+
+
+###############################################################################
+# Blocking driver
+###############################################################################
+
+WINDOW = 1024             # default bytes in flight (not yet echoed)
+BURST_WORDS = 256         # default words per burst read
+
+
+class Commctrl(object):
+  """
+  Blocking COMMCTRL driver with pipelining.
+
+  The port is any object with write(bytes) and read(n) (returning what arrives
+  within its timeout), such as a pyserial Serial opened by open_serial().
+  Writes are posted: they return as soon as they are queued and any error is
+  raised by the next call that waits (read32, read_many, flush).
+  Up to window bytes are kept in flight, so the link runs back to back.
+  """
+
+  def __init__(self,port,window=WINDOW,timeout=2.0):
+    self.port = port
+    self.window = window
+    self.timeout = timeout
+    self.link = Link()
+    self.errors = []              # errors from posted writes, not yet raised
+    self.t_start = time.time()
+    self.count = collections.Counter()
+    self.words = collections.Counter()     # words transferred by bursts
+
+  def _pump(self):
+    n = getattr(self.port,'in_waiting',0) or 1
+    data = self.port.read(n)
+    if data:
+      for txn in self.link.feed(data):
+        if txn.error is not None and txn.kind in POSTED:
+          self.errors.append(txn.error)
+    return len(data)
+
+  def _wait_until(self,cond):
+    t_last = time.time()
+    while not cond():
+      if self._pump():
+        t_last = time.time()
+      elif time.time() - t_last > self.timeout:
+        raise CommctrlTimeout('No response from COMMCTRL (%d bytes in flight)' % self.link.in_flight())
+
+  def _raise_errors(self):
+    if self.errors:
+      error, self.errors = self.errors[0], []
+      raise error
+
+  def submit(self,kind,addr,data=0):
+    """ Queue an instruction without waiting for it.  Returns the Transaction. """
+    txn = Transaction(kind,addr,data)
+    n = LENGTHS[kind]
+    self._wait_until(lambda: self.link.in_flight() + n <= self.window)
+    self.port.write(self.link.submit(txn))
+    self.count[kind] += 1
+    if kind == 'B':
+      self.words[kind] += txn.words()
+    return txn
+
+  def wait(self,txn):
+    """ Wait for a transaction to complete and return its result. """
+    self._wait_until(lambda: txn.done)
+    self._raise_errors()
+    return txn.result()
+
+  def write32(self,addr,data):
+    """ Posted write of a 32b word. """
+    self.submit('W',addr,data)
+
+  def read32(self,addr):
+    """ Read a 32b word. """
+    return self.wait(self.submit('R',addr))
+
+  def write_many(self,pairs):
+    """ Posted writes of a sequence of (addr, data) pairs. """
+    for addr, data in pairs:
+      self.submit('W',addr,data)
+
+  def read_many(self,addrs):
+    """ Read a sequence of addresses with all reads pipelined.  Returns a list. """
+    txns = [self.submit('R',x) for x in addrs]
+    return [self.wait(x) for x in txns]
+
+  def write_block(self,addr,words):
+    """
+    Posted writes of consecutive words from addr: one W, then an auto-increment
+    I (14 bytes instead of 25) for each following word.
+    """
+    for i, data in enumerate(words):
+      self.submit('I' if i else 'W',addr + 4*i,data)
+
+  def read_block(self,addr,n,burst=BURST_WORDS):
+    """ Read n consecutive words from addr with burst reads of up to burst words, pipelined.  Returns a list. """
+    end = addr + 4*n
+    assert not (addr <= HMSEL_ADDR < end or addr <= IRQ_ADDR < end), \
+      'Range 0x%08X-0x%08X includes the COMMCTRL registers' % (addr, end)
+    txns = [self.submit('B',addr + 4*i,min(burst,n - i)) for i in range(0,n,burst)]
+    return [x for txn in txns for x in self.wait(txn)]
+
+  def flush(self):
+    """ Wait for every queued instruction, raising any error from a posted write. """
+    if self.link.pending:
+      self.wait(self.submit('R',HMSEL_ADDR))    # reading HMSEL is a harmless barrier
+    self._raise_errors()
+
+  def stats(self):
+    """ Link statistics since the driver was created. """
+    elapsed = max(time.time() - self.t_start,1e-9)
+    return {
+      'writes': self.count['W'] + self.count['I'],
+      'reads': self.count['R'] + self.words['B'],
+      'tx_bytes': self.link.tx_bytes,
+      'rx_bytes': self.link.rx_bytes,
+      'elapsed': elapsed,
+      'tx_rate': self.link.tx_bytes / elapsed,
+      'rx_rate': self.link.rx_bytes / elapsed,
+      'payload_rate': 4 * (self.count['W'] + self.count['I'] + self.count['R'] + self.words['B']) / elapsed,
+    }
+
+
+class FdPort(object):
+  """ Port over a raw file descriptor, such as a pseudo-terminal or one end of a socket pair. """
+
+  def __init__(self,fd,timeout=0.01):
+    self.fd = fd
+    self.timeout = timeout
+
+  @property
+  def in_waiting(self):
+    return 0
+
+  def write(self,data):
+    view = memoryview(data)
+    while view:
+      select.select([],[self.fd],[])
+      n = os.write(self.fd,view)
+      view = view[n:]
+    return len(data)
+
+  def read(self,size=1):
+    if not select.select([self.fd],[],[],self.timeout)[0]:
+      return b''
+    return os.read(self.fd,max(size,4096))
+
+
+def open_serial(device,baud=115200,rtscts=True,timeout=0.01):
+  """ Open a serial port with the COMMCTRL UART settings (8 data bits, no parity, 2 stop bits). """
+  import serial
+  return serial.Serial(device,baudrate=baud,bytesize=serial.EIGHTBITS,parity=serial.PARITY_NONE,
+                       stopbits=serial.STOPBITS_TWO,rtscts=rtscts,timeout=timeout)
+
+
+###############################################################################
+#
+###############################################################################
+
+def run_script(cc,fi):
+  """
+  Run a file of instructions in the COMMCTRL syntax, one per line, all pipelined.
+  Prints read results in order.  Lines starting with # are comments.
+  """
+  txns = []
+  for line in fi:
+    f = line.split()
+    if not f or f[0].startswith('#'):
+      continue
+    if f[0].upper() == 'W':
+      txns.append(cc.submit('W',int(f[1],16),int(f[2],16)))
+    elif f[0].upper() == 'R':
+      txns.append(cc.submit('R',int(f[1],16)))
+    elif f[0].upper() == 'I':
+      addr = txns[-1].addr + 4 * txns[-1].words() if txns else 0
+      txns.append(cc.submit('I',addr,int(f[1],16)))
+    elif f[0].upper() == 'B':
+      txns.append(cc.submit('B',int(f[1],16),int(f[2],16)))
+    else:
+      raise ValueError('Unknown instruction: %s' % line.strip())
+  cc.flush()
+  for txn in txns:
+    if txn.kind == 'R':
+      print('%r: 0x%08X' % (txn, cc.wait(txn)))
+    elif txn.kind == 'B':
+      for i, data in enumerate(cc.wait(txn)):
+        print('R 0x%08X: 0x%08X' % (txn.addr + 4*i, data))
+
+
+def add_port_arguments(parser):
+  """ Add the options used by open_port() to an argparse parser. """
+  parser.add_argument('-p','--port', help='Serial port device.')
+  parser.add_argument('-b','--baud', default=115200, type=int, help='Baud rate.')
+  parser.add_argument('--no-rtscts', action='store_true', help='Disable RTS/CTS flow control.')
+  parser.add_argument('--model', action='append', metavar='BASE:SIZE', help='Use the software model with this RAM region instead of a port (repeatable).')
+  parser.add_argument('--log', help='Log the bytes sent and received to this file, for trace.py.')
+
+
+def open_port(args):
+  """ Open the serial port, or the software model, given by add_port_arguments() options. """
+  port = _open_port(args)
+  if getattr(args,'log',None):
+    from clot.trace import LogPort
+    port = LogPort(port,open(args.log,'w'))
+  return port
+
+
+def _open_port(args):
+  if args.model:
+    from clot.model import AhbSpace, CommctrlModel, ModelPort, parse_region
+    space = AhbSpace()
+    for text in args.model:
+      space.map_ram(*parse_region(text))
+    return ModelPort(CommctrlModel(space),baud=args.baud)
+  if not args.port:
+    raise SystemExit('No port specified.  Please specify --port or --model')
+  return open_serial(args.port,args.baud,rtscts=not args.no_rtscts)
+
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Issue transactions through COMMCTRL.')
+  add_port_arguments(parser)
+  parser.add_argument('-w','--write', nargs=2, action='append', metavar=('ADDR','DATA'), help='Write DATA to ADDR (hex).')
+  parser.add_argument('-r','--read', action='append', metavar='ADDR', help='Read ADDR (hex).')
+  parser.add_argument('-f','--file', type=argparse.FileType('r'), help='Run a file of W/R/I/B instructions, pipelined.')
+  args = parser.parse_args()
+  if not (args.write or args.read or args.file):
+    parser.error('No action specified.  Please specify an action: --write, --read or --file')
+
+  cc = Commctrl(open_port(args))
+  for addr, data in args.write or []:
+    cc.write32(int(addr,16),int(data,16))
+  if args.read:
+    for addr, data in zip(args.read,cc.read_many([int(x,16) for x in args.read])):
+      print('R 0x%08X: 0x%08X' % (int(addr,16), data))
+  if args.file:
+    run_script(cc,args.file)
+  cc.flush()
+  s = cc.stats()
+  sys.stderr.write('%d writes, %d reads, %.1f kB/s payload\n' % (s['writes'], s['reads'], s['payload_rate'] / 1e3))
+
+
+if __name__ == "__main__":
+  main()
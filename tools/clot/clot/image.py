@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# image.py - Streaming readers for memory images (.bin, .hex, ELF)
+#
+# Every reader yields (addr, data) chunks of bounded size, so images of any
+# size are processed in constant memory.  word_blocks() turns the chunks into
+# aligned blocks of 32b little-endian words for loading over the bus.
+
+import array
+import os
+import struct
+import sys
+
+
+CHUNK = 4096              # bytes per chunk
+
+
+###############################################################################
+# Readers
+###############################################################################
+
+def read_bin(path,base=0,chunk=CHUNK):
+  """ Raw binary, loaded at base. """
+  with open(path,'rb') as fi:
+    addr = base
+    while True:
+      data = fi.read(chunk)
+      if not data:
+        break
+      yield addr, data
+      addr += len(data)
+
+
+def read_ihex(path,chunk=CHUNK):
+  """ Intel HEX.  Contiguous records are merged into chunks. """
+  upper = 0
+  addr, buf = None, bytearray()
+  with open(path,'r') as fi:
+    for n, line in enumerate(fi):
+      line = line.strip()
+      if not line:
+        continue
+      assert line.startswith(':'), 'Not an Intel HEX record at line %d of %s' % (n+1, path)
+      rec = bytes.fromhex(line[1:])
+      assert sum(rec) & 0xFF == 0, 'Checksum error at line %d of %s' % (n+1, path)
+      count, offset, rtype, data = rec[0], (rec[1] << 8) | rec[2], rec[3], rec[4:4+rec[0]]
+      if rtype == 0x00:                             # data
+        a = upper + offset
+        if addr is None or a != addr + len(buf) or len(buf) >= chunk:
+          if buf:
+            yield addr, bytes(buf)
+          addr, buf = a, bytearray()
+        buf += data
+      elif rtype == 0x01:                           # end of file
+        break
+      elif rtype == 0x02:                           # extended segment address
+        upper = ((data[0] << 8) | data[1]) << 4
+      elif rtype == 0x04:                           # extended linear address
+        upper = ((data[0] << 8) | data[1]) << 16
+  if buf:
+    yield addr, bytes(buf)
+
+
+def read_memh(path,base=0,chunk=CHUNK):
+  """
+  $readmemh-style text: whitespace separated 32b hex words, @ sets the word address.
+  Comments (//) and underscores are ignored.
+  """
+  addr, buf = base, bytearray()
+  with open(path,'r') as fi:
+    for line in fi:
+      for tok in line.split('//')[0].split():
+        if tok.startswith('@'):
+          if buf:
+            yield addr, bytes(buf)
+          addr, buf = base + 4 * int(tok[1:],16), bytearray()
+        else:
+          buf += struct.pack('<I',int(tok.replace('_',''),16))
+          if len(buf) >= chunk:
+            yield addr, bytes(buf)
+            addr, buf = addr + len(buf), bytearray()
+  if buf:
+    yield addr, bytes(buf)
+
+
+def read_elf(path,chunk=CHUNK):
+  """ ELF (32 or 64 bit): the file contents of each PT_LOAD segment, at its physical address. """
+  with open(path,'rb') as fi:
+    ident = fi.read(16)
+    assert ident[:4] == b'\x7fELF', 'Not an ELF file: %s' % path
+    is64 = ident[4] == 2
+    e = '<' if ident[5] == 1 else '>'
+    if is64:
+      fi.seek(0x20)
+      phoff, = struct.unpack(e+'Q',fi.read(8))
+      fi.seek(0x36)
+    else:
+      fi.seek(0x1C)
+      phoff, = struct.unpack(e+'I',fi.read(4))
+      fi.seek(0x2A)
+    phentsize, phnum = struct.unpack(e+'HH',fi.read(4))
+    segments = []
+    for k in range(phnum):
+      fi.seek(phoff + k * phentsize)
+      if is64:
+        ptype, flags, offset, vaddr, paddr, filesz = struct.unpack(e+'IIQQQQ',fi.read(40))
+      else:
+        ptype, offset, vaddr, paddr, filesz = struct.unpack(e+'IIIII',fi.read(20))
+      if ptype == 1 and filesz > 0:               # PT_LOAD
+        segments.append((paddr, offset, filesz))
+    for paddr, offset, filesz in sorted(segments):
+      fi.seek(offset)
+      done = 0
+      while done < filesz:
+        data = fi.read(min(chunk,filesz - done))
+        assert data, 'Truncated segment in %s' % path
+        yield paddr + done, data
+        done += len(data)
+
+
+def image_format(path):
+  """ Guess the format of an image file from its extension and contents. """
+  with open(path,'rb') as fi:
+    head = fi.read(64)
+  if head.startswith(b'\x7fELF'):
+    return 'elf'
+  ext = os.path.splitext(path)[1].lower()
+  if ext in ['.hex','.ihex','.mem','.memh','.vmem']:
+    return 'ihex' if head.lstrip().startswith(b':') else 'memh'
+  return 'bin'
+
+
+def read_image(path,fmt=None,base=0,chunk=CHUNK):
+  """ Read an image in any supported format, yielding (addr, data) chunks. """
+  fmt = fmt or image_format(path)
+  if fmt == 'bin':
+    return read_bin(path,base,chunk)
+  elif fmt == 'ihex':
+    return read_ihex(path,chunk)
+  elif fmt == 'memh':
+    return read_memh(path,base,chunk)
+  elif fmt == 'elf':
+    return read_elf(path,chunk)
+  raise ValueError('Unknown image format: %s' % fmt)
+
+
+def image_size(path,fmt=None):
+  """ Number of bytes in an image (cheap for .bin and ELF, a full pass otherwise). """
+  fmt = fmt or image_format(path)
+  if fmt == 'bin':
+    return os.path.getsize(path)
+  return sum(len(data) for addr, data in read_image(path,fmt))
+
+
+###############################################################################
+# Words
+###############################################################################
+
+def word_blocks(chunks,pad=0):
+  """
+  Turn (addr, data) chunks into (addr, array of 32b words) blocks, word aligned.
+  Partial words at the edges of a chunk are padded with the pad byte, unless the
+  following chunk continues at the next address.
+  """
+  addr, buf = None, bytearray()
+  for a, data in chunks:
+    if addr is not None and a != addr + len(buf):
+      # discontinuity: flush what we have, padding the last word
+      buf += bytes([pad]) * (-len(buf) % 4)
+      yield addr, _words(buf)
+      addr, buf = None, bytearray()
+    if addr is None:
+      addr = a & ~3
+      buf = bytearray([pad]) * (a - addr)
+    buf += data
+    n = len(buf) & ~3
+    if n:
+      yield addr, _words(buf[:n])
+      addr += n
+      del buf[:n]
+  if buf:
+    buf += bytes([pad]) * (-len(buf) % 4)
+    yield addr, _words(buf)
+
+
+def _words(buf):
+  w = array.array('I')
+  w.frombytes(bytes(buf))
+  if sys.byteorder != 'little':
+    w.byteswap()
+  return w
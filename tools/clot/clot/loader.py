@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+# loader.py - Stream memory images into the chip through COMMCTRL
+#
+# Each 32b word costs a 25-byte write instruction on the link, so the loader
+# keeps the link busy with pipelined writes, and skips words that already hold
+# a known fill value.  Images are streamed a block at a time (image.py), so
+# memory use does not depend on the image size.  Optionally, the image is read
+# back in full or at a sampled stride to verify the load.
+#
+# With an image cache (cache.py), only the words that differ from the last
+# image loaded into the same board and target are written.
+
+import argparse
+import sys
+import time
+
+from clot.commctrl import Commctrl, WRITE_LEN, READ_LEN, add_port_arguments, open_port
+from clot.image import read_image, image_format, image_size, word_blocks
+from clot.cache import ImageCache
+
+
+###############################################################################
+# Progress
+###############################################################################
+
+class Progress(object):
+  """ Prints the bytes done, percentage and throughput at most every interval seconds. """
+
+  def __init__(self,label,total=None,interval=0.5,stream=sys.stderr):
+    self.label = label
+    self.total = total
+    self.interval = interval
+    self.stream = stream
+    self.done = 0
+    self.skipped = 0
+    self.t_start = time.time()
+    self.t_last = 0
+
+  def update(self,n,skipped=0):
+    self.done += n
+    self.skipped += skipped
+    now = time.time()
+    if self.stream and now - self.t_last >= self.interval:
+      self.t_last = now
+      self.show('\r')
+
+  def rate(self):
+    return self.done / max(time.time() - self.t_start,1e-9)
+
+  def show(self,end):
+    l = '%s: %d bytes' % (self.label, self.done)
+    if self.total:
+      l += ' (%3d%%)' % (100 * self.done // self.total)
+    l += ', %.1f kB/s' % (self.rate() / 1e3)
+    if self.skipped:
+      l += ', %d skipped' % self.skipped
+    self.stream.write(l + end)
+    self.stream.flush()
+
+  def finish(self):
+    if self.stream:
+      self.show('\n')
+
+
+###############################################################################
+# Load and verify
+###############################################################################
+
+def load_blocks(cc,blocks,fill=None,progress=None,cache=None):
+  """
+  Write (addr, words) blocks through the driver, skipping words equal to fill,
+  or equal to the cached value if a cache is given.
+  Returns (words written, words skipped).
+  """
+  written = skipped = 0
+  for addr, words in blocks:
+    if cache:
+      old = cache.lookup(addr,len(words),fill)
+      cache.record(addr,words)
+      pairs = [(addr + 4*i, w) for i, w in enumerate(words) if w != old[i]]
+    else:
+      pairs = [(addr + 4*i, w) for i, w in enumerate(words) if w != fill]
+    cc.write_many(pairs)
+    written += len(pairs)
+    skipped += len(words) - len(pairs)
+    if progress:
+      progress.update(4 * len(words),len(words) - len(pairs))
+  cc.flush()
+  return written, skipped
+
+
+def verify_blocks(cc,blocks,step=1,progress=None,max_report=16):
+  """
+  Read back (addr, words) blocks, checking every step-th word.
+  Returns (words checked, list of (addr, expected, actual) mismatches up to max_report, mismatch count).
+  """
+  checked = n_bad = 0
+  bad = []
+  k = 0                                   # word count across blocks, so sampling is spread evenly
+  for addr, words in blocks:
+    first = -k % step
+    idx = range(first,len(words),step)
+    actual = cc.read_many([addr + 4*i for i in idx])
+    for i, got in zip(idx,actual):
+      if got != words[i]:
+        n_bad += 1
+        if len(bad) < max_report:
+          bad.append((addr + 4*i, words[i], got))
+    checked += len(actual)
+    k += len(words)
+    if progress:
+      progress.update(4 * len(words))
+  return checked, bad, n_bad
+
+
+def check_sentinels(cc,cache,n):
+  """ Read n words of the cached image back from the chip.  Returns the number that differ. """
+  pairs = cache.sentinels(n)
+  actual = cc.read_many([addr for addr, value in pairs])
+  return sum(1 for (addr, value), got in zip(pairs,actual) if got != value)
+
+
+def load_image(cc,path,fmt=None,base=0,fill=None,verify='none',step=64,quiet=False,cache=None,sentinels=0):
+  """
+  Load an image file through COMMCTRL, with optional readback.
+  verify is 'none', 'sample' (every step-th word) or 'full'.
+  If an ImageCache is given, only words that differ from the cached image are
+  written, after checking that sentinels words of the cached image read back as expected.
+  Returns a dict of statistics; 'mismatches' is non-zero if verification failed.
+  """
+  fmt = fmt or image_format(path)
+  total = image_size(path,fmt) if fmt in ['bin','elf'] else None
+  stream = None if quiet else sys.stderr
+  stats = {'delta': False}
+
+  if cache:
+    if cache.valid() and sentinels:
+      stats['sentinel_errors'] = check_sentinels(cc,cache,sentinels)
+      if stats['sentinel_errors']:
+        if stream:
+          stream.write('Cache: %d of %d sentinel words differ, reloading in full\n' % (stats['sentinel_errors'], sentinels))
+        cache.discard()
+    stats['delta'] = cache.valid()
+    cache.begin()
+
+  p = Progress('Load',total,stream=stream)
+  written, skipped = load_blocks(cc,word_blocks(read_image(path,fmt,base)),fill,p,cache)
+  p.finish()
+  if cache:
+    cache.commit()
+  stats.update({
+    'bytes': p.done,
+    'written': written,
+    'skipped': skipped,
+    'load_time': time.time() - p.t_start,
+    'link_bytes': written * WRITE_LEN,
+  })
+
+  if verify != 'none':
+    v = Progress('Verify',total,stream=stream)
+    checked, bad, n_bad = verify_blocks(cc,word_blocks(read_image(path,fmt,base)),1 if verify == 'full' else step,v)
+    v.finish()
+    for addr, expected, actual in bad:
+      sys.stderr.write('MISMATCH: 0x%08X expected 0x%08X read 0x%08X\n' % (addr, expected, actual))
+    stats.update({'checked': checked, 'mismatches': n_bad, 'verify_time': time.time() - v.t_start})
+    stats['link_bytes'] += checked * READ_LEN
+    if cache and n_bad:
+      cache.discard()
+  return stats
+
+
+###############################################################################
+#
+###############################################################################
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Load a memory image (.bin, .hex, ELF) through COMMCTRL.')
+  add_port_arguments(parser)
+  parser.add_argument('image', help='Image file.')
+  parser.add_argument('--format', choices=['bin','ihex','memh','elf'], help='Image format (default: from file).')
+  parser.add_argument('--base', default='0', help='Load address for .bin and $readmemh images.')
+  parser.add_argument('--fill', default=None, help='Skip words equal to this value (memory already holds it).')
+  parser.add_argument('--verify', default='none', choices=['none','sample','full'], help='Read back after loading.')
+  parser.add_argument('--step', default=64, type=int, help='Read back every STEP-th word for --verify sample.')
+  parser.add_argument('--cache', action='store_true', help='Only write the words that changed since the last load to this board and target.')
+  parser.add_argument('--board', help='Board name for the cache (default: the port, or the ID register with --id-addr).')
+  parser.add_argument('--id-addr', help='Read the board ID for the cache from this address.')
+  parser.add_argument('--target', default='default', help='Target memory name for the cache.')
+  parser.add_argument('--sentinels', default=0, type=int, help='Check this many words of the cached image before a delta load.')
+  parser.add_argument('--cache-dir', help='Cache directory (default: $CLOT_CACHE or ~/.cache/clot).')
+  args = parser.parse_args()
+
+  cc = Commctrl(open_port(args))
+  fill = int(args.fill,0) if args.fill is not None else None
+  cache = None
+  if args.cache:
+    board = args.board
+    if args.id_addr:
+      board = '%s_id%08X' % (board or 'board', cc.read32(int(args.id_addr,0)))
+    cache = ImageCache(board or args.port or 'model',args.target,args.cache_dir)
+  s = load_image(cc,args.image,args.format,int(args.base,0),fill,args.verify,args.step,cache=cache,sentinels=args.sentinels)
+  l = 'Loaded %d bytes in %.2f s (%.1f kB/s), %d words written, %d skipped' % \
+    (s['bytes'], s['load_time'], s['bytes'] / max(s['load_time'],1e-9) / 1e3, s['written'], s['skipped'])
+  if s['delta']:
+    l += ' (delta)'
+  print(l)
+  if 'checked' in s:
+    print('Verified %d words, %d mismatches' % (s['checked'], s['mismatches']))
+    if s['mismatches']:
+      sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+# model.py - Cycle-free software model of COMMCTRL
+#
+# Models the byte-level behaviour of uartfront.sv, decoder.sv and backend.sv:
+# every received byte is echoed, a LF ends an instruction, the instruction is
+# decoded with the same checks and error priority as decoder.sv, and the
+# backend responds with the same strings.  The AHB side is an in-memory
+# address space with RAM regions and register callbacks.
+#
+# The model can be used in-process (ModelPort), or served over a pseudo-terminal
+# or a socket pair with a baud rate delay (ModelServer), so host tools can be
+# run and benchmarked without a board.
+
+import argparse
+import array
+import bisect
+import collections
+import os
+import select
+import socket
+import sys
+import threading
+import time
+
+from clot.commctrl import BITS_PER_BYTE, HMSEL_ADDR, IRQ_ADDR, FdPort
+
+
+###############################################################################
+# AHB address space
+###############################################################################
+
+class AhbSlaveError(Exception):
+  """ Raised by an address space access that should get an AHB error response. """
+  pass
+
+
+class Region(object):
+  """ A mapped address range.  RAM regions hold words, device regions call handlers. """
+
+  def __init__(self,base,size,name='',read=None,write=None,fill=0):
+    assert base % 4 == 0 and size % 4 == 0, 'Region must be word aligned: 0x%08X+0x%X' % (base, size)
+    self.base = base
+    self.size = size
+    self.end = base + size
+    self.name = name
+    self.on_read = read
+    self.on_write = write
+    self.words = None
+    if read is None and write is None:
+      self.words = array.array('I',[fill]) * (size // 4)
+
+  def read(self,addr):
+    if self.words is not None:
+      return self.words[(addr - self.base) >> 2]
+    if self.on_read is None:
+      raise AhbSlaveError(addr)
+    return self.on_read(addr) & 0xFFFFFFFF
+
+  def write(self,addr,data):
+    if self.words is not None:
+      self.words[(addr - self.base) >> 2] = data
+    elif self.on_write is None:
+      raise AhbSlaveError(addr)
+    else:
+      self.on_write(addr,data)
+
+
+class AhbSpace(object):
+  """ Address space of non-overlapping regions.  Unmapped accesses raise AhbSlaveError. """
+
+  def __init__(self):
+    self.regions = []
+    self._bases = []
+
+  def _add(self,region):
+    i = bisect.bisect(self._bases,region.base)
+    assert (i == 0 or self.regions[i-1].end <= region.base) and \
+      (i == len(self.regions) or region.end <= self.regions[i].base), \
+      'Region 0x%08X+0x%X overlaps an existing region' % (region.base, region.size)
+    self.regions.insert(i,region)
+    self._bases.insert(i,region.base)
+    return region
+
+  def map_ram(self,base,size,name='',fill=0):
+    """ Map a RAM region, initialised to fill. """
+    return self._add(Region(base,size,name,fill=fill))
+
+  def map_device(self,base,size,read=None,write=None,name=''):
+    """ Map a region whose accesses call read(addr) and write(addr,data). """
+    return self._add(Region(base,size,name,read=read,write=write))
+
+  def find(self,addr):
+    i = bisect.bisect(self._bases,addr) - 1
+    if i >= 0 and addr < self.regions[i].end:
+      return self.regions[i]
+    raise AhbSlaveError(addr)
+
+  def read(self,addr):
+    return self.find(addr).read(addr & ~3)
+
+  def write(self,addr,data):
+    self.find(addr).write(addr & ~3,data & 0xFFFFFFFF)
+
+
+###############################################################################
+# Decoder
+###############################################################################
+
+IBUF_SZ = 25
+
+_ascii_hex = b'0123456789ABCDEF'
+
+
+def decode(ibuf):
+  """
+  Decode an instruction (bytes up to and including the LF) as decoder.sv does.
+  Returns (kind, addr, wrdata, decode_err, err_code), where kind is 'W', 'R',
+  'I', 'B' or '' and wrdata is the write data of W and I or the count of B.
+  err_code is the two-digit code, only meaningful if decode_err is set.
+  """
+  cnt = len(ibuf) & 0x1F                          # ibuf_cnt is 5 bits
+  if cnt > IBUF_SZ:
+    dec = bytes(IBUF_SZ)                          # shifted out of ibuf_dec entirely
+  else:
+    dec = bytes(ibuf[-cnt:]) if cnt else b''
+  dec += bytes(IBUF_SZ + 2 - len(dec))           # bytes beyond the count read as zero
+
+  kind = {0x57: 'W', 0x52: 'R', 0x49: 'I', 0x42: 'B'}.get(dec[0] & ~0x20,'')
+  long_fmt = kind in ('W','B')                    # a second field, like W
+  wr_size_err = cnt != IBUF_SZ
+  rd_size_err = not (14 <= cnt <= IBUF_SZ)
+  crlf_err = cnt < 2 or not (dec[cnt-2] == 0x0A or (dec[cnt-2] == 0x0D and dec[cnt-1] == 0x0A))
+  rw_err = not kind
+  sep_err0 = not (dec[1] == 0x20 and dec[2] == 0x30 and dec[3] in b'Xx')
+  sep_err1 = not (dec[12] == 0x20 and dec[13] == 0x30 and dec[14] in b'Xx')
+  addr_err = [dec[11-k] not in _ascii_hex for k in range(8)]       # addr_err_0 is the last digit
+  wrdata_err = [dec[22-k] not in _ascii_hex for k in range(8)]
+
+  def num(x):
+    return (x - 0x30) & 0xF if 0x30 <= x <= 0x39 else (x - 0x41 + 10) & 0xF
+  addr = 0
+  for x in dec[4:12]:
+    addr = (addr << 4) | num(x)
+  wrdata = 0
+  for x in dec[15:23]:
+    wrdata = (wrdata << 4) | num(x)
+  if kind == 'I':
+    wrdata = addr
+
+  if long_fmt:
+    decode_err = crlf_err or rw_err or sep_err0 or sep_err1 or any(addr_err) or any(wrdata_err)
+    checks = [(wr_size_err,10), (rw_err,11), (sep_err0,20), (sep_err1,21), (crlf_err,22)] + \
+             [(addr_err[k],30+k) for k in range(8)] + [(wrdata_err[k],40+k) for k in range(8)]
+  else:
+    decode_err = crlf_err or rw_err or sep_err0 or any(addr_err)
+    checks = [(rd_size_err,10), (rw_err,11), (sep_err0,20), (crlf_err,22)] + \
+             [(addr_err[k],30+k) for k in range(8)]
+  err_code = 0
+  for err, code in checks:
+    if err:
+      err_code = code
+      break
+  return kind, addr, wrdata, decode_err, err_code
+
+
+###############################################################################
+# COMMCTRL model
+###############################################################################
+
+class CommctrlModel(object):
+  """
+  Byte-in, byte-out model of the COMMCTRL UART frontend, decoder and backend.
+  feed() takes received bytes and returns the bytes COMMCTRL would transmit.
+  """
+
+  def __init__(self,space=None):
+    self.space = space if space is not None else AhbSpace()
+    self.ibuf = collections.deque(maxlen=IBUF_SZ)
+    self.ibuf_cnt = 0
+    self.hmsel = 0
+    self.irq_count = 0
+    self.inc_addr = 0                             # address after the last AHB transfer, failed or not
+    self.count = collections.Counter()
+
+  def _execute(self,out):
+    ibuf = bytes(self.ibuf)[-self.ibuf_cnt:] if 0 < self.ibuf_cnt <= IBUF_SZ else bytes(self.ibuf_cnt)
+    kind, addr, wrdata, decode_err, err_code = decode(ibuf)
+    we = kind in ('W','I')
+    if decode_err:
+      self.count['decode_error'] += 1
+      out += b'DECODE_ERROR: %02d\r\n' % err_code
+    elif kind == 'I' and self.hmsel == 0:
+      self._transfer(out,True,self.inc_addr,wrdata,1)
+    elif kind == 'I':
+      return
+    elif addr == HMSEL_ADDR:
+      if we:
+        self.hmsel = wrdata & 3
+      else:
+        out += b'HMSEL: %d\r\n' % self.hmsel
+    elif addr == IRQ_ADDR:
+      if we:
+        self.irq_count += wrdata & 1
+    elif self.hmsel == 0:
+      self._transfer(out,we,addr,wrdata,max(wrdata,1) if kind == 'B' else 1)
+    else:
+      return        # backend stays IDLE, so the instruction count is never cleared
+    self.ibuf_cnt = 0
+
+  def _transfer(self,out,we,addr,wrdata,n):
+    # n AHB transfers from addr (n > 1 for a burst read), stopping at an error
+    if n > 1:
+      self.count['burst'] += 1
+    try:
+      for i in range(n):
+        if we:
+          self.count['write'] += 1
+          self.space.write(addr,wrdata)
+        else:
+          self.count['read'] += 1
+          out += b'HRDATA: 0x%08X\r\n' % self.space.read(addr)
+        addr = (addr + 4) & 0xFFFFFFFF
+        self.inc_addr = addr
+    except AhbSlaveError:
+      self.count['ahb_error'] += 1
+      out += b'AHB_ERROR: HADDR=0x%08X\r\n' % addr
+      self.inc_addr = (addr + 4) & 0xFFFFFFFF     # the RTL steps past the failed transfer too
+
+  def feed(self,data):
+    """ Process received bytes, returning the transmitted bytes (echo and responses). """
+    out = bytearray()
+    for x in bytearray(data):
+      out.append(x)                               # echo
+      self.ibuf.append(x)
+      self.ibuf_cnt = (self.ibuf_cnt + 1) & 0x1F
+      if x == 0x0A:
+        self._execute(out)
+    return bytes(out)
+
+
+###############################################################################
+# Ports
+###############################################################################
+
+def byte_time(baud):
+  """ Seconds to transfer one byte on the link. """
+  return BITS_PER_BYTE / float(baud) if baud else 0.0
+
+
+class ModelPort(object):
+  """
+  In-process port connected straight to a model, for use with the host drivers.
+  If baud is given, reads are delayed to the time the bytes would arrive.
+  """
+
+  def __init__(self,model,baud=None):
+    self.model = model
+    self.t_byte = byte_time(baud)
+    self._rx = bytearray()
+    self._due = []                                # arrival time of each chunk in _rx
+    self._t_rx = 0.0
+    self._t_tx = 0.0
+
+  @property
+  def in_waiting(self):
+    return len(self._rx)
+
+  def write(self,data):
+    now = time.time()
+    self._t_rx = max(self._t_rx,now) + len(data) * self.t_byte
+    out = self.model.feed(data)
+    self._t_tx = max(self._t_tx,now + self.t_byte) + len(out) * self.t_byte
+    self._rx += out
+    self._due.append((self._t_tx,len(self._rx)))
+    return len(data)
+
+  def read(self,size=1):
+    if self.t_byte:
+      avail = 0
+      now = time.time()
+      for t, n in self._due:
+        if t > now:
+          break
+        avail = n
+      if avail == 0 and self._due:
+        time.sleep(max(self._due[0][0] - now,0))
+        avail = self._due[0][1]
+      size = min(size,avail)
+    data = bytes(self._rx[:size])
+    del self._rx[:size]
+    self._due = [(t, n - size) for t, n in self._due if n - size > 0]
+    return data
+
+
+class ModelServer(threading.Thread):
+  """
+  Serves a model on a file descriptor (pty master or socket) in a background thread,
+  pacing input and output at the given baud rate.
+  """
+
+  def __init__(self,model,fd,baud=None,chunk=64):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self.model = model
+    self.fd = fd
+    self.t_byte = byte_time(baud)
+    self.chunk = chunk
+    self.running = True
+
+  def run(self):
+    t_rx = t_tx = time.time()
+    while self.running:
+      if not select.select([self.fd],[],[],0.1)[0]:
+        continue
+      try:
+        data = os.read(self.fd,self.chunk)
+      except OSError:           # pty closed by the host
+        break
+      if not data:
+        break
+      now = time.time()
+      t_rx = max(t_rx,now) + len(data) * self.t_byte
+      out = self.model.feed(data)
+      t_tx = max(t_tx,t_rx - (len(data) - 1) * self.t_byte) + len(out) * self.t_byte
+      delay = max(t_rx,t_tx) - time.time()
+      if delay > 0:
+        time.sleep(delay)
+      os.write(self.fd,out)
+
+  def stop(self):
+    self.running = False
+
+
+def serve_pty(model,baud=None):
+  """ Serve a model on a new pseudo-terminal.  Returns (server, slave device name). """
+  import tty
+  master, slave = os.openpty()
+  tty.setraw(slave)
+  server = ModelServer(model,master,baud)
+  server.start()
+  return server, os.ttyname(slave)
+
+
+def serve_socketpair(model,baud=None,timeout=0.01):
+  """ Serve a model on one end of a socket pair.  Returns (server, host port). """
+  a, b = socket.socketpair()
+  server = ModelServer(model,a.fileno(),baud)
+  server.sock = a
+  server.start()
+  port = FdPort(b.fileno(),timeout)
+  port.sock = b
+  return server, port
+
+
+###############################################################################
+#
+###############################################################################
+
+def parse_num(s):
+  """ Parse a number as in the VGEN memory map CSV: hex (0x) or decimal, with an optional K/M/G suffix.  Underscores are ignored. """
+  s = s.strip().replace('_','')
+  scale = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}.get(s[-1:].upper(),1)
+  if scale != 1:
+    s = s[:-1]
+  return int(s,0) * scale
+
+
+def parse_region(text):
+  """ Parse BASE:SIZE (hex or decimal, with an optional K/M/G suffix) from the command line. """
+  base, size = text.split(':')
+  return parse_num(base), parse_num(size)
+
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Serve a software model of COMMCTRL on a pseudo-terminal.')
+  parser.add_argument('-m','--ram', action='append', type=parse_region, metavar='BASE:SIZE', help='Map a RAM region (repeatable).')
+  parser.add_argument('-b','--baud', default=0, type=int, help='Pace the link at this baud rate (0 for no delay).')
+  args = parser.parse_args()
+
+  space = AhbSpace()
+  for base, size in args.ram or [(0x00000000,0x10000)]:
+    space.map_ram(base,size)
+  model = CommctrlModel(space)
+  server, name = serve_pty(model,args.baud)
+  print('COMMCTRL model on %s' % name)
+  sys.stdout.flush()
+  try:
+    while server.is_alive():
+      server.join(1)
+  except KeyboardInterrupt:
+    pass
+  print('%s, %d IRQs' % (dict(model.count), model.irq_count))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+# preload.py - $readmemh preload files for AHB_MEM
+#
+# Loading a program through COMMCTRL in simulation costs 25 UART characters
+# per word, i.e. millions of simulated cycles for a modest image.  Instead,
+# the image is converted to a $readmemh file holding the memory words, and a
+# small SystemVerilog hook loads it into the SRAM array at time zero.
+#
+# AHB_MEM is a 2**AW byte memory of 32b words, addressed by HADDR[AW-1:2]
+# relative to its base on the bus, with byte 0 in bits [7:0].  The preload file
+# has one word per line, with an @ word address wherever the image is not
+# contiguous, so $readmemh leaves the rest of the memory untouched.  Images
+# (.bin, .hex, ELF) are read a chunk at a time with image.py, and each chunk is
+# formatted with NumPy, so memory use does not depend on the image size.
+
+import argparse
+import binascii
+import os
+
+import numpy as np
+
+from clot.image import read_image, image_format
+
+
+MEM_AW = 16               # AHB_MEM default: 64KB
+MEM_WIDTH = 32            # bits per memory word
+CHUNK = 1 << 20           # bytes per chunk
+
+
+###############################################################################
+# Memory words
+###############################################################################
+
+def mem_blocks(chunks,nbytes,pad=0):
+  """
+  Turn (addr, data) chunks into (addr, data) blocks aligned to nbytes and a
+  whole number of nbytes long.  Partial words at the edges of a chunk are padded
+  with the pad byte, unless the following chunk continues at the next address.
+  """
+  addr, buf = None, bytearray()
+  for a, data in chunks:
+    if addr is not None and a != addr + len(buf):
+      buf += bytes([pad]) * (-len(buf) % nbytes)
+      yield addr, bytes(buf)
+      addr, buf = None, bytearray()
+    if addr is None:
+      addr = a - a % nbytes
+      buf = bytearray([pad]) * (a - addr)
+    buf += data
+    n = len(buf) - len(buf) % nbytes
+    if n:
+      yield addr, bytes(buf[:n])
+      addr += n
+      del buf[:n]
+  if buf:
+    buf += bytes([pad]) * (-len(buf) % nbytes)
+    yield addr, bytes(buf)
+
+
+def memh_lines(data,nbytes):
+  """ One line of hex per little-endian word of data, most significant digit first. """
+  words = np.frombuffer(data,np.uint8).reshape(-1,nbytes)[:,::-1]
+  digits = np.frombuffer(binascii.hexlify(words.tobytes()),np.uint8).reshape(-1,2*nbytes)
+  lines = np.empty((len(digits),2*nbytes+1),np.uint8)
+  lines[:,:-1] = digits
+  lines[:,-1] = ord('\n')
+  return lines.tobytes()
+
+
+def clip_blocks(blocks,lo,hi,stats):
+  """ Drop the parts of (addr, data) blocks outside [lo, hi), counting the dropped bytes in stats. """
+  for addr, data in blocks:
+    start, end = max(addr,lo), min(addr + len(data),hi)
+    stats['clipped'] += len(data) - max(end - start,0)
+    if start < end:
+      yield start, data[start-addr:end-addr]
+
+
+###############################################################################
+# Preload file and hook
+###############################################################################
+
+def write_memh(fo,chunks,mem_base=0,aw=MEM_AW,width=MEM_WIDTH,pad=0,clip=False):
+  """
+  Write (addr, data) chunks to fo as a $readmemh file for a memory of 2**aw
+  bytes at mem_base on the bus, with width bit words.
+  Data outside the memory is an error, or is dropped if clip.
+  Returns a dict of statistics.
+  """
+  assert width % 8 == 0, 'Memory width must be a whole number of bytes: %d' % width
+  nbytes = width // 8
+  size = 1 << aw
+  stats = {'words': 0, 'ranges': 0, 'clipped': 0, 'lo': None, 'hi': None}
+  blocks = mem_blocks(chunks,nbytes,pad)
+  if clip:
+    blocks = clip_blocks(blocks,mem_base,mem_base + size,stats)
+  nxt = None
+  for addr, data in blocks:
+    assert mem_base <= addr and addr + len(data) <= mem_base + size, \
+      'Image data at 0x%X-0x%X is outside the memory at 0x%X-0x%X' % (addr, addr + len(data) - 1, mem_base, mem_base + size - 1)
+    if addr != nxt:
+      fo.write(b'@%x\n' % ((addr - mem_base) // nbytes))
+      stats['ranges'] += 1
+    fo.write(memh_lines(data,nbytes))
+    nxt = addr + len(data)
+    stats['words'] += len(data) // nbytes
+    stats['lo'] = addr if stats['lo'] is None else min(stats['lo'],addr)
+    stats['hi'] = nxt if stats['hi'] is None else max(stats['hi'],nxt)
+  return stats
+
+
+def preload_hook(name,memh_file,mem_path,stats=None):
+  """
+  SystemVerilog to include in the testbench: loads memh_file into the array at
+  the hierarchical path mem_path at time zero, unless +<NAME>_PRELOAD=<file>
+  names another file.
+  """
+  plusarg = name.upper() + '_PRELOAD'
+  l = '// %s - $readmemh preload of %s\n' % (name + '_preload.svh', memh_file)
+  l += '// Generated by clot/preload.py'
+  if stats and stats['words']:
+    l += ': %d words at 0x%X-0x%X' % (stats['words'], stats['lo'], stats['hi'] - 1)
+  l += '\n//\n'
+  l += '// Include inside the testbench module.  Run with +%s=<file> to load another file.\n\n' % plusarg
+  l += 'initial begin : u_%s_preload\n' % name
+  l += '  string file;\n'
+  l += '  file = "%s";\n' % memh_file
+  l += '  void\'($value$plusargs("%s=%%s", file));\n' % plusarg
+  l += '  #0;  // after the memory model initializes its array\n'
+  l += '  $display("%%t: Preloading %%s into %s", $time, file);\n' % mem_path
+  l += '  $readmemh(file, %s);\n' % mem_path
+  l += 'end\n'
+  return l
+
+
+def preload(image,out,fmt=None,base=0,mem_base=0,aw=MEM_AW,width=MEM_WIDTH,pad=0,clip=False,mem_path=None,name=None,chunk=CHUNK):
+  """
+  Convert an image file to the $readmemh file out, and if mem_path is given
+  write the hook <name>_preload.svh next to it.  Returns the statistics of write_memh().
+  """
+  fmt = fmt or image_format(image)
+  with open(out,'wb') as fo:
+    stats = write_memh(fo,read_image(image,fmt,base,chunk),mem_base,aw,width,pad,clip)
+  if mem_path:
+    name = name or os.path.splitext(os.path.basename(out))[0]
+    hook = os.path.join(os.path.dirname(out),name + '_preload.svh')
+    with open(hook,'w') as fo:
+      fo.write(preload_hook(name,os.path.basename(out),mem_path,stats))
+    stats['hook'] = hook
+  return stats
+
+
+###############################################################################
+#
+###############################################################################
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Convert a memory image (.bin, .hex, ELF) to a $readmemh preload file for AHB_MEM.')
+  parser.add_argument('image', help='Image file.')
+  parser.add_argument('-o','--output', required=True, help='$readmemh file to write.')
+  parser.add_argument('--format', choices=['bin','ihex','memh','elf'], help='Image format (default: from file).')
+  parser.add_argument('--base', default='0', help='Load address for .bin and $readmemh images.')
+  parser.add_argument('--mem-base', default='0', help='Bus address of the memory.')
+  parser.add_argument('--aw', default=MEM_AW, type=int, help='Address width of the memory (AHB_MEM AW parameter), 2**AW bytes.')
+  parser.add_argument('--width', default=MEM_WIDTH, type=int, help='Bits per memory word.')
+  parser.add_argument('--pad', default='0', help='Byte value for partial words.')
+  parser.add_argument('--clip', action='store_true', help='Drop image data outside the memory instead of failing.')
+  parser.add_argument('--hook', metavar='PATH', help='Write a SystemVerilog preload hook for the memory array at this hierarchical path, e.g. tb.uTOP.u_mem.u_64kb_sram.mem.')
+  parser.add_argument('--name', help='Name of the hook and of its plusarg (default: from the output file).')
+  args = parser.parse_args()
+
+  s = preload(args.image,args.output,args.format,int(args.base,0),int(args.mem_base,0),args.aw,args.width,
+    int(args.pad,0),args.clip,args.hook,args.name)
+  l = 'Wrote %d %db words (%d contiguous) to %s' % (s['words'], args.width, s['ranges'], args.output)
+  if s['clipped']:
+    l += ', %d bytes outside the memory dropped' % s['clipped']
+  print(l)
+  if 'hook' in s:
+    print('Wrote preload hook %s' % s['hook'])
+
+
+if __name__ == "__main__":
+  main()
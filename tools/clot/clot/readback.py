@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# readback.py - Bulk memory readback into NumPy arrays
+#
+# Reading a buffer word by word through the driver parses every response in
+# Python.  For bulk reads, the receive stream has a fixed shape that can be
+# parsed with NumPy instead: COMMCTRL echoes the read instructions we sent,
+# which only contain 'R 0x', upper case hex digits and CR/LF, so every 'H' in
+# the stream starts a 20-byte 'HRDATA: 0x########<CR><LF>' response.  A block of
+# reads is sent (pipelined, within the driver's window), the raw stream is
+# collected into a preallocated buffer, and responses are located and
+# hex-decoded a whole chunk at a time, straight into the output array.
+#
+# The output can be an np.memmap, e.g. a .npy file opened with open_memmap, so
+# dumps of any size are read in constant memory.  Error responses contain '_',
+# which never appears otherwise; if one is seen, the block is replayed through
+# the Link state machine (commctrl.py) so the error is reported exactly.
+
+import argparse
+import time
+
+import numpy as np
+
+from clot.commctrl import Commctrl, Link, Transaction, CommctrlTimeout, ProtocolError, READ_LEN, \
+                          HMSEL_ADDR, IRQ_ADDR, add_port_arguments, open_port
+
+
+HRDATA_LEN = 20           # HRDATA: 0x########<CR><LF>
+BLOCK = 4096              # words per block
+
+_PREFIX = np.frombuffer(b'HRDATA: 0x',np.uint8)
+_SHIFTS = np.arange(28,-1,-4,dtype=np.uint32)
+_HEXCHR = np.frombuffer(b'0123456789ABCDEF',np.uint8)
+_HEXVAL = np.full(256,0xFF,np.uint8)
+_HEXVAL[_HEXCHR] = np.arange(16)
+
+
+###############################################################################
+# Vectorized encode and decode
+###############################################################################
+
+def encode_reads(addrs):
+  """ Encode read instructions for an array of addresses, as one bytes string. """
+  addrs = np.asarray(addrs,np.uint32)
+  out = np.empty((len(addrs),READ_LEN),np.uint8)
+  out[:] = np.frombuffer(b'R 0x00000000\r\n',np.uint8)
+  out[:,4:12] = _HEXCHR[(addrs[:,None] >> _SHIFTS) & 0xF]
+  return out.tobytes()
+
+
+def decode_hex(raw,starts):
+  """
+  Decode the 8 hex digits at each of starts in the uint8 array raw.
+  Returns (values, ok) where ok is False if any character is not a hex digit.
+  """
+  nib = _HEXVAL[raw[starts[:,None] + np.arange(8)]]
+  ok = not (nib > 0xF).any()
+  return (nib.astype(np.uint32) << _SHIFTS).sum(axis=1,dtype=np.uint32), ok
+
+
+###############################################################################
+# Readback
+###############################################################################
+
+class _Fallback(Exception):
+  pass
+
+
+def _read_block(cc,addr,out):
+  """ Read len(out) consecutive words from addr into out. """
+  k = len(out)
+  cmds = encode_reads(addr + 4 * np.arange(k,dtype=np.uint64))
+  raw = np.empty(k * (READ_LEN + HRDATA_LEN),np.uint8)
+  end = 0                                 # bytes received
+  pos = 0                                 # parse position
+  sent = 0                                # bytes sent
+  done = 0                                # responses decoded
+  partial = 0                             # bytes of an incomplete response at the end of raw
+  extra = b''                             # data not yet copied to raw when falling back
+  t_last = time.time()
+  try:
+    while end < len(raw):
+      echo = end - done * HRDATA_LEN - partial
+      n = min((cc.window - (sent - echo)) // READ_LEN,(len(cmds) - sent) // READ_LEN)
+      if n > 0:
+        cc.port.write(cmds[sent:sent + n * READ_LEN])
+        sent += n * READ_LEN
+      data = cc.port.read(getattr(cc.port,'in_waiting',0) or 1)
+      if not data:
+        if time.time() - t_last > cc.timeout:
+          raise CommctrlTimeout('No response from COMMCTRL (%d bytes in flight)' % (sent - echo))
+        continue
+      t_last = time.time()
+      if b'_' in data or end + len(data) > len(raw):
+        extra = data
+        raise _Fallback()
+      raw[end:end + len(data)] = np.frombuffer(data,np.uint8)
+      end += len(data)
+
+      # Decode the complete responses received so far
+      starts = np.flatnonzero(raw[pos:end] == 0x48) + pos      # 'H'
+      complete = starts[starts + HRDATA_LEN <= end]
+      if len(complete):
+        head = raw[complete[:,None] + np.arange(len(_PREFIX))]
+        if (head != _PREFIX).any() or (raw[complete + HRDATA_LEN - 1] != 0x0A).any():
+          raise _Fallback()
+        values, ok = decode_hex(raw,complete + len(_PREFIX))
+        if not ok:
+          raise _Fallback()
+        out[done:done + len(values)] = values
+        done += len(values)
+      if len(complete) < len(starts):
+        pos = starts[len(complete)]
+        partial = end - pos
+      else:
+        pos = end
+        partial = 0
+    if done != k:
+      raise ProtocolError('%d responses for %d reads' % (done, k))
+  except _Fallback:
+    _replay(cc,addr,sent // READ_LEN,bytes(raw[:end]) + extra,t_last)
+    raise ProtocolError('Unexpected response stream from 0x%08X' % addr)
+  finally:
+    cc.link.tx_bytes += sent
+    cc.link.echo_bytes += sent
+    cc.link.rx_bytes += end
+    cc.count['R'] += sent // READ_LEN
+
+
+def _replay(cc,addr,n,raw,t_last):
+  # Parse the stream of the block with the Link, read the rest of it, and raise the first error
+  link = Link()
+  txns = [Transaction('R',addr + 4*i) for i in range(n)]
+  for txn in txns:
+    link.submit(txn)
+  link.feed(raw)
+  while not txns[-1].done:
+    data = cc.port.read(getattr(cc.port,'in_waiting',0) or 1)
+    if data:
+      t_last = time.time()
+      link.feed(data)
+    elif time.time() - t_last > cc.timeout:
+      raise CommctrlTimeout('No response from COMMCTRL (%d bytes in flight)' % link.in_flight())
+  for txn in txns:
+    if txn.error is not None:
+      raise txn.error
+
+
+def read_into(cc,base,out,block=BLOCK,progress=None):
+  """
+  Read len(out) consecutive 32b words from base into out, a preallocated
+  uint32 array (or np.memmap), a block at a time.
+  """
+  end = base + 4 * len(out)
+  assert not (base <= HMSEL_ADDR < end or base <= IRQ_ADDR < end), \
+    'Range 0x%08X-0x%08X includes the COMMCTRL registers' % (base, end)
+  cc.flush()
+  for i in range(0,len(out),block):
+    _read_block(cc,base + 4*i,out[i:i + block])
+    if progress:
+      progress.update(4 * len(out[i:i + block]))
+  return out
+
+
+def read_array(cc,base,nwords,block=BLOCK,progress=None):
+  """ Read nwords from base into a new uint32 array. """
+  return read_into(cc,base,np.empty(nwords,np.uint32),block,progress)
+
+
+def read_npy(cc,base,nwords,path,block=BLOCK,progress=None):
+  """ Read nwords from base into a new .npy file, memory-mapped.  Returns the memmap. """
+  out = np.lib.format.open_memmap(path,mode='w+',dtype='<u4',shape=(nwords,))
+  read_into(cc,base,out,block,progress)
+  out.flush()
+  return out
+
+
+###############################################################################
+#
+###############################################################################
+
+def main():
+
+  from clot.loader import Progress
+
+  parser = argparse.ArgumentParser(description='Read back memory through COMMCTRL into a .npy file.')
+  add_port_arguments(parser)
+  parser.add_argument('base', help='Start address.')
+  parser.add_argument('size', help='Number of bytes.')
+  parser.add_argument('-o','--output', required=True, help='Output .npy file (uint32 words).')
+  parser.add_argument('--block', default=BLOCK, type=int, help='Words per block.')
+  args = parser.parse_args()
+
+  cc = Commctrl(open_port(args))
+  nwords = int(args.size,0) // 4
+  p = Progress('Read',4 * nwords)
+  read_npy(cc,int(args.base,0),nwords,args.output,args.block,p)
+  p.finish()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+
+# scan.py - Scan chain vectors for the COMMCTRL scan frontend
+#
+# COMMCTRL can take its AHB transfers from the scan chain in scanfront.sv
+# instead of the UART (FESEL = 1).  A transfer is a 101-bit vector shifted in
+# with SCEN high, started by SCEN falling (if AHBXFER is set), and its result
+# (RDDATA, HMSEL, AHBERR) is captured into the chain by a clock with SCEN low,
+# to be shifted out while the next vector is shifted in.
+#
+# Chains are described by a CSV in the VGEN style: a header line, then one row
+# per field with name, nbits, start (cell) and optionally access and desc.
+# Field values are packed into and unpacked from (vectors, cells) bit arrays
+# with NumPy, and whole blocks of vectors are turned into the pin states of a
+# synchronous bit-bang adapter (one byte written and sampled per state), so no
+# Python code runs per bit.  Vectors are streamed a block at a time, so pattern
+# sets of any length use constant memory.
+#
+# The scan cells are assumed to be LSSD cells: SCLK1 with SCEN high shifts
+# SHIFTIN into cell 0, SCLK1 with SCEN low captures the internal data, and
+# SCLK2 updates the outputs.  SHIFTOUT is the last cell.
+
+import argparse
+import collections
+import csv
+import os
+import sys
+import time
+
+import numpy as np
+
+from clot.commctrl import HMSEL_ADDR
+from clot.model import AhbSpace, AhbSlaveError, parse_region
+
+
+# Bit-bang adapter pins: bit of each byte written to and sampled from the adapter
+PIN_SCLK1 = 0x01
+PIN_SCLK2 = 0x02
+PIN_SHIFTIN = 0x04
+PIN_SCEN = 0x08
+PIN_SHIFTOUT = 0x10
+PINS_OUT = PIN_SCLK1 | PIN_SCLK2 | PIN_SHIFTIN | PIN_SCEN
+
+STATES_PER_BIT = 4        # data, SCLK1, data, SCLK2
+WAIT = 16                 # states with SCEN low for the AHB transfer, before the capture
+BLOCK = 4096              # vectors per block
+
+SCANFRONT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)),'scanfront.csv')
+
+
+###############################################################################
+# Chains
+###############################################################################
+
+Field = collections.namedtuple('Field','name start nbits access desc')
+
+
+class ScanChain(object):
+  """ Fields of a scan chain, by cell.  Cell 0 is next to the scan input. """
+
+  def __init__(self,name,fields,length=None):
+    self.name = name
+    self.fields = sorted(fields,key=lambda f: f.start)
+    self.length = length or max(f.start + f.nbits for f in self.fields)
+    self.index = dict((f.name,f) for f in self.fields)
+    assert len(self.index) == len(self.fields), 'Duplicate field names in chain %s' % name
+    end = 0
+    for f in self.fields:
+      assert 0 < f.nbits <= 64, 'Field %s: nbits must be 1 to 64: %d' % (f.name, f.nbits)
+      assert f.start >= end, 'Field %s overlaps the previous field in chain %s' % (f.name, name)
+      end = f.start + f.nbits
+    assert end <= self.length, 'Chain %s has %d cells, fields need %d' % (name, self.length, end)
+
+  def pack(self,values,n=None):
+    """
+    Bits of n vectors as an (n, length) uint8 array, cell 0 first.  values maps
+    field names to a value, or an array of one value per vector; missing fields are 0.
+    The fields are shifted into 64-cell words, then expanded to bits in one pass.
+    """
+    arrays = dict((name,np.asarray(v,dtype=np.uint64)) for name, v in values.items())
+    if n is None:
+      n = max([a.size for a in arrays.values() if a.ndim] or [1])
+    words = np.zeros((n,(self.length + 63) // 64),'<u8')
+    for name, a in arrays.items():
+      f = self.index[name]
+      a = np.broadcast_to(a,(n,)) & np.uint64((1 << f.nbits) - 1)
+      k, shift = divmod(f.start,64)
+      words[:,k] |= a << np.uint64(shift)
+      if shift + f.nbits > 64:
+        words[:,k+1] |= a >> np.uint64(64 - shift)
+    return np.unpackbits(words.view(np.uint8),axis=1,count=self.length,bitorder='little')
+
+  def unpack(self,bits,names=None):
+    """ Field values of an (n, length) bit array, as a dict of uint64 arrays. """
+    bits = np.asarray(bits)
+    packed = np.zeros((len(bits),8 * ((self.length + 63) // 64)),np.uint8)
+    packed[:,:(self.length + 7) // 8] = np.packbits(bits,axis=1,bitorder='little')
+    words = packed.view('<u8')
+    values = {}
+    for f in self.fields:
+      if names is None or f.name in names:
+        k, shift = divmod(f.start,64)
+        v = words[:,k] >> np.uint64(shift)
+        if shift + f.nbits > 64:
+          v = v | (words[:,k+1] << np.uint64(64 - shift))
+        values[f.name] = (v & np.uint64((1 << f.nbits) - 1)).astype(np.uint64)
+    return values
+
+
+def read_chain(path,name=None):
+  """
+  Read a chain from a CSV with a header line, then one row per field: name,
+  nbits, start, and optionally access (in, out or inout) and desc.  Blank lines
+  and lines starting with # are ignored, as in VGEN.
+  """
+  fields = []
+  with open(path,'r') as fi:
+    reader = csv.reader(fi)
+    header = [x.strip() for x in next(reader)]
+    for row in reader:
+      if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+        continue
+      d = dict(zip(header,[x.strip() for x in row]))
+      fields.append(Field(d['name'],int(d['start'],0),int(d['nbits'],0),d.get('access') or 'inout',d.get('desc','')))
+  return ScanChain(name or os.path.splitext(os.path.basename(path))[0],fields)
+
+
+###############################################################################
+# Pin states
+###############################################################################
+
+def encode_frames(bits,wait=WAIT):
+  """
+  Pin states to shift in each vector of an (n, length) bit array and run it.
+  Each vector is a frame: SCEN high and STATES_PER_BIT states per bit, last cell
+  first, then SCEN low (starting the transfer) for wait states, then a capture
+  pulse.  Returns an (n, frame length) uint8 array.
+  """
+  n, length = bits.shape
+  shift = np.repeat(bits[:,::-1] * np.uint8(PIN_SHIFTIN) | np.uint8(PIN_SCEN),STATES_PER_BIT,axis=1).reshape(n,length,STATES_PER_BIT)
+  shift[:,:,1] |= PIN_SCLK1
+  shift[:,:,3] |= PIN_SCLK2
+  tail = np.zeros(wait + 4,np.uint8)
+  tail[wait] = PIN_SCLK1
+  tail[wait + 2] = PIN_SCLK2
+  return np.concatenate([shift.reshape(n,-1),np.broadcast_to(tail,(n,len(tail)))],axis=1)
+
+
+def decode_frames(states,length):
+  """ The chain shifted out during each frame of sampled pin states, as an (n, length) bit array, cell 0 first. """
+  out = (states[:,0:STATES_PER_BIT*length:STATES_PER_BIT] & PIN_SHIFTOUT) != 0
+  return out[:,::-1].astype(np.uint8)
+
+
+###############################################################################
+# Driver
+###############################################################################
+
+class ScanDriver(object):
+  """
+  Streams vectors through a chain over a synchronous bit-bang port: write(data)
+  drives the pins with one state per byte, and read(size) returns the pins
+  sampled at each state, one byte per byte written.
+  """
+
+  def __init__(self,port,chain,wait=WAIT):
+    self.port = port
+    self.chain = chain
+    self.wait = wait
+    self.vectors = 0
+    self.states = 0
+
+  def shift(self,bits):
+    """
+    Shift in an (n, length) bit array, one frame per vector.  Returns the chain
+    shifted out before each vector, i.e. as captured after the previous one.
+    """
+    states = encode_frames(bits,self.wait)
+    self.port.write(states.tobytes())
+    buf = bytearray()
+    while len(buf) < states.size:
+      data = self.port.read(states.size - len(buf))
+      assert data, 'Bit-bang port returned %d of %d samples' % (len(buf), states.size)
+      buf += data
+    self.vectors += len(bits)
+    self.states += states.size
+    return decode_frames(np.frombuffer(bytes(buf),np.uint8).reshape(states.shape),self.chain.length)
+
+  def run(self,blocks):
+    """
+    Shift an iterable of (n, length) bit arrays.  Yields, for each array, the
+    chain as captured after each of its vectors.  The capture of a vector comes
+    out with the next one, so an idle vector (all zero) is shifted in at the end.
+    """
+    pending = None
+    for bits in blocks:
+      out = self.shift(bits)
+      if pending is not None:
+        yield np.concatenate([pending,out[:1]])
+      pending = out[1:]
+    if pending is not None:
+      yield np.concatenate([pending,self.shift(np.zeros((1,self.chain.length),np.uint8))])
+
+
+class FtdiPort(object):
+  """ FTDI adapter in synchronous bit-bang mode, with pyftdi. """
+
+  def __init__(self,url,frequency=1e6):
+    from pyftdi.ftdi import Ftdi
+    self.ftdi = Ftdi()
+    self.ftdi.open_bitbang_from_url(url,direction=PINS_OUT,baudrate=int(frequency),sync=True)
+
+  def write(self,data):
+    return self.ftdi.write_data(data)
+
+  def read(self,size=1):
+    return self.ftdi.read_data_bytes(size,attempt=16)
+
+
+###############################################################################
+# Model
+###############################################################################
+
+class ScanfrontModel(object):
+  """
+  Pin-level model of the scanfront chain and the backend, as a bit-bang port.
+  SCLK1 rising with SCEN high shifts the chain, with SCEN low it captures
+  AHBERR, HMSEL and RDDATA.  SCEN rising clears them (scanxfer), and SCEN
+  falling with AHBXFER set runs the transfer on the address space.  Samples
+  show SHIFTOUT before the state they are taken in.  Runs of shifts are handled
+  with NumPy, so the model costs a few array operations per vector.
+  """
+
+  LENGTH = 101
+
+  def __init__(self,space=None):
+    self.space = space if space is not None else AhbSpace()
+    self.cells = np.zeros(self.LENGTH,np.uint8)
+    self.pins = 0
+    self.hmsel = 0
+    self.hmsel_scan = self.rddata_scan = self.ahberr_scan = 0
+    self.count = collections.Counter()
+    self._rx = bytearray()
+
+  def _field(self,start,nbits):
+    return int.from_bytes(np.packbits(self.cells[start:start+nbits],bitorder='little').tobytes(),'little')
+
+  def _set_field(self,start,nbits,value):
+    self.cells[start:start+nbits] = (value >> np.arange(nbits)) & 1
+
+  def _transfer(self):
+    we, addr, wrdata = self.cells[1], self._field(2,32), self._field(34,32)
+    if addr == HMSEL_ADDR:
+      if we:
+        self.hmsel = wrdata & 3
+      else:
+        self.hmsel_scan = self.hmsel
+    elif self.hmsel == 0:
+      try:
+        if we:
+          self.count['write'] += 1
+          self.space.write(addr,wrdata)
+        else:
+          self.count['read'] += 1
+          self.rddata_scan = self.space.read(addr)
+      except AhbSlaveError:
+        self.count['ahb_error'] += 1
+        self.ahberr_scan = 1
+
+  def _event(self,pins,prev):
+    if pins & PIN_SCEN and not prev & PIN_SCEN:           # scanxfer
+      self.hmsel_scan = self.rddata_scan = self.ahberr_scan = 0
+    elif prev & PIN_SCEN and not pins & PIN_SCEN and self.cells[0]:
+      self._transfer()
+    if pins & PIN_SCLK1 and not prev & PIN_SCLK1 and not pins & PIN_SCEN:
+      self._set_field(66,32,self.rddata_scan)
+      self._set_field(98,2,self.hmsel_scan)
+      self.cells[100] = self.ahberr_scan
+
+  def write(self,data):
+    s = np.frombuffer(bytes(data),np.uint8)
+    prev = np.concatenate([[self.pins],s[:-1]]).astype(np.uint8)
+    rise1 = (s & PIN_SCLK1 != 0) & (prev & PIN_SCLK1 == 0)
+    scen = s & PIN_SCEN != 0
+    shifts = rise1 & scen
+    events = np.flatnonzero((rise1 & ~scen) | (scen != (prev & PIN_SCEN != 0)))
+    out = np.zeros(len(s),np.uint8)
+    is_event = np.zeros(len(s) + 1,bool)
+    is_event[events] = True
+    bounds = np.concatenate([[0],events,[len(s)]])
+    for a, b in zip(bounds[:-1],bounds[1:]):
+      if a < b and is_event[a]:
+        self._event(int(s[a]),int(prev[a]))
+      e = np.flatnonzero(shifts[a:b])
+      # SHIFTOUT after m shifts is old cell length-1-m, then the shifted-in bits in order
+      seq = np.concatenate([self.cells[::-1],(s[a:b][e] & PIN_SHIFTIN != 0).astype(np.uint8)])
+      m = np.cumsum(shifts[a:b]) - shifts[a:b]
+      out[a:b] = seq[m] * PIN_SHIFTOUT
+      k = len(e)
+      self.cells = seq[k:k+self.LENGTH][::-1].copy()
+    if len(s):
+      self.pins = int(s[-1])
+    self._rx += (out | s).tobytes()
+    return len(data)
+
+  def read(self,size=1):
+    data = bytes(self._rx[:size])
+    del self._rx[:size]
+    return data
+
+
+###############################################################################
+# Transactions
+###############################################################################
+
+def ahb_vectors(chain,we,addr,wrdata=0):
+  """ Scanfront vectors for AHB transfers: arrays (or single values) of write enables, addresses and write data. """
+  return chain.pack({'ahbxfer': 1, 'we': we, 'addr': addr, 'wrdata': wrdata},np.broadcast(we,addr,wrdata).size)
+
+
+def read_vectors(path,chain,block=BLOCK):
+  """
+  Stream a CSV of vectors, one per row, with field names in the header line
+  (values in decimal or 0x hex).  Yields (n, length) bit arrays of up to block vectors.
+  """
+  with open(path,'r') as fi:
+    reader = csv.reader(fi)
+    names = [x.strip() for x in next(reader)]
+    rows = []
+    for row in reader:
+      if row and row[0].strip() and not row[0].lstrip().startswith('#'):
+        rows.append([int(x,0) for x in row])
+      if len(rows) == block:
+        yield chain.pack(dict(zip(names,np.array(rows,dtype=np.uint64).T)))
+        rows = []
+    if rows:
+      yield chain.pack(dict(zip(names,np.array(rows,dtype=np.uint64).T)))
+
+
+def write_vectors(fo,chain,blocks,names=None):
+  """ Write the field values of (n, length) bit arrays as CSV rows in hex, after a header line. """
+  names = names or [f.name for f in chain.fields]
+  fo.write(','.join(names) + '\n')
+  for bits in blocks:
+    values = chain.unpack(bits,names)
+    for row in zip(*[values[x] for x in names]):
+      fo.write(','.join('0x%X' % x for x in row) + '\n')
+
+
+def selftest(driver,base,nwords,seed=0,block=BLOCK):
+  """
+  Write nwords pseudo-random words from base through the chain, then read them
+  back, a block at a time.  Returns the number of mismatching words and AHB errors.
+  """
+  rng = np.random.default_rng(seed)
+  data = rng.integers(0,1 << 32,nwords,dtype=np.uint64)
+  addrs = base + 4 * np.arange(nwords,dtype=np.uint64)
+  chain = driver.chain
+  blocks = (ahb_vectors(chain,1,addrs[i:i+block],data[i:i+block]) for i in range(0,nwords,block))
+  errors = sum(int(chain.unpack(out,['ahberr'])['ahberr'].sum()) for out in driver.run(blocks))
+  blocks = (ahb_vectors(chain,0,addrs[i:i+block]) for i in range(0,nwords,block))
+  mismatches = 0
+  for i, out in zip(range(0,nwords,block),driver.run(blocks)):
+    values = chain.unpack(out,['rddata','ahberr'])
+    mismatches += int(np.count_nonzero(values['rddata'] != data[i:i+block]))
+    errors += int(values['ahberr'].sum())
+  return mismatches, errors
+
+
+###############################################################################
+#
+###############################################################################
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Drive the COMMCTRL scan chain (or another chain) from a bit-bang adapter.')
+  parser.add_argument('--chain', default=SCANFRONT_CSV, help='Chain description CSV (default: the COMMCTRL scanfront chain).')
+  parser.add_argument('--url', help='pyftdi URL of the bit-bang adapter, e.g. ftdi://ftdi:232h/1.')
+  parser.add_argument('--frequency', default=1e6, type=float, help='Bit-bang state rate of the adapter.')
+  parser.add_argument('--model', action='append', metavar='BASE:SIZE', help='Use the scanfront model with this RAM region instead of an adapter (repeatable).')
+  parser.add_argument('--wait', default=WAIT, type=int, help='States with SCEN low for each transfer.')
+  parser.add_argument('--vectors', help='CSV of vectors to shift, one per row, with field names in the header.')
+  parser.add_argument('-o','--output', help='Write the captured chain after each vector to this CSV (default: stdout).')
+  parser.add_argument('--selftest', metavar='NWORDS', type=int, help='Write and read back NWORDS through the chain.')
+  parser.add_argument('--base', default='0x0', help='Start address for --selftest.')
+  args = parser.parse_args()
+  if not (args.vectors or args.selftest):
+    parser.error('No action specified.  Please specify an action: --vectors or --selftest')
+
+  chain = read_chain(args.chain)
+  if args.model:
+    space = AhbSpace()
+    for text in args.model:
+      space.map_ram(*parse_region(text))
+    port = ScanfrontModel(space)
+  elif args.url:
+    port = FtdiPort(args.url,args.frequency)
+  else:
+    raise SystemExit('No port specified.  Please specify --url or --model')
+  driver = ScanDriver(port,chain,args.wait)
+
+  t = time.time()
+  failed = False
+  if args.vectors:
+    fo = open(args.output,'w') if args.output else sys.stdout
+    write_vectors(fo,chain,driver.run(read_vectors(args.vectors,chain)))
+    if args.output:
+      fo.close()
+  if args.selftest:
+    mismatches, errors = selftest(driver,int(args.base,0),args.selftest)
+    print('Self-test: %d words, %d mismatches, %d AHB errors' % (args.selftest, mismatches, errors))
+    failed = mismatches or errors
+  elapsed = max(time.time() - t,1e-9)
+  sys.stderr.write('%d vectors of %d bits, %d pin states in %.2f s: %.0f vectors/s, %.2f Mstates/s\n' % (driver.vectors,
+    chain.length, driver.states, elapsed, driver.vectors / elapsed, driver.states / elapsed / 1e6))
+  if failed:
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
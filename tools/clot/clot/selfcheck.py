@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+# selfcheck.py - COMMCTRL burst command self-check and bandwidth comparison
+#
+# Writes a generated pattern with single-word W instructions and reads it back
+# with single-word R instructions, then repeats with a different pattern using
+# auto-increment writes (W then I) and burst reads (B).  Every word is checked,
+# and the effective payload bandwidth of each mode is measured and compared.
+#
+# Link bytes per word (8N2, both directions run concurrently):
+#
+#   single write   25 to the chip, 25 back (echo)
+#   I write        14 to the chip, 14 back
+#   single read    14 to the chip, 34 back (echo and HRDATA)
+#   burst read     25/N to the chip, 20 + 25/N back
+#
+# The check fails if any word mismatches, or if a burst mode does not improve
+# on the single-word mode by at least --min-gain.
+
+import argparse
+import random
+import sys
+import time
+
+from clot.commctrl import Commctrl, add_port_arguments, open_port, BURST_WORDS
+
+
+###############################################################################
+# Measurement
+###############################################################################
+
+def pattern(n,seed):
+  """ n pseudo-random words, reproducible from seed. """
+  rng = random.Random(seed)
+  return [rng.getrandbits(32) for i in range(n)]
+
+
+def measure(cc,name,nwords,func):
+  """ Run func() and return a dict of its link bytes, time and payload rate. """
+  cc.flush()
+  tx, rx = cc.link.tx_bytes, cc.link.rx_bytes
+  t = time.time()
+  result = func()
+  cc.flush()
+  elapsed = max(time.time() - t,1e-9)
+  return result, {
+    'name': name,
+    'words': nwords,
+    'tx_bytes': cc.link.tx_bytes - tx,
+    'rx_bytes': cc.link.rx_bytes - rx,
+    'elapsed': elapsed,
+    'payload_rate': 4 * nwords / elapsed,
+  }
+
+
+def selfcheck(cc,base,nwords,seed=0,burst=BURST_WORDS):
+  """
+  Run the four modes on nwords from base.
+  Returns (list of measurement dicts, number of mismatching words).
+  """
+  single, inc = pattern(nwords,seed), pattern(nwords,seed + 1)
+  addrs = [base + 4*i for i in range(nwords)]
+  rows = []
+  _, row = measure(cc,'W (single)',nwords,lambda: cc.write_many(zip(addrs,single)))
+  rows.append(row)
+  actual, row = measure(cc,'R (single)',nwords,lambda: cc.read_many(addrs))
+  rows.append(row)
+  errors = sum(1 for x, y in zip(single,actual) if x != y)
+  _, row = measure(cc,'W+I (auto-increment)',nwords,lambda: cc.write_block(base,inc))
+  rows.append(row)
+  actual, row = measure(cc,'B (burst %d)' % burst,nwords,lambda: cc.read_block(base,nwords,burst))
+  rows.append(row)
+  errors += sum(1 for x, y in zip(inc,actual) if x != y)
+  return rows, errors
+
+
+def report(rows,fo=sys.stdout):
+  fo.write('%-22s %8s %10s %10s %10s %10s\n' % ('Mode', 'Words', 'Tx B/word', 'Rx B/word', 'Time', 'kB/s'))
+  for x in rows:
+    fo.write('%-22s %8d %10.1f %10.1f %9.3fs %10.1f\n' % (x['name'], x['words'], x['tx_bytes'] / float(x['words']),
+      x['rx_bytes'] / float(x['words']), x['elapsed'], x['payload_rate'] / 1e3))
+
+
+###############################################################################
+#
+###############################################################################
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Check the COMMCTRL burst commands and compare their bandwidth with single-word commands.')
+  add_port_arguments(parser)
+  parser.add_argument('--base', default='0x0', help='Start address of the test memory.')
+  parser.add_argument('-n','--words', default=1024, type=int, help='Number of words to transfer in each mode.')
+  parser.add_argument('--burst', default=BURST_WORDS, type=int, help='Words per burst read.')
+  parser.add_argument('--seed', default=0, type=int, help='Seed of the generated patterns.')
+  parser.add_argument('--min-gain', default=1.2, type=float, help='Smallest acceptable speedup of the burst modes.')
+  args = parser.parse_args()
+
+  cc = Commctrl(open_port(args))
+  rows, errors = selfcheck(cc,int(args.base,0),args.words,args.seed,args.burst)
+  report(rows)
+  write_gain = rows[2]['payload_rate'] / rows[0]['payload_rate']
+  read_gain = rows[3]['payload_rate'] / rows[1]['payload_rate']
+  print('Write speedup %.2fx, read speedup %.2fx, %d mismatches' % (write_gain, read_gain, errors))
+  if errors or min(write_gain,read_gain) < args.min_gain:
+    print('FAIL')
+    sys.exit(1)
+  print('PASS')
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+
+# trace.py - Streaming decoder for COMMCTRL UART logs
+#
+# COMMCTRL echoes every byte it receives, so the byte stream it transmits holds
+# both the instructions (as echo) and the responses.  The decoder splits the
+# stream into echo and responses as the driver's Link does, rebuilds each
+# instruction from its echo, decodes it with the same checks as decoder.sv
+# (model.decode), and matches each response to the last instruction received
+# before it.  Every transaction is checked against the response the decoder
+# and backend would give: a DECODE_ERROR with another err_code than expected, a
+# missing or extra response, or a short burst is flagged.
+#
+# Input is processed a chunk at a time and only the last instruction is kept
+# open, so logs of any size are decoded in constant memory.  Statistics are
+# accumulated into fixed size log-scale histograms:
+#
+#   latency     LF of the instruction echoed to the end of its response
+#   gaps        idle time between received chunks
+#   throughput  payload bytes per second of log time
+#
+# Logs are raw byte captures of the COMMCTRL TX line (times are then derived
+# from --baud), or text logs of '<time> rx|tx <hex>' lines as written by
+# LogPort, which can wrap any port (see --log in commctrl.add_port_arguments).
+
+import argparse
+import collections
+import math
+import os
+import re
+import sys
+import time
+
+from clot.commctrl import HMSEL_ADDR, IRQ_ADDR, ERROR_CODES, FdPort, \
+                          _RESPONSE_RE, _RESPONSE_MAXLEN, _could_be_response
+from clot.model import decode, byte_time
+
+
+###############################################################################
+# Histograms
+###############################################################################
+
+class Histogram(object):
+  """ Log-scale histogram of non-negative values, per_octave bins per factor of two above lo. """
+
+  def __init__(self,lo=1e-6,octaves=32,per_octave=4):
+    self.lo = lo
+    self.per_octave = per_octave
+    self.bins = [0] * (octaves * per_octave + 1)   # bins[0] holds values up to lo
+    self.n = 0
+    self.total = 0.0
+    self.min = None
+    self.max = None
+
+  def add(self,x,n=1):
+    if x <= self.lo:
+      i = 0
+    else:
+      i = min(int(math.log2(x / self.lo) * self.per_octave) + 1,len(self.bins) - 1)
+    self.bins[i] += n
+    self.n += n
+    self.total += x * n
+    self.min = x if self.min is None else min(self.min,x)
+    self.max = x if self.max is None else max(self.max,x)
+
+  def edge(self,i):
+    """ Upper edge of bin i. """
+    return self.lo * 2 ** (i / float(self.per_octave))
+
+  def mean(self):
+    return self.total / self.n if self.n else 0.0
+
+  def percentile(self,p):
+    """ Upper edge of the bin holding the p-th fraction of the values (clipped to the maximum). """
+    if not self.n:
+      return 0.0
+    k = p * self.n
+    seen = 0
+    for i, c in enumerate(self.bins):
+      seen += c
+      if c and seen >= k:
+        return min(self.edge(i),self.max)
+    return self.max
+
+  def rows(self):
+    """ (low edge, high edge, count) of each non-empty bin. """
+    return [(self.edge(i - 1) if i else 0.0, self.edge(i), c) for i, c in enumerate(self.bins) if c]
+
+
+###############################################################################
+# Decoder
+###############################################################################
+
+# Well formed instructions, decoded without the full checks of model.decode
+_VALID_RE = re.compile(rb'([WwBb]) 0[Xx]([0-9A-F]{8}) 0[Xx]([0-9A-F]{8})\r\n|([RrIi]) 0[Xx]([0-9A-F]{8})\r\n')
+
+
+def _decode(ibuf):
+  m = _VALID_RE.fullmatch(ibuf)
+  if m is None:
+    return decode(ibuf)
+  if m.group(1):
+    return m.group(1).upper().decode(), int(m.group(2),16), int(m.group(3),16), False, 0
+  kind, value = m.group(4).upper().decode(), int(m.group(5),16)
+  return kind, value, value if kind == 'I' else 0, False, 0
+
+
+class TraceTxn(object):
+  """ One instruction rebuilt from the echo, and what COMMCTRL answered. """
+
+  __slots__ = ('kind','addr','data','text','decode_err','err_code','expect','t_start','t_end','t_done',
+               'response','value','words','flags','offset')
+
+  def __init__(self,ibuf,offset,t_start,t_end):
+    self.kind, self.addr, self.data, self.decode_err, self.err_code = _decode(ibuf)
+    self.text = bytes(ibuf).rstrip(b'\r\n').decode('latin-1')
+    self.expect = None            # response expected: 'decode', 'read', 'hmsel', 'burst' or None
+    self.offset = offset          # byte offset of the LF in the log
+    self.t_start = t_start
+    self.t_end = t_end
+    self.t_done = None
+    self.response = None          # 'HRDATA', 'HMSEL', 'DECODE_ERROR', 'AHB_ERROR' or None
+    self.value = None             # read data, HMSEL, err_code or AHB error address
+    self.words = 0                # HRDATA responses received
+    self.flags = []
+
+  def latency(self):
+    if self.t_done is None or self.t_end is None:
+      return None
+    return self.t_done - self.t_end
+
+  def __repr__(self):
+    return self.text
+
+
+class TraceDecoder(object):
+  """
+  Decodes the COMMCTRL transmit stream, fed a chunk at a time.
+  on_txn(txn) is called for every transaction once no more responses can belong to it.
+  """
+
+  def __init__(self,baud=None,on_txn=None,min_gap=None,examples=10):
+    self.t_byte = byte_time(baud)
+    self.on_txn = on_txn
+    self.min_gap = min_gap if min_gap is not None else max(10 * self.t_byte,1e-3)
+    self.examples = examples
+    self.rx_bytes = 0
+    self.tx_bytes = 0
+    self.echo_bytes = 0
+    self.hmsel = 0
+    self.count = collections.Counter()          # transactions per kind
+    self.payload = 0                            # words transferred
+    self.decode_errors = collections.Counter()  # by err_code
+    self.ahb_errors = 0
+    self.anomalies = collections.Counter()      # by reason
+    self.anomaly_examples = []
+    self.latency = collections.defaultdict(Histogram)
+    self.gaps = Histogram()
+    self.throughput = Histogram(lo=1.0)
+    self.t_first = None
+    self.t_last = None
+    self._buf = bytearray()
+    self._base = 0                              # log offset of _buf[0]
+    self._chunks = collections.deque()          # (end offset, time of the last byte) of chunks still in _buf
+    self._line = bytearray()                    # last bytes of the instruction being received
+    self._cnt = 0                               # ibuf_cnt (5 bits)
+    self._t_line = None
+    self._open = None                           # last instruction, may still get responses
+    self._second = None
+    self._second_bytes = 0
+
+  #-------------------------------------------------------------------
+  # Time
+  #-------------------------------------------------------------------
+  def _time(self,offset):
+    for end, t in self._chunks:
+      if offset < end:
+        return None if t is None else t - (end - 1 - offset) * self.t_byte
+    return None
+
+  def _chunk(self,n,t):
+    if t is None and self.t_byte:
+      t = (self.rx_bytes + n) * self.t_byte     # back to back at the baud rate
+    if t is not None:
+      first = t - (n - 1) * self.t_byte
+      if self.t_last is not None:
+        gap = first - self.t_last - self.t_byte
+        if gap > self.min_gap:
+          self.gaps.add(gap)
+      if self.t_first is None:
+        self.t_first = first
+      self.t_last = t
+    self.rx_bytes += n
+    self._chunks.append((self.rx_bytes,t))
+
+  #-------------------------------------------------------------------
+  # Stream
+  #-------------------------------------------------------------------
+  def feed(self,data,t=None):
+    """ Process received bytes; t is the time of the last byte (None: derived from the baud rate). """
+    if not data:
+      return
+    self._chunk(len(data),t)
+    self._buf += data
+    buf = self._buf
+    pos = 0
+    for m in _RESPONSE_RE.finditer(buf):
+      self._echo(buf,pos,m.start())
+      self._response(m)
+      pos = m.end()
+    # Hold back a tail that may be the start of a response
+    keep = len(buf)
+    for i in range(max(pos,len(buf) - _RESPONSE_MAXLEN + 1),len(buf)):
+      if buf[i] in b'HDA' and _could_be_response(buf[i:]):
+        keep = i
+        break
+    self._echo(buf,pos,keep)
+    del buf[:keep]
+    self._base += keep
+    while self._chunks and self._chunks[0][0] <= self._base:
+      self._chunks.popleft()
+
+  def feed_tx(self,data,t=None):
+    """ Bytes sent by the host.  Only counted: the echo already holds the instructions. """
+    self.tx_bytes += len(data)
+
+  def _echo(self,buf,a,b):
+    self.echo_bytes += b - a
+    while a < b:
+      if self._t_line is None:
+        self._t_line = self._time(self._base + a)
+      i = buf.find(b'\n',a,b)
+      end = b if i < 0 else i + 1
+      self._line += buf[a:end]
+      del self._line[:-31]
+      self._cnt = (self._cnt + end - a) & 0x1F
+      a = end
+      if i >= 0:
+        self._instruction(self._base + i)
+
+  def _instruction(self,offset):
+    # A LF ends the instruction: decode the last ibuf_cnt bytes, as decoder.sv does
+    ibuf = bytes(self._line[-self._cnt:]) if self._cnt else b''
+    txn = TraceTxn(ibuf,offset,self._t_line,self._time(offset))
+    self._t_line = None
+    self._close_open()
+    executed = True
+    if txn.decode_err:
+      txn.expect = 'decode'
+    elif txn.kind == 'I':
+      executed = self.hmsel == 0
+    elif txn.addr == HMSEL_ADDR:
+      if txn.kind == 'W':
+        self.hmsel = txn.data & 3
+      else:
+        txn.expect = 'hmsel'
+    elif txn.addr == IRQ_ADDR:
+      pass
+    elif self.hmsel != 0:
+      executed = False
+    elif txn.kind in ('R','B'):
+      txn.expect = 'read' if txn.kind == 'R' else 'burst'
+    if not executed:
+      txn.flags.append('ignored: HMSEL=%d' % self.hmsel)
+    else:
+      self._line = bytearray()                  # sm_done clears ibuf_cnt
+      self._cnt = 0
+    self._open = txn
+
+  def _response(self,m):
+    text = m.group(0)
+    t_done = self._time(self._base + m.end() - 1)
+    txn = self._open
+    if txn is None:
+      self._anomaly('response without instruction',text.decode('latin-1').strip(),self._base + m.start())
+      return
+    if txn.response is not None and not (txn.response == 'HRDATA' and txn.expect == 'burst'):
+      txn.flags.append('extra response: %s' % text.decode('latin-1').strip())
+      return
+    txn.t_done = t_done
+    if m.group(1):
+      txn.response = 'HRDATA'
+      txn.words += 1
+      if txn.words == 1:
+        txn.value = int(text[10:18],16)
+    elif m.group(2):
+      txn.response = 'HMSEL'
+      txn.value = int(text[7:8],16)
+    elif m.group(3):
+      txn.response = 'DECODE_ERROR'
+      txn.value = int(text[14:16])
+    else:
+      txn.response = 'AHB_ERROR'
+      txn.value = int(text[19:27],16)
+
+  def _close_open(self):
+    txn, self._open = self._open, None
+    if txn is None:
+      return
+    self._check(txn)
+    self.count[txn.kind or '?'] += 1
+    if txn.response == 'DECODE_ERROR':
+      self.decode_errors[txn.value] += 1
+    elif txn.response == 'AHB_ERROR':
+      self.ahb_errors += 1
+    elif txn.expect in ('read','burst'):
+      self.payload += txn.words
+    elif txn.kind in ('W','I') and txn.expect is None and not txn.flags:
+      self.payload += 1
+    lat = txn.latency()
+    if lat is not None:
+      self.latency[txn.response].add(lat)
+    self._rate(txn)
+    for reason in txn.flags:
+      self._anomaly(reason,txn.text,txn.offset)
+    if self.on_txn:
+      self.on_txn(txn)
+
+  def _check(self,txn):
+    # Compare the response with the one COMMCTRL should have given
+    r = txn.response
+    if txn.expect == 'decode':
+      if r != 'DECODE_ERROR':
+        txn.flags.append('missing decode error: expected %02d, got %s' % (txn.err_code, r))
+      elif txn.value != txn.err_code:
+        txn.flags.append('err_code mismatch: %02d, expected %02d (%s)' % (txn.value, txn.err_code, ERROR_CODES.get(txn.err_code,'unknown')))
+    elif txn.expect == 'hmsel':
+      if r != 'HMSEL':
+        txn.flags.append('missing HMSEL: got %s' % r)
+    elif txn.expect == 'read':
+      if r not in ('HRDATA','AHB_ERROR'):
+        txn.flags.append('no read response')
+    elif txn.expect == 'burst':
+      n = max(txn.data,1)
+      if r not in ('HRDATA','AHB_ERROR') or (r == 'HRDATA' and txn.words != n):
+        txn.flags.append('short burst: %d of %d words' % (txn.words, n))
+    elif r not in (None,'AHB_ERROR') or (r == 'AHB_ERROR' and txn.kind not in ('W','I')):
+      txn.flags.append('unexpected response: %s' % r)
+
+  def _rate(self,txn):
+    # Payload bytes in each second of log time, into the throughput histogram
+    if txn.t_end is None:
+      return
+    second = int(txn.t_end)
+    if self._second is None:
+      self._second = second
+    if second != self._second:
+      self.throughput.add(self._second_bytes)
+      if second > self._second + 1:
+        self.throughput.add(0,second - self._second - 1)
+      self._second = second
+      self._second_bytes = 0
+    if txn.response in ('HRDATA',None) and not txn.flags:
+      self._second_bytes += 4 * max(txn.words,1)
+
+  def _anomaly(self,reason,text,offset):
+    key = reason.split(':')[0]
+    self.anomalies[key] += 1
+    if len(self.anomaly_examples) < self.examples:
+      self.anomaly_examples.append((offset, text, reason))
+
+  def close(self):
+    """ End of the log: flush the last transaction. """
+    self._close_open()
+    if self._second is not None and self._second_bytes:
+      self.throughput.add(self._second_bytes)
+      self._second_bytes = 0
+
+  def elapsed(self):
+    if self.t_first is None or self.t_last is None:
+      return 0.0
+    return self.t_last - self.t_first + self.t_byte
+
+
+###############################################################################
+# Log sources
+###############################################################################
+
+def read_raw(fi,chunk=1 << 16):
+  """ Raw capture of the COMMCTRL TX line.  Yields (None, 'rx', data). """
+  while True:
+    data = fi.read(chunk)
+    if not data:
+      break
+    yield None, 'rx', data
+
+
+def read_log(fi):
+  """
+  Text log of '<time> rx|tx <hex>' lines ('#' starts a comment), the time being '-'
+  for chunks without one (saved from a raw capture).  Yields (time, direction, data).
+  """
+  for n, line in enumerate(fi):
+    f = line.split('#')[0].split()
+    if not f:
+      continue
+    assert len(f) == 3 and f[1] in ('rx','tx'), 'Expected "<time> rx|tx <hex>" at line %d' % (n+1)
+    yield None if f[0] == '-' else float(f[0]), f[1], bytes.fromhex(f[2])
+
+
+def read_tap(device,baud):
+  """ Live capture from a serial device or pty (e.g. a tap on the COMMCTRL TX line).  Yields (time, 'rx', data). """
+  from clot.aio import open_tty
+  port = open_tty(device,baud,rtscts=False)
+  fd = FdPort(port.fd,0.1)
+  try:
+    while True:
+      data = fd.read(4096)
+      if data:
+        yield time.time(), 'rx', data
+  except KeyboardInterrupt:
+    pass
+  finally:
+    port.close()
+
+
+class LogPort(object):
+  """ Wraps a port and logs every chunk sent and received, as read by read_log(). """
+
+  def __init__(self,port,fo):
+    self.port = port
+    self.fo = fo
+
+  @property
+  def in_waiting(self):
+    return getattr(self.port,'in_waiting',0)
+
+  def _log(self,direction,data):
+    self.fo.write(log_line(time.time(),direction,data))
+
+  def write(self,data):
+    self._log('tx',bytes(data))
+    return self.port.write(data)
+
+  def read(self,size=1):
+    data = self.port.read(size)
+    if data:
+      self._log('rx',data)
+    return data
+
+  def close(self):
+    self.fo.close()
+    if hasattr(self.port,'close'):
+      self.port.close()
+
+
+def log_line(t,direction,data):
+  """ One line of a text log, as read by read_log(). """
+  return '%s %s %s\n' % ('-' if t is None else '%.6f' % t, direction, data.hex())
+
+
+def log_format(path):
+  """ 'log' for text logs (.log, .txt), 'raw' otherwise. """
+  return 'log' if os.path.splitext(path)[1].lower() in ('.log','.txt') else 'raw'
+
+
+###############################################################################
+# Report
+###############################################################################
+
+def format_time(t):
+  if t >= 1:
+    return '%.3fs' % t
+  if t >= 1e-3:
+    return '%.2fms' % (1e3 * t)
+  return '%.1fus' % (1e6 * t)
+
+
+def report(dec,fo=sys.stdout):
+  elapsed = dec.elapsed()
+  fo.write('%d bytes received (%d echo), %d sent' % (dec.rx_bytes, dec.echo_bytes, dec.tx_bytes))
+  if elapsed:
+    fo.write(', %s, %.1f kB/s payload' % (format_time(elapsed), 4 * dec.payload / elapsed / 1e3))
+  fo.write('\n')
+  fo.write('Transactions: %s, %d payload words\n' % (', '.join('%s %d' % x for x in sorted(dec.count.items())), dec.payload))
+  if dec.decode_errors:
+    fo.write('Decode errors:\n')
+    for code, n in sorted(dec.decode_errors.items()):
+      fo.write('  %02d %-20s %d\n' % (code, ERROR_CODES.get(code,'unknown'), n))
+  if dec.ahb_errors:
+    fo.write('AHB errors: %d\n' % dec.ahb_errors)
+  if dec.anomalies:
+    fo.write('Anomalies:\n')
+    for reason, n in dec.anomalies.most_common():
+      fo.write('  %-40s %d\n' % (reason, n))
+    for offset, text, reason in dec.anomaly_examples:
+      fo.write('  @%d %-28s %s\n' % (offset, text, reason))
+  for name, h in sorted(dec.latency.items()):
+    fo.write('Latency %-12s n=%d mean=%s p50=%s p99=%s max=%s\n' % (name, h.n, format_time(h.mean()),
+      format_time(h.percentile(0.5)), format_time(h.percentile(0.99)), format_time(h.max)))
+  if dec.gaps.n:
+    fo.write('Idle gaps > %s: n=%d total=%s p50=%s max=%s\n' % (format_time(dec.min_gap), dec.gaps.n,
+      format_time(dec.gaps.total), format_time(dec.gaps.percentile(0.5)), format_time(dec.gaps.max)))
+    for lo, hi, n in dec.gaps.rows():
+      fo.write('  %10s - %-10s %d\n' % (format_time(lo), format_time(hi), n))
+  if dec.throughput.n:
+    h = dec.throughput
+    fo.write('Throughput per second: n=%d mean=%.1f kB/s p50=%.1f kB/s min=%.1f kB/s max=%.1f kB/s\n' % (h.n,
+      h.mean() / 1e3, h.percentile(0.5) / 1e3, h.min / 1e3, h.max / 1e3))
+
+
+def list_txn(txn,fo=sys.stdout):
+  t = '%12.6f' % txn.t_end if txn.t_end is not None else '%12d' % txn.offset
+  if txn.response == 'HRDATA' and txn.words > 1:
+    result = 'HRDATA x%d' % txn.words
+  elif txn.response == 'HMSEL':
+    result = 'HMSEL: %d' % txn.value
+  elif txn.response == 'DECODE_ERROR':
+    result = 'DECODE_ERROR: %02d (%s)' % (txn.value, ERROR_CODES.get(txn.value,'unknown'))
+  elif txn.response is not None:
+    result = '%s: 0x%08X' % (txn.response, txn.value)
+  else:
+    result = ''
+  lat = txn.latency()
+  fo.write('%s  %-27s %-36s %s%s\n' % (t, txn.text, result, format_time(lat) if lat is not None else '',
+    ''.join('  ! ' + x for x in txn.flags)))
+
+
+###############################################################################
+#
+###############################################################################
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Decode COMMCTRL UART logs into transactions and statistics.')
+  parser.add_argument('log', nargs='*', help='Log files: raw captures of the COMMCTRL TX line, or .log/.txt text logs.')
+  parser.add_argument('--format', choices=['raw','log'], help='Log format (default: from the file extension).')
+  parser.add_argument('--tap', metavar='DEVICE', help='Decode live from a serial device or pty until interrupted.')
+  parser.add_argument('--save', help='Also write the input as a text log (untimed chunks of raw logs get a "-" time).')
+  parser.add_argument('-b','--baud', default=0, type=int, help='Baud rate, for byte times (raw logs are timed from it).')
+  parser.add_argument('--min-gap', type=float, help='Smallest idle gap recorded, in seconds.')
+  parser.add_argument('-l','--list', action='store_true', help='Print every transaction.')
+  parser.add_argument('--examples', default=10, type=int, help='Number of anomalies to show.')
+  args = parser.parse_args()
+  if not (args.log or args.tap):
+    parser.error('No input specified.  Please specify log files or --tap')
+
+  on_txn = list_txn if args.list else None
+  dec = TraceDecoder(args.baud,on_txn,args.min_gap,args.examples)
+  sources = []
+  if args.tap:
+    sources.append(read_tap(args.tap,args.baud or 115200))
+  for path in args.log:
+    fmt = args.format or log_format(path)
+    if fmt == 'log':
+      sources.append(read_log(sys.stdin if path == '-' else open(path,'r')))
+    else:
+      sources.append(read_raw(sys.stdin.buffer if path == '-' else open(path,'rb')))
+  save = open(args.save,'w') if args.save else None
+  for source in sources:
+    for t, direction, data in source:
+      if save:
+        save.write(log_line(t,direction,data))
+      if direction == 'rx':
+        dec.feed(data,t)
+      else:
+        dec.feed_tx(data,t)
+  dec.close()
+  if save:
+    save.close()
+  report(dec)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,6 @@
+#!/usr/bin/env bash
+
+# Source from this directory to make the clot package importable, e.g.
+#   python3 -m clot.commctrl --port /dev/ttyUSB0 --read 0x00000000
+
+export PYTHONPATH=$PYTHONPATH:$(pwd)
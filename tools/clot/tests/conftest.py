@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the clot package importable, as sourceme.sh does
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
@@ -0,0 +1,9 @@
+from clot import ahbtrace
+from clot.model import parse_region
+
+
+def test_memmap_csv_sizes(tmp_path):
+  path = tmp_path / 'memmap.csv'
+  path.write_text('# memory map\nname,base,size,port\nimem,0x0000_0000,64K,0\ndmem,0x20000000,0x1000,\n')
+  assert ahbtrace.read_memmap(str(path)) == [(0, 0xFFFF, 'IMEM', 0), (0x20000000, 0x20000FFF, 'DMEM', -1)]
+  assert parse_region('0x20000000:64K') == (0x20000000, 0x10000)
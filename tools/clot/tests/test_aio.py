@@ -0,0 +1,65 @@
+import asyncio
+import socket
+
+import pytest
+
+from clot.aio import AsyncCommctrl, AsyncPort, open_tty
+from clot.commctrl import AhbError, LinkError, BURST_LEN
+from clot.model import AhbSpace, CommctrlModel, serve_pty
+
+
+def run_model(job,size=0x100):
+  """ Run job(cc) against a model board served on a pty. """
+  async def main():
+    space = AhbSpace()
+    space.map_ram(0,size)
+    server, name = serve_pty(CommctrlModel(space))
+    cc = AsyncCommctrl(open_tty(name,rtscts=False),timeout=1.0)
+    try:
+      return await job(cc)
+    finally:
+      await cc.close()
+      server.stop()
+  return asyncio.run(main())
+
+
+def test_burst_length():
+  async def job(cc):
+    txn = await cc.submit('B',0x0,4)
+    assert cc.link.in_flight() == BURST_LEN
+    return await cc.wait(txn)
+  assert run_model(job) == [0, 0, 0, 0]
+
+
+def test_write_block_read_block():
+  async def job(cc):
+    await cc.write_block(0x10,[1,2,3,4])
+    data = await cc.read_block(0x10,4,burst=3)
+    return data, cc.stats()
+  data, stats = run_model(job)
+  assert data == [1,2,3,4]
+  assert stats['writes'] == 4 and stats['reads'] == 4
+
+
+def test_write_block_error_raised_by_flush():
+  async def job(cc):
+    await cc.write_block(0xF8,[1,2,3,4])
+    with pytest.raises(AhbError):
+      await cc.flush()
+  run_model(job)
+
+
+def test_closed_port_raises_link_error():
+  async def main():
+    a, b = socket.socketpair()
+    cc = AsyncCommctrl(AsyncPort(a.detach(),'sock'),timeout=10.0)
+    try:
+      txn = await cc.submit('R',0x0)
+      b.close()
+      with pytest.raises(LinkError):
+        await asyncio.wait_for(cc.wait(txn),5.0)
+      with pytest.raises(LinkError):
+        await cc.read32(0x0)
+    finally:
+      await cc.close()
+  asyncio.run(main())
@@ -0,0 +1,39 @@
+import csv
+import os
+import subprocess
+import sys
+
+from test_vgen_regs import ROOT
+
+BAUD_ANALYZE = os.path.join(ROOT,'ip','commctrl','baud_analyze')
+
+
+def run_tool(name,*args):
+  return subprocess.run([sys.executable,os.path.join(BAUD_ANALYZE,name)] + list(args),stdout=subprocess.PIPE,
+    stderr=subprocess.PIPE,universal_newlines=True)
+
+
+def test_solver_csv_per_pair_at_rtl_osr(tmp_path):
+  path = str(tmp_path / 'baud.csv')
+  r = run_tool('baud_solver.py','--clocks','25,50','--bauds','115200,921600','--osr','4,8','--csv',path)
+  assert r.returncode == 0, r.stderr
+  assert 'OSR 8' in r.stdout and 'requires an RTL change' in r.stdout
+  assert '(OSR=4,' in r.stdout
+  rows = list(csv.DictReader(open(path)))
+  assert [(x['clock_mhz'], x['baud']) for x in rows] == [('25','115200'), ('25','921600'), ('50','115200'), ('50','921600')]
+  for row in rows:
+    assert abs(float(row['actual_baud']) - float(row['clock_mhz']) * 1e6 / (4 * int(row['div']))) < 0.1
+
+
+def test_planner_block_costs_and_unreliable_rows():
+  sys.path.insert(0,BAUD_ANALYZE)
+  try:
+    import link_planner
+  finally:
+    sys.path.remove(BAUD_ANALYZE)
+  assert link_planner.link_bytes(1,1) == (25 + 14, 25 + 34)
+  assert link_planner.link_bytes(0,0,[3],[300]) == (25 + 2*14 + 2*25, 25 + 2*14 + 2*25 + 300*20)
+  rows = link_planner.plan(50,link_planner.read_baudmux(link_planner.BAUDMUX),100,0,block_reads=[100])
+  assert any(not x['reliable'] for x in rows)
+  for x in rows:
+    assert (x['time'] is None) == (not x['reliable'])
@@ -0,0 +1,78 @@
+import array
+import os
+
+from clot.cache import ImageCache
+from clot.commctrl import Commctrl
+from clot.loader import load_image
+from clot.model import AhbSpace, CommctrlModel, ModelPort
+
+WORDS = 256
+
+
+def make_board():
+  space = AhbSpace()
+  space.map_ram(0,4 * WORDS)
+  space.map_device(0x1000,0x100,read=lambda addr: 0,write=lambda addr, data: None)    # ignores writes
+  return space, Commctrl(ModelPort(CommctrlModel(space)),timeout=0.5)
+
+
+def write_image(path,words):
+  with open(path,'wb') as fo:
+    array.array('I',words).tofile(fo)
+  return path
+
+
+def cache_files(root):
+  return sorted(name for d, dirs, names in os.walk(root) for name in names)
+
+
+def test_delta_load_and_sentinel_reload(tmp_path):
+  space, cc = make_board()
+  root = str(tmp_path / 'cache')
+  image = list(range(1,WORDS + 1))
+  a = write_image(str(tmp_path / 'a.bin'),image)
+  s = load_image(cc,a,quiet=True,cache=ImageCache('board','imem',root))
+  assert (s['delta'], s['written']) == (False, WORDS)
+  assert cache_files(root) == ['00000000.bin', 'meta.json']
+
+  # Only the changed words are written, after the sentinels match
+  changed = list(image)
+  for i in [0,17,WORDS - 1]:
+    changed[i] ^= 0xFFFF0000
+  b = write_image(str(tmp_path / 'b.bin'),changed)
+  s = load_image(cc,b,quiet=True,cache=ImageCache('board','imem',root),sentinels=8)
+  assert (s['delta'], s['sentinel_errors'], s['written']) == (True, 0, 3)
+  assert [space.read(4*i) for i in range(WORDS)] == changed
+
+  # A sentinel that disagrees with the cache forces a full reload
+  space.write(0,0)
+  s = load_image(cc,b,quiet=True,cache=ImageCache('board','imem',root),sentinels=WORDS)
+  assert (s['delta'], s['sentinel_errors'], s['written']) == (False, 1, WORDS)
+  assert ImageCache('board','imem',root).valid()
+
+
+def test_verify_mismatch_discards(tmp_path):
+  space, cc = make_board()
+  root = str(tmp_path / 'cache')
+  path = write_image(str(tmp_path / 'dev.bin'),[1,2,3,4])
+  s = load_image(cc,path,base=0x1000,verify='full',quiet=True,cache=ImageCache('board','dev',root))
+  assert s['mismatches'] == 4
+  assert not ImageCache('board','dev',root).valid()
+  assert cache_files(root) == ['meta.json']
+
+
+def test_aborted_load(tmp_path):
+  root = str(tmp_path / 'cache')
+  cache = ImageCache('board','imem',root)
+  cache.begin()
+  cache.record(0x100,[1,2,3])
+  cache.record(0x200,[4])
+  cache.close()                           # the load stops before commit()
+  cache = ImageCache('board','imem',root)
+  assert not cache.valid()
+  assert cache.lookup(0x100,3) == [None] * 3
+  cache.begin()
+  assert cache_files(root) == ['meta.json']
+  cache.record(0x100,[5])
+  cache.commit()
+  assert ImageCache('board','imem',root).lookup(0x100,2) == [5, None]
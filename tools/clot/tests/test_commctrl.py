@@ -0,0 +1,42 @@
+import pytest
+
+from clot.commctrl import Commctrl, AhbError
+from clot.model import AhbSpace, CommctrlModel, ModelPort
+
+
+def make_driver(size=0x100):
+  space = AhbSpace()
+  space.map_ram(0,size)
+  return Commctrl(ModelPort(CommctrlModel(space)),timeout=0.5)
+
+
+def test_write_block_read_block():
+  cc = make_driver()
+  cc.write_block(0x10,[1,2,3,4])
+  assert cc.read_block(0x10,4,burst=3) == [1,2,3,4]
+
+
+def test_write_error_raised_by_flush():
+  cc = make_driver()
+  cc.write32(0x1000,1)
+  with pytest.raises(AhbError):
+    cc.flush()
+
+
+def test_write_block_error_raised_by_flush():
+  # The words past the end of RAM are written by I instructions
+  cc = make_driver()
+  cc.write_block(0xF8,[1,2,3,4])
+  with pytest.raises(AhbError):
+    cc.flush()
+  cc.flush()
+
+
+def test_write_block_error_leaves_other_words():
+  # The I after a failed W steps past it, instead of writing next to the last good transfer
+  cc = make_driver()
+  cc.write_many([(0x10,0x1111),(0x14,0x2222)])
+  cc.write_block(0x1000,[0xA,0xB,0xC])
+  with pytest.raises(AhbError):
+    cc.flush()
+  assert cc.read_block(0x0,0x40) == [0] * 4 + [0x1111,0x2222] + [0] * 0x3A
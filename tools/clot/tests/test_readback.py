@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from clot.commctrl import Commctrl, AhbError
+from clot.model import AhbSpace, CommctrlModel, ModelPort
+from clot.readback import read_array, read_npy
+
+
+class ChunkedPort(ModelPort):
+  """ Model port returning at most chunk bytes per read, so responses arrive split. """
+
+  def __init__(self,model,chunk):
+    ModelPort.__init__(self,model)
+    self.chunk = chunk
+
+  @property
+  def in_waiting(self):
+    return min(len(self._rx),self.chunk)
+
+
+def make_driver(words,chunk=7,window=200):
+  space = AhbSpace()
+  space.map_ram(0x1000,4 * len(words))
+  for i, w in enumerate(words):
+    space.write(0x1000 + 4*i,w)
+  return Commctrl(ChunkedPort(CommctrlModel(space),chunk),window=window,timeout=0.5)
+
+
+def test_read_npy_multiple_blocks(tmp_path):
+  words = (np.arange(1000,dtype=np.uint32) * 0x9E3779B1) & 0xFFFFFFFF
+  cc = make_driver(words.tolist())
+  path = str(tmp_path / 'dump.npy')
+  read_npy(cc,0x1000,1000,path,block=256)
+  assert np.array_equal(np.load(path),words)
+  assert cc.count['R'] == 1000
+  assert cc.read32(0x1000 + 4*999) == words[999]
+
+
+def test_ahb_error_mid_block():
+  cc = make_driver(list(range(64)))
+  with pytest.raises(AhbError):
+    read_array(cc,0x1000 + 4*48,32,block=32)       # the last 16 words are unmapped
+  assert cc.read32(0x1004) == 1                    # the stream of the failed block was drained
@@ -0,0 +1,14 @@
+import io
+
+from clot import trace
+
+CAPTURE = b'W 0x00000000 0x00000001\r\nR 0x00000000\r\nHRDATA: 0x00000001\r\n'
+
+
+def test_save_raw_capture_round_trip():
+  fo = io.StringIO()
+  for t, direction, data in trace.read_raw(io.BytesIO(CAPTURE)):
+    fo.write(trace.log_line(t,direction,data))
+  assert fo.getvalue().startswith('- rx ')
+  assert list(trace.read_log(io.StringIO(fo.getvalue()))) == [(None, 'rx', CAPTURE)]
+  assert trace.log_line(1.5,'tx',b'\x01') == '1.500000 tx 01\n'
@@ -0,0 +1,55 @@
+import os
+import subprocess
+
+import pytest
+
+from test_vgen_regs import PYTHON2, ROOT
+
+MERGE_SCRIPT = """
+from vgen import *
+row = lambda name, nbits: {'name': name, 'nbits': nbits}
+base = [row('a','1')]
+current = [row('a','1'), row('b','8'), row('c','4')]        # b and c added by other jobs
+new = [row('b','8'), row('c','2'), row('d','1'), row('d','1')]
+add, conflicts, others = merge_new_rows(base,new,current,'name',['name','nbits'])
+print([x['name'] for x in add])
+print([(x['name'], x['nbits'], y['nbits']) for x, y in conflicts])
+print([x['name'] for x in others])
+"""
+
+APPEND_SCRIPT = """
+import sys
+from vgen import *
+job = int(sys.argv[1])
+base = read_csv('db.csv')
+rows = [{'name': 'job%d_%d' % (job,i), 'nbits': str(i)} for i in range(20)] + [{'name': 'shared', 'nbits': '1'}]
+append_csv('db.csv',rows,['name','nbits'],base=base)
+"""
+
+
+def run_vgen(tmp_path,script,*args):
+  env = dict(os.environ,PYTHONPATH=os.path.join(ROOT,'tools','vgen','bin'))
+  return subprocess.run([PYTHON2,'-c',script] + list(args),cwd=str(tmp_path),env=env,stdout=subprocess.PIPE,
+    stderr=subprocess.PIPE,universal_newlines=True)
+
+
+@pytest.mark.skipif(not PYTHON2, reason='needs python2 (vgen)')
+def test_merge_new_rows(tmp_path):
+  r = run_vgen(tmp_path,MERGE_SCRIPT)
+  assert r.returncode == 0, r.stderr
+  assert r.stdout.splitlines() == ["['d']", "[('c', '2', '4')]", "['b', 'c']"]
+
+
+@pytest.mark.skipif(not PYTHON2, reason='needs python2 (vgen)')
+def test_concurrent_appends(tmp_path):
+  (tmp_path / 'db.csv').write_text('name,nbits\nfirst,1\n')
+  env = dict(os.environ,PYTHONPATH=os.path.join(ROOT,'tools','vgen','bin'))
+  jobs = [subprocess.Popen([PYTHON2,'-c',APPEND_SCRIPT,str(job)],cwd=str(tmp_path),env=env,stdout=subprocess.DEVNULL,
+    stderr=subprocess.PIPE,universal_newlines=True) for job in range(6)]
+  for job in jobs:
+    assert job.wait(60) == 0, job.stderr.read()
+  lines = (tmp_path / 'db.csv').read_text().splitlines()[1:]
+  names = [x.split(',')[0] for x in lines if x and not x.startswith('#')]     # appends add a comment line
+  expect = ['first', 'shared'] + ['job%d_%d' % (job,i) for job in range(6) for i in range(20)]
+  assert sorted(names) == sorted(expect)
+  assert not (tmp_path / 'db.csv.lock').exists()
@@ -0,0 +1,17 @@
+import os
+import subprocess
+
+import pytest
+
+from test_vgen_regs import PYTHON2, ROOT
+
+PADS = os.path.join(ROOT,'tools','vgen','examples','pads','vgen_pads.py')
+
+
+@pytest.mark.skipif(not PYTHON2, reason='needs python2 (vgen)')
+def test_check_missing_column(tmp_path):
+  (tmp_path / 'pads.csv').write_text('name,direction\nclk,input\n')
+  env = dict(os.environ,PYTHONPATH=os.path.join(ROOT,'tools','vgen','bin'))
+  r = subprocess.run([PYTHON2,PADS,'--check'],cwd=str(tmp_path),env=env,stdout=subprocess.PIPE,
+    stderr=subprocess.PIPE,universal_newlines=True)
+  assert r.returncode != 0 and 'Pads CSV needs the columns: name, direction, side' in r.stderr
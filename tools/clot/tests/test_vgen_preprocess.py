@@ -0,0 +1,86 @@
+import os
+import subprocess
+
+import pytest
+
+from test_vgen_regs import PYTHON2, ROOT
+
+SCRIPT = """
+from vgen import *
+pp = VerilogPreprocessor(['.'],{})
+print(sorted((x['name'], x['nbits']) for x in get_verilog_module_signals('a.sv',preprocessor=pp)))
+print(sorted((x['name'], x['nbits']) for x in get_verilog_signals(['a.sv','b.sv'],'d_',pp)))
+"""
+
+
+def run_vgen(tmp_path,script):
+  env = dict(os.environ,PYTHONPATH=os.path.join(ROOT,'tools','vgen','bin'))
+  return subprocess.run([PYTHON2,'-c',script],cwd=str(tmp_path),env=env,stdout=subprocess.PIPE,
+    stderr=subprocess.PIPE,universal_newlines=True)
+
+
+@pytest.mark.skipif(not PYTHON2, reason='needs python2 (vgen)')
+def test_macro_widths_and_shared_signals(tmp_path):
+  (tmp_path / 'defs.svh').write_text('`define W 8\n')
+  (tmp_path / 'a.sv').write_text('`include "defs.svh"\nmodule a (\n  input logic [`W-1:0] d_in,\n'
+    '  input logic [(`W+1)*2-1:0] d_x,\n  output logic d_o\n);\nassign d_o = d_in[`W-1:0] != 0;\nendmodule\n')
+  (tmp_path / 'b.sv').write_text('`include "defs.svh"\nmodule b;\nassign d_q[`W-1:0] = 0;\nendmodule\n')
+  r = run_vgen(tmp_path,SCRIPT)
+  assert r.returncode == 0, r.stderr
+  lines = [x for x in r.stdout.splitlines() if x.startswith('[')]
+  assert lines[0] == "[('d_in', 8), ('d_o', 1), ('d_x', 18)]"
+  assert "('d_q', 8)" in lines[1]
+
+
+@pytest.mark.skipif(not PYTHON2, reason='needs python2 (vgen)')
+def test_parameter_width_is_an_error(tmp_path):
+  (tmp_path / 'a.sv').write_text('module a (\n  input logic [P-1:0] d_p\n);\nendmodule\n')
+  r = run_vgen(tmp_path,"from vgen import *\nget_verilog_module_signals('a.sv')\n")
+  assert r.returncode != 0 and 'Cannot evaluate range of d_p "P-1"' in r.stderr
+
+
+CONDITIONAL = """module c (
+`ifdef USE_X
+  input logic [7:0] d_x,
+`elsif USE_Y
+  input logic [3:0] d_y,
+`else
+  input logic d_z,
+`endif
+  /* input logic d_hidden,
+     input logic d_hidden2, */
+  // input logic d_commented,
+  output logic d_o
+);
+endmodule
+"""
+
+CONDITIONAL_SCRIPT = """
+from vgen import *
+for defines in [{}, {'USE_X': ''}, {'USE_Y': '1'}]:
+  pp = VerilogPreprocessor(['.'],defines)
+  print(sorted((x['name'], x['nbits']) for x in get_verilog_module_signals('c.sv',preprocessor=pp)))
+"""
+
+
+@pytest.mark.skipif(not PYTHON2, reason='needs python2 (vgen)')
+def test_conditionals_and_comments(tmp_path):
+  (tmp_path / 'c.sv').write_text(CONDITIONAL)
+  r = run_vgen(tmp_path,CONDITIONAL_SCRIPT)
+  assert r.returncode == 0, r.stderr
+  assert r.stdout.splitlines() == ["[('d_o', 1), ('d_z', 1)]", "[('d_o', 1), ('d_x', 8)]", "[('d_o', 1), ('d_y', 4)]"]
+
+
+@pytest.mark.skipif(not PYTHON2, reason='needs python2 (vgen)')
+def test_shared_include_expanded_once(tmp_path):
+  (tmp_path / 'defs.svh').write_text('`ifndef DEFS_SVH\n`define DEFS_SVH\n`define W 8\n`endif\n')
+  for name in ['a','b']:
+    (tmp_path / (name + '.sv')).write_text('`include "defs.svh"\nmodule %s;\nassign d_%s[`W-1:0] = 0;\nendmodule\n' % (name,name))
+  script = ("from vgen import *\npp = VerilogPreprocessor(['.'],{})\n"
+    "print(sorted((x['name'], x['nbits']) for x in get_verilog_signals(['a.sv','b.sv'],'d_',pp)))\n"
+    "print('%d %d' % (pp.hits,pp.misses))\n")
+  r = run_vgen(tmp_path,script)
+  assert r.returncode == 0, r.stderr
+  lines = r.stdout.splitlines()
+  assert lines[-2] == "[('d_a', 8), ('d_b', 8)]"
+  assert lines[-1] == '1 3'           # a.sv, b.sv and defs.svh expanded, defs.svh reused for b.sv
@@ -0,0 +1,140 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','..','..')
+REGISTERS = os.path.join(ROOT,'tools','vgen','examples','registers')
+CC = shutil.which('cc')
+
+
+def find_python2():
+  """ Python 2 interpreter for vgen: $VGEN_PYTHON, or python2 if it runs. """
+  python = os.environ.get('VGEN_PYTHON') or shutil.which('python2')
+  if python and subprocess.run([python,'-c','pass'],stderr=subprocess.DEVNULL).returncode == 0:
+    return python
+  return None
+
+
+PYTHON2 = find_python2()
+
+# Fields sharing a word, arrays sharing a run of words, and counters
+CSV = """idx,name,nbits,access,start,test,rval,desc
+0,ctrl_a,8,rw,0,1,0x0,Control A
+0,ctrl_b,8,rw,8,1,0x0,Control B
+1,status,16,r,0,0,0x0,Status
+2,gain[4],12,rw,0,1,0x0,Gains
+2,offs[4],4,rw,16,1,0x0,Offsets
+6,cyc,32,counter,0,0,0x0,Cycles
+7,cctl,3,counter_ctrl,0,0,0x0,Counter control
+"""
+
+# Stand-in for the SoC header: the register block is plain memory
+SM2_CM0_H = """#include <stdint.h>
+#include <stdio.h>
+#define __I volatile const
+#define __IO volatile
+#include "CREGS.h"
+extern CREGS_TypeDef cregs_mem;
+#define SM2_CREGS (&cregs_mem)
+"""
+
+MAIN_C = """#include "cregs_test.h"
+CREGS_TypeDef cregs_mem;
+int main(void) { return cregs_initial_value_test() + cregs_write_read_test(); }
+"""
+
+
+def generate(tmp_path,csv):
+  work = tmp_path / 'registers'
+  shutil.copytree(REGISTERS,str(work))
+  (work / 'cregs.csv').write_text(csv)
+  out = work / 'output'
+  out.mkdir()
+  env = dict(os.environ,PYTHONPATH=os.path.join(ROOT,'tools','vgen','bin'))
+  subprocess.run([PYTHON2,'vgen_regs.py','--generate','cregs.csv','--output','output'],cwd=str(work),env=env,
+    check=True,stdout=subprocess.DEVNULL)
+  return out
+
+
+@pytest.mark.skipif(not (PYTHON2 and CC), reason='needs python2 (vgen) and a C compiler')
+def test_generated_ctest_compiles_and_passes(tmp_path):
+  out = generate(tmp_path,CSV)
+  (out / 'SM2_CM0.h').write_text(SM2_CM0_H)
+  (out / 'main.c').write_text(MAIN_C)
+  exe = str(out / 'cregs_test')
+  subprocess.run([CC,'-Wall','-Werror','-o',exe,'cregs_test.c','main.c'],cwd=str(out),check=True)
+  assert subprocess.run([exe],cwd=str(out)).returncode == 0
+
+
+@pytest.mark.skipif(not PYTHON2, reason='needs python2 (vgen)')
+def test_nested_batch_drops_inner_writes_on_error(tmp_path,monkeypatch):
+  out = generate(tmp_path,CSV)
+  monkeypatch.syspath_prepend(str(out))
+  from cregs import Cregs
+  from cregs_model import CregsModel
+  regs = Cregs(0,CregsModel())
+  with regs.batch():
+    regs.write('CTRL_A',1)
+    with pytest.raises(ValueError):
+      with regs.batch():
+        regs.write('CTRL_A',7)
+        regs.write('CTRL_B',2)
+        raise ValueError
+    with regs.batch():
+      regs.write('CTRL_B',3)
+  assert regs.read_many(['CTRL_A','CTRL_B'],cached=False) == [1,3]
+
+
+MAP_ID_SCRIPT = """
+import sys
+from vgen_regs import *
+memmap = [dict(name='rom',port='0',base='0x0',size='64K'),dict(name='ram',port='1',base='0x20000000',size='0x1000')]
+memmap_fmt = [dict(name='RAM',port='1',base='0x2000_0000',size='4K'),dict(name='rom',port='0',base='0',size='0x10000')]
+memmap_mod = [dict(name='rom',port='0',base='0x0',size='32K'),dict(name='ram',port='1',base='0x20000000',size='0x1000')]
+def map_id_of(csv,memmaps=[]):
+  open('map.csv','w').write(csv)
+  return map_id(add_map_id(read_csv('map.csv'),255,memmaps))['rval']
+ids = [map_id_of(x) for x in sys.argv[1:]]
+ids += [map_id_of(sys.argv[1],[m]) for m in [memmap,memmap_fmt,memmap_mod]]
+print(' '.join(ids))
+"""
+
+
+@pytest.mark.skipif(not PYTHON2, reason='needs python2 (vgen)')
+def test_map_id_ignores_order_and_formatting(tmp_path):
+  lines = CSV.splitlines()
+  reordered = '\n'.join([lines[0]] + lines[:0:-1]) + '\n'
+  reformatted = CSV.replace('1,status,16,r,0,0,0x0,','1,STATUS ,16,r,0,0,0x00000,')
+  changed = CSV.replace('1,status,16,','1,status,15,')
+  env = dict(os.environ,PYTHONPATH=os.pathsep.join([os.path.join(ROOT,'tools','vgen','bin'),REGISTERS]))
+  r = subprocess.run([PYTHON2,'-c',MAP_ID_SCRIPT,CSV,reordered,reformatted,changed],cwd=str(tmp_path),env=env,
+    stdout=subprocess.PIPE,universal_newlines=True,check=True)
+  ids = r.stdout.splitlines()[-1].split()
+  assert ids[0] == ids[1] == ids[2] != ids[3]
+  # Memory maps are folded in by their parsed fingerprint
+  assert ids[4] == ids[5] != ids[6] and ids[4] != ids[0]
+
+
+@pytest.mark.skipif(not PYTHON2, reason='needs python2 (vgen)')
+def test_model_apply_matches_sequential(tmp_path,monkeypatch):
+  np = pytest.importorskip('numpy')
+  out = generate(tmp_path,CSV)
+  monkeypatch.syspath_prepend(str(out))
+  from cregs_model import CregsModel
+  models = [CregsModel(0x400) for i in range(2)]
+  for m in models:
+    m.set_input('STATUS',0x1234)
+    m.set_input('CYC',0xCAFE)
+  batch, seq = models
+  for mapped_only in [True,False]:
+    addrs, wdata, write = batch.random_transactions(5000,seed=1,write_fraction=0.3,mapped_only=mapped_only)
+    rdata = batch.apply(addrs,wdata,write)
+    expect = []
+    for a, d, w in zip(addrs,wdata,write):
+      if w:
+        seq.write32(a,d)
+      expect.append(0 if w else seq.read32(a))
+    assert rdata.tolist() == expect
+    assert np.array_equal(batch.state,seq.state)
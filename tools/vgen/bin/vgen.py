@@ -9,6 +9,9 @@ import re;
 import shutil;
 import os;
 import csv;
+import hashlib;
+import fcntl;
+import tempfile;
 
 # File format for signal list is comma delimited fields, 
 # each field takes on the key given in a header on the first
@@ -55,15 +58,292 @@ def read_to_tag(fi,tag):
   return outstr
 
 
-def get_verilog_signals(module_file,signal_prefix):
+###############################################################################
+# Verilog preprocessor
+###############################################################################
+
+re_comment = re.compile(r'"(?:\\.|[^"\\\n])*"|//[^\n]*|/\*.*?\*/',re.DOTALL)
+re_directive = re.compile(r'^\s*`(define|undef|ifdef|ifndef|elsif|else|endif|include)\b\s*(.*)$')
+re_macro = re.compile(r'`(\w+)')
+re_macro_name = re.compile(r'^\s*`(?:define|undef|ifdef|ifndef|elsif)\s+(\w+)',re.M)
+re_include = re.compile(r'^\s*`include\s+["<]([^">]+)[">]',re.M)
+re_define = re.compile(r'(\w+)(\([^)]*\))?\s*(.*)$',re.DOTALL)
+
+
+def strip_comments(text):
+  """ Remove // and /* */ comments from Verilog source, keeping strings and line breaks. """
+  def repl(m):
+    s = m.group(0)
+    if s.startswith('"'):
+      return s
+    return '\n' * s.count('\n') if '\n' in s else ' '
+  return re_comment.sub(repl,text)
+
+
+def split_macro_args(text,pos):
+  """
+  Split the macro arguments in text starting at the open bracket at pos.
+  Returns (list of arguments, position after the close bracket), or (None, None)
+  if the close bracket is not in text.
+  """
+  args = []
+  depth = 0
+  start = pos + 1
+  k = pos
+  while k < len(text):
+    c = text[k]
+    if c == '"':
+      k += 1
+      while k < len(text) and text[k] != '"':
+        k += 2 if text[k] == '\\' else 1
+    elif c in '([{':
+      depth += 1
+    elif c in ')]}':
+      depth -= 1
+      if depth == 0:
+        args.append(text[start:k].strip())
+        return args, k + 1
+    elif c == ',' and depth == 1:
+      args.append(text[start:k].strip())
+      start = k + 1
+    k += 1
+  return None, None
+
+
+class VerilogPreprocessor(object):
+  """
+  Lightweight Verilog preprocessor for scanning source for signals.
+  Removes comments and handles `define (with arguments and defaults), `undef,
+  `ifdef/`ifndef/`elsif/`else/`endif and `include.  Other directives are passed
+  through unchanged.  An included file is looked for next to the file including
+  it, then in incdirs.
+
+  Included files are expanded once and cached.  The cache is keyed on the
+  current definitions of every macro the file (or anything it includes) refers
+  to, so include guards and configuration defines are respected, and scanning
+  many files that include the same header with one preprocessor expands the
+  header only once.  Use a new preprocessor if files change on disk.
+  """
+
+  max_depth = 64
+
+  def __init__(self,incdirs=[],defines={}):
+    self.incdirs = list(incdirs)
+    self.initial_defines = dict((name,(None,str(value))) for name, value in defines.items())
+    self.defines = {}
+    self.cache = {}       # path: {key: (lines, changed defines)}
+    self.refs = {}        # path: macro names referred to by the file and its includes
+    self.hits = 0
+    self.misses = 0
+
+  def preprocess(self,path):
+    """ Preprocess a file, starting from the initial defines.  Returns a list of lines. """
+    self.defines = dict(self.initial_defines)
+    return self._file(os.path.normpath(path),[])
+
+  def _find_include(self,name,path):
+    for d in [os.path.dirname(path)] + self.incdirs:
+      include = os.path.normpath(os.path.join(d,name))
+      if os.path.isfile(include):
+        return include
+    return None
+
+  def _refs(self,path,stack=[]):
+    """ Names of the macros path and its includes refer to, from a static scan. """
+    if path not in self.refs:
+      text = strip_comments(open(path,"r").read())
+      names = set(re_macro.findall(text)) | set(re_macro_name.findall(text))
+      for name in re_include.findall(text):
+        include = self._find_include(name,path)
+        if include and include not in stack and include != path:
+          names |= self._refs(include,stack+[path])
+      self.refs[path] = frozenset(names)
+    return self.refs[path]
+
+  def _key(self,path):
+    """ Current definitions of the macros path depends on, including through macro bodies. """
+    names = set(self._refs(path))
+    todo = list(names)
+    while todo:
+      macro = self.defines.get(todo.pop())
+      if macro:
+        for name in re_macro.findall(macro[1]):
+          if name not in names:
+            names.add(name)
+            todo.append(name)
+    return tuple((name,self.defines.get(name)) for name in sorted(names))
+
+  def _file(self,path,stack):
+    assert path not in stack, 'Recursive `include: %s' % ' -> '.join(stack+[path])
+    key = self._key(path)
+    cached = self.cache.setdefault(path,{})
+    if key in cached:
+      self.hits += 1
+      lines, changes = cached[key]
+    else:
+      self.misses += 1
+      before = dict(self.defines)
+      lines = self._expand_file(path,stack+[path])
+      changes = dict((name,self.defines.get(name)) for name in set(before) | set(self.defines)
+        if before.get(name) != self.defines.get(name))
+      cached[key] = (lines,changes)
+    for name, macro in changes.items():
+      if macro is None:
+        self.defines.pop(name,None)
+      else:
+        self.defines[name] = macro
+    return lines
+
+  def _expand_file(self,path,stack):
+    lines = strip_comments(open(path,"r").read()).split('\n')
+    out = []
+    cond = []           # [branch active, branch taken] for each open `ifdef
+    i = 0
+    while i < len(lines):
+      line = lines[i]
+      i += 1
+      enabled = all(c[0] for c in cond)
+      m = re_directive.match(line)
+      if m:
+        directive, rest = m.group(1), m.group(2).strip()
+        if directive in ['ifdef','ifndef']:
+          active = enabled and ((rest.split()[0] in self.defines) != (directive == 'ifndef'))
+          cond.append([active,active or not enabled])
+        elif directive == 'elsif':
+          assert cond, '`elsif without `ifdef in %s' % path
+          cond[-1][0] = not cond[-1][1] and rest.split()[0] in self.defines
+          cond[-1][1] = cond[-1][1] or cond[-1][0]
+        elif directive == 'else':
+          assert cond, '`else without `ifdef in %s' % path
+          cond[-1][0] = not cond[-1][1]
+          cond[-1][1] = True
+        elif directive == 'endif':
+          assert cond, '`endif without `ifdef in %s' % path
+          cond.pop()
+        elif directive == 'define':
+          while rest.endswith('\\') and i < len(lines):
+            rest = rest[:-1] + '\n' + lines[i].rstrip()
+            i += 1
+          if enabled:
+            name, params, body = re_define.match(rest).groups()
+            if params is not None:
+              params = tuple(tuple(x.strip() for x in p.split('=',1)) for p in params[1:-1].split(',') if p.strip())
+            self.defines[name] = (params,body.strip())
+        elif not enabled:
+          pass
+        elif directive == 'undef':
+          self.defines.pop(rest.split()[0],None)
+        elif directive == 'include':
+          name = rest.strip('"<> ')
+          include = self._find_include(name,path)
+          if include is None:
+            print '** Warning: Include file %s not found (from %s)' % (name,path)
+          else:
+            out.extend(self._file(include,stack))
+      elif enabled:
+        if '`' in line:
+          expanded = self.expand(line)
+          while expanded is None and i < len(lines):     # macro arguments continue on the next line
+            line += '\n' + lines[i]
+            i += 1
+            expanded = self.expand(line)
+          out.extend((line if expanded is None else expanded).split('\n'))
+        else:
+          out.append(line)
+    assert not cond, 'Missing `endif in %s' % path
+    return out
+
+  def expand(self,text,depth=0):
+    """ Expand the defined macros in text.  Returns None if a macro argument list is not closed. """
+    assert depth < self.max_depth, 'Macro expansion too deep: %s' % text
+    out = []
+    pos = 0
+    while True:
+      m = re_macro.search(text,pos)
+      if not m:
+        out.append(text[pos:])
+        break
+      out.append(text[pos:m.start()])
+      pos = m.end()
+      macro = self.defines.get(m.group(1))
+      if macro is None:
+        out.append(m.group(0))
+        continue
+      params, body = macro
+      if params is not None:
+        k = pos
+        while k < len(text) and text[k].isspace():
+          k += 1
+        if k == len(text):
+          return None
+        if text[k] != '(':
+          out.append(m.group(0))
+          continue
+        args, pos = split_macro_args(text,k)
+        if args is None:
+          return None
+        if args == [''] and len(params) == 0:
+          args = []
+        assert len(args) <= len(params), 'Macro %s takes %d arguments: %s' % (m.group(1),len(params),str(args))
+        values = {}
+        for n, param in enumerate(params):
+          if n < len(args) and args[n] != '':
+            values[param[0]] = args[n]
+          else:
+            assert len(param) > 1, 'Macro %s: missing argument %s' % (m.group(1),param[0])
+            values[param[0]] = param[1]
+        if values:
+          body = re.sub(r'\b(' + '|'.join(re.escape(x) for x in values) + r')\b',lambda x: values[x.group(1)],body)
+      body = body.replace('``','').replace('`"','"')
+      expanded = self.expand(body,depth+1)
+      out.append(body if expanded is None else expanded)
+    return ''.join(out)
+
+
+###############################################################################
+# Scanning Verilog
+###############################################################################
+
+re_based = re.compile(r"(\d*)\s*'[sS]?([bBoOdDhH])\s*([0-9a-fA-F_]+)")
+re_const_expr = re.compile(r'^[0-9\s()+\-*/%<>~&|^]*$')
+verilog_bases = {'b': 2, 'o': 8, 'd': 10, 'h': 16}
+
+
+def eval_const(expr,what='expression'):
+  """
+  Evaluate a constant integer expression from a (preprocessed) vector range, such as
+  8-1 after `W-1 is expanded.  Decimal and based (8'hFF) numbers and the arithmetic,
+  shift and bitwise operators are accepted; anything else, such as a parameter name,
+  is an error.
+  """
+  text = re_based.sub(lambda m: str(int(m.group(3).replace('_',''),verilog_bases[m.group(2).lower()])),expr)
+  assert re_const_expr.match(text), \
+    'Cannot evaluate %s "%s": only constant expressions are supported (use a `define, or -D)' % (what,expr.strip())
+  try:
+    return int(eval(text,{'__builtins__': {}},{}))
+  except (SyntaxError, ZeroDivisionError, TypeError):
+    raise AssertionError('Cannot evaluate %s "%s"' % (what,expr.strip()))
+
+
+def get_verilog_signals(module_file,signal_prefix,preprocessor=None):
   """ 
   Read a (system)verilog file and return all signals with a matching prefix, along with some related details 
+  The file is preprocessed first, so commented and `ifdef'd out code is skipped and
+  macros are expanded.  module_file may also be a list of files, scanned with the
+  same preprocessor so shared headers are expanded once.
   """
-  fi = open(module_file,"r")
+  if preprocessor is None:
+    preprocessor = VerilogPreprocessor()
+  if not isinstance(module_file,basestring):
+    found = []
+    for f in module_file:
+      found += get_verilog_signals(f,signal_prefix,preprocessor)
+    return remove_duplicates(found,'name')
+  fi = preprocessor.preprocess(module_file)
   print "** Reading file \""+module_file+"\" to get signals with prefix \""+signal_prefix+"\"."
   
   # define some regexs
-  re_nb = '(\\b'+re.escape(signal_prefix)+'\w+)\[(\d+)\:(\d+)\]'    # this regex matches multibit signals: e.g. "mysig[7:0]"
+  re_nb = '(\\b'+re.escape(signal_prefix)+'\w+)\[([^\]\[:]+)\:([^\]\[:]+)\]'    # this regex matches multibit signals: e.g. "mysig[7:0]"
   #re_nb = '(\\bd_\w+)\[(\d+)\:(\d+)\]'    # this regex matches multibit signals: e.g. "mysig[7:0]"
   re_1b = '(\\b'+re.escape(signal_prefix)+'\w+\\b)'                 # this regex matches single bit signals: e.g "mysig" 
   #re_1b = '(\\bd_\w+\\b)'                 # this regex matches single bit signals: e.g "mysig" 
@@ -72,13 +352,13 @@ def get_verilog_signals(module_file,signal_prefix):
   found = []
   keys = ['name','nbits']
   for line in fi:
-    if line.lstrip().startswith('//') or (line == '') or line.isspace():
+    if (line == '') or line.isspace():
       pass
     else:
       if re.search(re_nb,line):                     # found a signal with multiple bits
         signame = re.search(re_nb,line).group(1)    # get all the signal attributes
-        nhi = int(re.search(re_nb,line).group(2))
-        nlo  = int(re.search(re_nb,line).group(3))
+        nhi = eval_const(re.search(re_nb,line).group(2),'range of '+signame)    # macros may leave e.g. [8-1:0]
+        nlo  = eval_const(re.search(re_nb,line).group(3),'range of '+signame)
         nbits  = ((int(nhi)+1) - int(nlo))
         assert nlo == 0                             # check the vector range starts at 0
         new_dict = dict(zip(keys,[signame,nbits]))
@@ -88,8 +368,6 @@ def get_verilog_signals(module_file,signal_prefix):
         nbits = 1
         new_dict = dict(zip(keys,[signame,nbits]))
         found.append(new_dict)
- 
-  fi.close()
 
   # Remove duplicates from found signals
   found = remove_duplicates(found,'name')
@@ -128,10 +406,11 @@ def read_to_verilog_module_declaration(fi):
 
 
 
-def get_verilog_module_signals(module_file,debug=False):
+def get_verilog_module_signals(module_file,debug=False,preprocessor=None):
   """
   Read in a (system)verilog module and get all the signals in the module declaration.
   Returns a list of dictionaries, (vglist).  
+  The file is preprocessed first, see get_verilog_signals().
   """
 
   d = debug
@@ -144,7 +423,9 @@ def get_verilog_module_signals(module_file,debug=False):
     'start'       # start bit (generally assumed to be zero)
   ]
 
-  fi = open(module_file,"r")
+  if preprocessor is None:
+    preprocessor = VerilogPreprocessor()
+  fi = iter(preprocessor.preprocess(module_file))
   
   # Read up to the module declaration open bracket
   read_to_verilog_module_declaration(fi)
@@ -153,17 +434,18 @@ def get_verilog_module_signals(module_file,debug=False):
   # Expecting the following style: " input/output logic [X:Y] NAME ,"
   vglist = []
   re_1b = '(input|output)\s+logic\s+(\w+)'
-  re_nb = '(input|output)\s+logic\s+\[(\d+):(\d+)\]\s+(\w+)'
+  re_nb = '(input|output)\s+logic\s+\[([^\]\[:]+):([^\]\[:]+)\]\s+(\w+)'
   for line in fi:
     if line.lstrip().startswith('//') or (line == '') or line.isspace():
       pass
     else:
-      if ')' in line:
+      if ')' in re.sub(r'\[[^\]]*\]','',line):    # the closing bracket, not one in a range
         break
       elif re.search(re_nb,line): 
         if d: print 'Found nb signal in module declaration.'
-        nbits = int(re.search(re_nb,line).group(2)) - int(re.search(re_nb,line).group(3)) +1
-        start = int(re.search(re_nb,line).group(3)) 
+        m = re.search(re_nb,line)
+        nbits = eval_const(m.group(2),'range of '+m.group(4)) - eval_const(m.group(3),'range of '+m.group(4)) +1
+        start = eval_const(m.group(3),'range of '+m.group(4))
         assert start == 0, 'start bit index in slice is not zero: %s' % start
         signal_match = [re.search(re_nb,line).group(4).strip(),re.search(re_nb,line).group(1).strip(),nbits,0]
       elif re.search(re_1b,line): 
@@ -241,46 +523,144 @@ def read_csv(csv_file, debug=False):
 
 
 
-def append_csv(csv_file,vglist,keys,unused_str='?',debug=False):
+class FileLock(object):
+  """
+  Exclusive lock on path, held with a "with" statement.  The lock is taken on a
+  separate path+".lock" file with flock, so it is released if the process dies,
+  and concurrent jobs updating the same file are serialised only while they hold
+  it.  The lock file is removed on exit, so none is left next to the file.
+  Waits up to timeout seconds.
+  """
+
+  def __init__(self,path,timeout=60):
+    self.lock_file = path + '.lock'
+    self.timeout = timeout
+    self.fd = None
+
+  def __enter__(self):
+    deadline = time.time() + self.timeout
+    while True:
+      fd = os.open(self.lock_file,os.O_RDWR | os.O_CREAT,0o666)
+      try:
+        fcntl.flock(fd,fcntl.LOCK_EX | fcntl.LOCK_NB)
+      except IOError:
+        os.close(fd)
+        assert time.time() <= deadline, 'Timed out after %ds waiting for lock: %s' % (self.timeout,self.lock_file)
+        time.sleep(0.1)
+        continue
+      # The previous holder may have removed the file while we waited: only the file still on disk is the lock
+      try:
+        st, locked = os.stat(self.lock_file), os.fstat(fd)
+        if (st.st_dev,st.st_ino) == (locked.st_dev,locked.st_ino):
+          self.fd = fd
+          return self
+      except OSError:
+        pass
+      os.close(fd)
+
+  def __exit__(self,*args):
+    os.unlink(self.lock_file)             # before unlocking, so a waiting job retries on a new file
+    fcntl.flock(self.fd,fcntl.LOCK_UN)
+    os.close(self.fd)
+    self.fd = None
+    return False
+
+
+def merge_new_rows(base,new,current,key,keys):
+  """
+  Three-way merge of the rows a job adds to a CSV.
+  base is the vglist the job read, new the rows it adds, and current the
+  vglist in the file now, which other jobs may have added to since.
+  Returns (rows still to add, conflicts, rows added by others), where a
+  conflict is a (new row, current row) pair with the same key that differ in
+  keys.  Conflicting rows are not added, so the first job to write wins.
+  """
+  base_keys = set(row[key] for row in base)
+  current_rows = dict((row[key],row) for row in current)
+  others = [row for row in current if row[key] not in base_keys]
+  add = []
+  conflicts = []
+  added = set()
+  for row in new:
+    if row[key] in added:
+      continue
+    if row[key] in current_rows:
+      theirs = current_rows[row[key]]
+      if any(row.get(x,'') != theirs.get(x,'') for x in keys):
+        conflicts.append((row,theirs))
+    else:
+      add.append(row)
+      added.add(row[key])
+  return add, conflicts, others
+
+
+def append_csv(csv_file,vglist,keys,unused_str='?',debug=False,key='name',base=None,timeout=60):
   """
   Append the list of dicts to csv_file.
   Each element of list is written as a CSV row.
   The dict elements and ordering is according to keys argument.
   unused_str is used to fill fields in CSV that are not in vglist.
+
+  Safe against other jobs updating the same file: the file is locked, re-read
+  and merged with merge_new_rows() against base (the vglist the caller read it
+  as, by default assumed to hold none of vglist), so rows that another job has
+  already added are not appended twice.  The new file is written to a temporary
+  file and renamed over the old one, so readers never see a partial update.
+  Returns the rows actually appended.
   """
   d = debug
   assert vglist != [], 'empty vglist supplied: %s' %str(vglist)
 
   print "** Appending new signals to csv file \""+csv_file+"\""
-  if os.path.isfile(csv_file):
-    shutil.copy2(csv_file,csv_file+".bak")   # copy2 preserves mod/access info
- 
-  # First read the header line to get the order of the keys
-  fi = open(csv_file,'r')
-  reader = csv.reader(fi)
-  row = next(reader) 
-  header = [x.strip(' ') for x in row]      # clean up any whitespace
-  header = [header[0].strip()] + header[1:]
-  assert len(header) > 0, 'Header is missing in CSV file: %s' % csv_file
-  assert all(x in header for x in keys), 'Header does not contain all keys.  Header: %s, Keys: %s' % (header,keys)
-  if d: print "Header line contains key list: " + str(header)
-  fi.close()
+  with FileLock(csv_file,timeout):
+    # First read the header line to get the order of the keys
+    fi = open(csv_file,'r')
+    reader = csv.reader(fi)
+    row = next(reader) 
+    header = [x.strip(' ') for x in row]      # clean up any whitespace
+    header = [header[0].strip()] + header[1:]
+    assert len(header) > 0, 'Header is missing in CSV file: %s' % csv_file
+    assert all(x in header for x in keys), 'Header does not contain all keys.  Header: %s, Keys: %s' % (header,keys)
+    if d: print "Header line contains key list: " + str(header)
+    fi.seek(0)
+    contents = fi.read()
+    fi.close()
+
+    # Merge with any rows added since the caller read the file
+    current = read_csv(csv_file)
+    if base is None:
+      base = [x for x in current if x[key] not in set(row[key] for row in vglist)]
+    vglist, conflicts, others = merge_new_rows(base,vglist,current,key,keys)
+    if others:
+      print "** Note: %d rows were added to \"%s\" by another job: %s" % (len(others),csv_file,str([x[key] for x in others]))
+    for ours, theirs in conflicts:
+      print "** Warning: %s \"%s\" was added to \"%s\" by another job with different fields, keeping theirs: %s" % (
+        key,ours[key],csv_file,str(dict((x,theirs.get(x,'')) for x in keys)))
+    if vglist == []:
+      print "** Nothing to append to csv file \""+csv_file+"\""
+      return vglist
    
-  # Now append new rows to CSV, obeying order specified in header.
-  fo = open(csv_file,'ab')
-  fo.write("\n# New signals:\n")
-  writer = csv.writer(fo, lineterminator='\n')
-  for row in vglist:
-    line = []
-    for item in header:
-      if item in row.keys():
-        line.append(row[item])
-      else:
-        line.append(unused_str)
-    #line = [row[x] for x in keys]
-    if d: print line
-    writer.writerow(line) 
-  fo.close()
+    # Now append new rows to CSV, obeying order specified in header.
+    shutil.copy2(csv_file,csv_file+".bak")   # copy2 preserves mod/access info
+    fd, tmp_file = tempfile.mkstemp(prefix=os.path.basename(csv_file)+'.',dir=os.path.dirname(os.path.abspath(csv_file)))
+    fo = os.fdopen(fd,'wb')
+    fo.write(contents)
+    fo.write("\n# New signals:\n")
+    writer = csv.writer(fo, lineterminator='\n')
+    for row in vglist:
+      line = []
+      for item in header:
+        if item in row.keys():
+          line.append(row[item])
+        else:
+          line.append(unused_str)
+      #line = [row[x] for x in keys]
+      if d: print line
+      writer.writerow(line) 
+    fo.close()
+    shutil.copymode(csv_file+".bak",tmp_file)
+    os.rename(tmp_file,csv_file)
+  return vglist
 
 
 
@@ -333,7 +713,7 @@ def remove_duplicates(vglist,key):
     val = row[key]
     if val in values:
       # duplicate!
-      print "**Found duplicate: "+row
+      print "**Found duplicate: "+str(row)
     else:
       new_list.append(row)
       values.append(row[key])
@@ -374,6 +754,84 @@ def check_keys_exist(vglist,my_keys):
   return True
 
 
+def fingerprint(vglist,keys,previous=0):
+  """
+  Stable 32-bit fingerprint of the specified keys of each list element, in order.
+  Case and surrounding whitespace of the values are ignored, and so are any other
+  keys, so only changes to the contents change it.  Pass a previous fingerprint to
+  fold several lists into one.
+  """
+  h = hashlib.sha1("%08x\n" % previous)
+  for d in vglist:
+    h.update("|".join(str(d.get(key,'')).strip().lower() for key in keys)+"\n")
+  return int(h.hexdigest()[:8],16)
+
+
+###############################################################################
+# Memory map
+###############################################################################
+
+# This is the minimum set of keys required for a memory map (vgen_memmap.py).
+memmap_keys = [
+  'name',       # slave name, used for the constants
+  'base',       # base address [hex]
+  'size'        # size in bytes [hex or decimal, K/M/G suffix allowed]
+  ]
+
+# Optional keys:
+#   'port'      AHB_BUS slave port number (default: order in the CSV)
+#   'desc'      simple informative description
+
+
+def parse_num(s):
+  """ Parse a number: hex (0x), decimal, with an optional K/M/G suffix. Underscores are ignored. """
+  s = s.strip().replace('_','')
+  scale = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}.get(s[-1:].upper(),1)
+  if scale != 1:
+    s = s[:-1]
+  return int(s,0) * scale
+
+
+def parse_memmap(vglist,aw=32):
+  """
+  Convert the CSV rows into regions: dicts with integer base, size, end (inclusive,
+  as used by AHB_BUS) and port.
+  """
+  assert check_keys_exist(vglist,memmap_keys), 'Memory map CSV needs the keys: %s' % str(memmap_keys)
+  regions = []
+  names = set()
+  for n, row in enumerate(vglist):
+    name = row['name']
+    assert re.match(r'^[A-Za-z_][A-Za-z0-9_]*$',name), 'Region name is not an identifier: %s' % name
+    assert name.upper() not in names, 'Duplicate region name: %s' % name
+    names.add(name.upper())
+    base = parse_num(row['base'])
+    size = parse_num(row['size'])
+    assert size > 0 and size % 4 == 0, 'Region %s: size 0x%x is not a non-zero number of words' % (name,size)
+    assert base % 4 == 0, 'Region %s: base 0x%x is not word aligned' % (name,base)
+    assert base + size <= (1 << aw), 'Region %s: 0x%x+0x%x is outside the %d-bit address space' % (name,base,size,aw)
+    port = row.get('port','').strip()
+    regions.append({
+      'name': name,
+      'port': int(port,0) if port else n,
+      'base': base,
+      'size': size,
+      'end': base + size - 1,
+      'desc': row.get('desc',''),
+      })
+
+  # Ports must be 0..NSLAVES-1, one region each
+  ports = sorted(r['port'] for r in regions)
+  assert ports == range(len(regions)), 'Ports must be unique and numbered from 0 to %d: %s' % (len(regions)-1,str(ports))
+  regions.sort(key=lambda r: r['port'])
+  return regions
+
+
+def memmap_fingerprint(regions):
+  """ Stable 32-bit fingerprint of the memory map: names, ports, bases and sizes. """
+  return fingerprint(sorted(regions,key=lambda r: r['port']),['name','port','base','size'])
+
+
 
 
 ###############################################################################
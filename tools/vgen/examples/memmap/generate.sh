@@ -0,0 +1,2 @@
+mkdir -p output
+./vgen_memmap.py --csv memmap.csv --generate memmap --output output
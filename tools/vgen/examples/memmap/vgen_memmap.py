@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+
+# vgen_memmap.py - Generate the AHB_BUS memory map and associated collateral
+
+import time;
+import re;
+import shutil;
+import os;
+import sys;
+import bisect;
+import argparse;
+
+from vgen import *;
+
+
+###############################################################################
+# Memory map
+###############################################################################
+
+# The CSV keys, parse_memmap() and memmap_fingerprint() are in vgen.py, shared
+# with vgen_regs.py (--id-with folds the memory map fingerprint into MAP_ID).
+
+
+class IntervalIndex(object):
+  """
+  Regions sorted by base address, for O(n log n) overlap and gap checking and
+  O(log n) address lookup.
+  """
+
+  def __init__(self,regions):
+    self.regions = sorted(regions,key=lambda r: (r['base'],r['end']))
+    self.bases = [r['base'] for r in self.regions]
+
+  def overlaps(self):
+    """
+    Sweep in base order, against the region reaching furthest so far.
+    Returns a list of (region, region) pairs, at least one for every overlapping region.
+    """
+    pairs = []
+    reach = None
+    for r in self.regions:
+      if reach is not None and r['base'] <= reach['end']:
+        pairs.append((reach,r))
+      if reach is None or r['end'] > reach['end']:
+        reach = r
+    return pairs
+
+  def gaps(self,lo,hi):
+    """ Unmapped (start, end) ranges between lo and hi (inclusive). """
+    gaps = []
+    addr = lo
+    for r in self.regions:
+      if r['base'] > addr:
+        gaps.append((addr,min(r['base']-1,hi)))
+      addr = max(addr,r['end']+1)
+      if addr > hi:
+        break
+    if addr <= hi:
+      gaps.append((addr,hi))
+    return gaps
+
+  def find(self,addr):
+    """ Region decoding addr, or None.  Assumes no overlaps. """
+    i = bisect.bisect_right(self.bases,addr) - 1
+    if i >= 0 and addr <= self.regions[i]['end']:
+      return self.regions[i]
+    return None
+
+
+def check_memmap(regions,aw=32,allow_gaps=True,max_report=10):
+  """
+  Check the regions do not overlap.  Gaps are reported, and are errors unless allow_gaps.
+  Returns the list of gaps between the lowest and the highest region.
+  """
+  index = IntervalIndex(regions)
+  overlaps = index.overlaps()
+  for a, b in overlaps:
+    print '** Error: Region %s [0x%x-0x%x] overlaps %s [0x%x-0x%x]' % (b['name'],b['base'],b['end'],a['name'],a['base'],a['end'])
+  assert not overlaps, 'Memory map has %d overlapping regions' % len(overlaps)
+
+  gaps = index.gaps(index.regions[0]['base'],max(r['end'] for r in regions))
+  for lo, hi in gaps[:max_report]:
+    print '** %s: Unmapped gap [0x%x-0x%x] (0x%x bytes) goes to the default slave' % ('Warning' if allow_gaps else 'Error',lo,hi,hi-lo+1)
+  if len(gaps) > max_report:
+    print '** ... and %d more gaps' % (len(gaps)-max_report)
+  assert allow_gaps or not gaps, 'Memory map has %d gaps' % len(gaps)
+
+  # AHB_BUS ignores a slave with start and end both zero
+  for r in regions:
+    assert not (r['base'] == 0 and r['end'] == 0), 'Region %s: start and end are both zero, AHB_BUS would disable it' % r['name']
+  return gaps
+
+
+def hex_addr(x,aw=32):
+  return "%d'h%0*X" % (aw,(aw+3)/4,x)
+
+
+###############################################################################
+# Address decode
+###############################################################################
+
+# Estimated logic depth is in 2-input gate levels, with the comparisons against
+# constants (the parameters) already folded in by synthesis:
+#   equality compare of n bits     AND tree of n literals        clog2(n)
+#   magnitude compare of n bits    prefix compare                2*clog2(n)
+#   range compare                  two magnitude compares, AND   2*clog2(aw)+1
+# The default slave select is a NOR of every HSEL, adding clog2(NSLAVES).
+
+
+def clog2(n):
+  """ ceil(log2(n)), 0 for n <= 1 """
+  return (n-1).bit_length() if n > 1 else 0
+
+
+def decode_mask(r,aw=32):
+  """
+  S_ADDR_MASK for region r, or 0 if it needs a range compare.  A power-of-two
+  sized region at a multiple of its size decodes with (HADDR & mask) == base.
+  """
+  size = r['size']
+  if size & (size-1) == 0 and r['base'] % size == 0 and size < (1 << aw):
+    return ((1 << aw) - 1) & ~(size - 1)
+  return 0
+
+
+def prefix_blocks(base,end):
+  """ Split [base,end] into the fewest aligned power-of-two blocks, as (base, size). """
+  blocks = []
+  while base <= end:
+    size = (base & -base) or (1 << (end-base+1).bit_length())
+    while base + size - 1 > end:
+      size >>= 1
+    blocks.append((base,size))
+    base += size
+  return blocks
+
+
+def analyze_decode(regions,aw=32,use_mask=True):
+  """
+  Choose the decode of each region and estimate its cost.  Adds 'mask' (0 for a
+  range compare), 'decode', 'comparators', 'bits' and 'depth' to every region,
+  and returns a summary dict comparing the result with an all range-compare decode.
+  """
+  range_depth = 2*clog2(aw) + 1
+  trie = set()
+  for r in regions:
+    r['mask'] = decode_mask(r,aw) if use_mask else 0
+    if r['mask']:
+      r['decode'] = 'mask'
+      r['comparators'] = 1
+      r['bits'] = bin(r['mask']).count('1')
+      r['depth'] = clog2(r['bits'])
+    else:
+      r['decode'] = 'range'
+      r['comparators'] = 2
+      r['bits'] = 2*aw
+      r['depth'] = range_depth
+    # The aligned blocks a prefix tree would decode this region with
+    r['blocks'] = prefix_blocks(r['base'],r['end'])
+    for base, size in r['blocks']:
+      n = aw - clog2(size)
+      trie.update((base >> (aw-j), j) for j in range(1,n+1))
+
+  sel_depth = clog2(len(regions))
+  return {
+    'range_comparators': 2*len(regions),
+    'range_bits': 2*aw*len(regions),
+    'range_depth': range_depth + sel_depth,
+    'comparators': sum(r['comparators'] for r in regions),
+    'bits': sum(r['bits'] for r in regions),
+    'depth': max(r['depth'] for r in regions) + sel_depth,
+    'masked': sum(1 for r in regions if r['mask']),
+    'trie_nodes': len(trie),
+    }
+
+
+def report_decode(regions,summary,aw=32,verbose=False):
+  """ Print the decode chosen for each region and the estimated cost against range compares. """
+  if verbose:
+    print '%-6s %-16s %-8s %-24s %5s %5s  %s' % ('Port','Name','Decode','Mask','Bits','Depth','Prefix blocks')
+    for r in regions:
+      print '%-6d %-16s %-8s %-24s %5d %5d  %d' % (r['port'],r['name'],r['decode'],hex_addr(r['mask'],aw) if r['mask'] else '-',
+        r['bits'],r['depth'],len(r['blocks']))
+  print '**Decode: %d of %d regions use a mask compare' % (summary['masked'],len(regions))
+  print '**  range compare only:  %4d comparators, %6d compared bits, depth ~%d gate levels' % (
+    summary['range_comparators'],summary['range_bits'],summary['range_depth'])
+  print '**  generated decode:    %4d comparators, %6d compared bits, depth ~%d gate levels' % (
+    summary['comparators'],summary['bits'],summary['depth'])
+  print '**  shared prefix tree:  %4d address prefix terms over all regions' % summary['trie_nodes']
+  for r in regions:
+    if not r['mask'] and len(r['blocks']) > 1:
+      print '** Note: Region %s is not a size-aligned power of two (%d prefix blocks); align it for a mask compare' % (r['name'],len(r['blocks']))
+
+
+###############################################################################
+# Verilog include
+###############################################################################
+
+
+def gen_memmap_svh(module_name,svh_file,template_file,regions,aw=32):
+  """ Generate the include file with the AHB_BUS parameters from a template """
+
+  # Open template
+  fi_template = open(template_file,"r")
+
+  # Open output file
+  if (os.path.isfile(svh_file)):                      # if it already exists, backup first
+    shutil.copy2(svh_file,svh_file+".bak")            # copy2 preserves mod/access info
+  fo = open(svh_file,"w")
+  print "**Writing memory map \""+module_name+"\" to file \""+fo.name+"\""
+  fo.write(banner_start())
+
+  # Print the memory map into the generated file
+  fo.write(read_to_tag(fi_template,"VGEN: HEADER"))
+  l = "// Memory map contents:\n"
+  for r in regions:
+    l += "// S[%d] %-16s %s - %s  %s\n" % (r['port'],r['name'],hex_addr(r['base'],aw),hex_addr(r['end'],aw),r['desc'])
+  fo.write(l)
+
+  # Parameters, highest port first in the concatenation
+  fo.write(read_to_tag(fi_template,"VGEN: PARAMETERS"))
+  l = "localparam NSLAVES = "+str(len(regions))+";\n"
+  l += "localparam logic [31:0] MEMMAP_FINGERPRINT = 32'h%08X;\n\n" % memmap_fingerprint(regions)
+  for key, pname in [('base','S_ADDR_START'),('end','S_ADDR_END'),('mask','S_ADDR_MASK')]:
+    l += "localparam logic [(NSLAVES*"+str(aw)+")-1:0] "+pname+" = {\n"
+    for n, r in enumerate(reversed(regions)):
+      l += "  "+hex_addr(r[key],aw)+("," if n < len(regions)-1 else " ")+"  // S["+str(r['port'])+"] "+r['name']+"\n"
+    l += "};\n\n"
+  for r in regions:
+    l += "localparam int unsigned "+r['name'].upper()+"_PORT = "+str(r['port'])+";\n"
+    l += "localparam logic ["+str(aw-1)+":0] "+r['name'].upper()+"_BASE = "+hex_addr(r['base'],aw)+";\n"
+    l += "localparam logic ["+str(aw-1)+":0] "+r['name'].upper()+"_END  = "+hex_addr(r['end'],aw)+";\n"
+  fo.write(l)
+
+  # Rest of template
+  fo.write(read_to_tag(fi_template,""))
+  fo.write(banner_end())
+
+  # Close files
+  fo.close()
+  fi_template.close()
+
+
+###############################################################################
+# C header
+###############################################################################
+
+def gen_memmap_cheader(module_name,cheader_file,regions):
+  """ Generate C header with base addresses and sizes of the regions """
+
+  fo = open(cheader_file,"w")
+  print "**Writing memory map to C header file \""+fo.name+"\""
+
+  # comment line and header guards
+  fo.write(banner_start())
+  l = "#ifndef "+module_name.upper()+"_H \n"
+  l += "#define "+module_name.upper()+"_H \n"
+  l += "\n\n"
+  l += "#define "+module_name.upper()+"_FINGERPRINT\t(0x%08XUL)\n\n" % memmap_fingerprint(regions)
+  fo.write(l)
+
+  # One set of definitions per region, in address order
+  for r in IntervalIndex(regions).regions:
+    name = r['name'].upper()
+    l = "/* "+name+": "+r['desc']+" (AHB_BUS port "+str(r['port'])+") */\n"
+    l += "#define "+name+"_BASE\t(0x%08XUL)\n" % r['base']
+    l += "#define "+name+"_SIZE\t(0x%08XUL)\n" % r['size']
+    l += "#define "+name+"_END\t(0x%08XUL)\n\n" % r['end']
+    fo.write(l)
+
+  # close the header guard
+  l = "#endif\n\n"
+  fo.write(l)
+
+  fo.write(banner_end())
+  fo.close()
+
+
+###############################################################################
+# Python module
+###############################################################################
+
+def gen_memmap_python(module_name,output_file,regions):
+  """ Generate Python module with the region constants and an address lookup """
+
+  fo = open(output_file,"w")
+  print "**Writing memory map to python module \""+fo.name+"\""
+  fo.write("# "+banner_start())
+
+  l = "import bisect\n\n\n"
+  l += "FINGERPRINT = 0x%08X\t\t# memory map fingerprint\n\n" % memmap_fingerprint(regions)
+  for r in IntervalIndex(regions).regions:
+    name = r['name'].upper()
+    l += name+"_BASE = 0x%08X\t\t# %s\n" % (r['base'],r['desc'])
+    l += name+"_SIZE = 0x%08X\n" % r['size']
+    l += name+"_PORT = %d\n\n" % r['port']
+  fo.write(l)
+
+  # (base, end, name, port) sorted by base, for find()
+  l = "\nREGIONS = [\n"
+  for r in IntervalIndex(regions).regions:
+    l += "\t(0x%08X, 0x%08X, '%s', %d),\n" % (r['base'],r['end'],r['name'].upper(),r['port'])
+  l += "]\n"
+  l += "_BASES = [x[0] for x in REGIONS]\n\n\n"
+  l += "def find(addr):\n"
+  l += "\t\"\"\" Name of the region decoding addr, or None (default slave). \"\"\"\n"
+  l += "\ti = bisect.bisect_right(_BASES,addr) - 1\n"
+  l += "\tif i >= 0 and addr <= REGIONS[i][1]:\n"
+  l += "\t\treturn REGIONS[i][2]\n"
+  l += "\treturn None\n\n\n"
+  fo.write(l)
+
+  fo.write("# "+banner_end())
+  fo.close()
+
+
+###############################################################################
+# Markdown docs
+###############################################################################
+
+def gen_memmap_docs(module_name,md_file,regions,gaps,aw=32):
+  """ Generate markdown documentation of the memory map, in address order with gaps shown """
+
+  fo = open(md_file,"w")
+  print "**Writing memory map documentation to markdown file \""+fo.name+"\""
+  fo.write(banner_start())
+
+  # Title for the documentation
+  l = ""
+  l += "# Memory Map\n\n"
+  l += "## "+module_name.upper()+"\n\n"
+  l += "Fingerprint: 0x%08X\n\n" % memmap_fingerprint(regions)
+  fo.write(l)
+
+  # Header for the markdown table
+  l = ""
+  l += "| Start | End | Size | Name | Port | Description | \n"
+  l += "| ---   | --- | ---  | ---  | ---  | ---         | \n"
+  fo.write(l)
+
+  # Regions and gaps, in address order
+  rows = [(r['base'],r['end'],"**"+r['name'].upper()+"**",str(r['port']),r['desc']) for r in regions]
+  rows += [(lo,hi,"*unmapped*","-","Default slave") for lo, hi in gaps]
+  for base, end, name, port, desc in sorted(rows):
+    fo.write("| 0x%0*X | 0x%0*X | %s | %s | %s | %s | \n" % ((aw+3)/4,base,(aw+3)/4,end,size_str(end-base+1),name,port,desc))
+
+  # Add a few blank lines at the bottom
+  l = "\n\n"
+  fo.write(l)
+
+  fo.write(banner_end())
+  fo.close()
+
+
+def size_str(n):
+  for unit, scale in [('GB',1<<30),('MB',1<<20),('KB',1<<10)]:
+    if n >= scale and n % scale == 0:
+      return str(n/scale)+unit
+  return str(n)+"B"
+
+
+###############################################################################
+#
+###############################################################################
+
+
+def main():
+
+  parser = argparse.ArgumentParser(description='Check a memory map and generate the AHB_BUS parameters and associated collateral.')
+  parser.add_argument('-g','--generate', nargs='?', const='memmap', type=str, help='Generate the include file, headers and docs, with the specified name.', required=False)
+  parser.add_argument('-c','--csv', default='memmap.csv', type=str, help='Specifies the csv file.', required=False)
+  parser.add_argument('-o','--output', default='output', help='Specifies an output directory.', required=False)
+  parser.add_argument('-a','--aw', default=32, type=int, help='Address bus width.', required=False)
+  parser.add_argument('--no-gaps', action='store_true', help='Treat unmapped gaps between regions as errors.', required=False)
+  parser.add_argument('--range-decode', action='store_true', help='Decode every region with a range compare (no S_ADDR_MASK).', required=False)
+  parser.add_argument('-r','--report', action='store_true', help='Report the decode and estimated logic depth of every region.', required=False)
+  args = parser.parse_args()
+  print 'Command line arguments: %s' % str(args)
+
+  # Read in and check the memory map
+  t = time.time()
+  regions = parse_memmap(read_csv(args.csv),args.aw)
+  gaps = check_memmap(regions,args.aw,allow_gaps=not args.no_gaps)
+  print '**Checked %d regions in %.3f s: no overlaps, %d gaps' % (len(regions),time.time()-t,len(gaps))
+
+  # Choose the address decode and report its cost
+  summary = analyze_decode(regions,args.aw,use_mask=not args.range_decode)
+  report_decode(regions,summary,args.aw,verbose=args.report)
+
+  if (args.generate):
+    name = args.generate
+    outdir = args.output
+    gen_memmap_svh(name,outdir+'/'+name+'.svh','memmap_template.svh',regions,args.aw)
+    gen_memmap_cheader(name,outdir+'/'+name.upper()+'.h',regions)
+    gen_memmap_python(name,outdir+'/'+name+'.py',regions)
+    gen_memmap_docs(name,outdir+'/'+name+'.md',regions,gaps,args.aw)
+
+
+if __name__ == "__main__":
+    main()
+
@@ -36,6 +36,12 @@ in_cell =     'LIB_PAD'
 out_cell =    in_cell
 inout_cell =  in_cell
 
+# Default number of pad positions on each side of the ring, 1-left, 2-top, 3-right, 4-bottom
+pads_per_side = [68,68,68,68]
+
+# IO cell orientation on each side of the ring
+side_orientation = {'1': 'H', '2': 'V', '3': 'H', '4': 'V'}
+
 # Control signals for IO cells.
 pad_control = [
   {'name': 'SC_PAD_ST', 'nbits': 1},
@@ -54,19 +60,21 @@ pad_control = [
 # FIXME also check csv for duplicate signals
 
 
-def update_pads_csv_from_verilog(csv_file,verilog_file,pd_csv_file='',ignore_prefix=''):
+def update_pads_csv_from_verilog(csv_file,verilog_file,pd_csv_file='',ignore_prefix='',incdirs=[],defines={}):
   """
   Read in CSV and Verilog files,
   Any new signals found in Verilog that do not exist in CSV are added to CSV.
   Will warn about any signals found in CSV that do not exist in Verilog.
   Will wann about any signals found in verilog module port that are more than 1b wide.
   Ignores any signals with the specified prefix.
+  The Verilog is preprocessed with the include directories and defines given.
   Return True if any new signals were added to front-end csv.
   """
   # Read in list of io signals from CSV file
   print '** Reading csv_file: %s, and Verilog file: %s' % (csv_file,verilog_file)
   csv_vglist = read_csv(csv_file)  
   check_keys_exist(csv_vglist,pads_keys)
+  csv_base = csv_vglist
 
   # Remove pads from CSV that are not input, output or bidir (such as VDD / VSS etc).
   new_list = []
@@ -76,7 +84,7 @@ def update_pads_csv_from_verilog(csv_file,verilog_file,pd_csv_file='',ignore_pre
   csv_vglist = new_list
 
   # Read in top-level verilog module file
-  verilog_vglist = get_verilog_module_signals(verilog_file)
+  verilog_vglist = get_verilog_module_signals(verilog_file,preprocessor=VerilogPreprocessor(incdirs,defines))
   
   # Remove signals that match ignore_prefix
   if ignore_prefix != '':
@@ -127,8 +135,8 @@ def update_pads_csv_from_verilog(csv_file,verilog_file,pd_csv_file='',ignore_pre
   if new_in_verilog != []: 
     print 'Found new signals in Verilog file (not listed in CSV):\n %s' % str([d['name'] for d in new_in_verilog])
     print 'Updating CSV file: %s' % csv_file
-    append_csv(csv_file,new_in_verilog,pads_keys,unused_str='')
-    if pd_csv_file != '':
+    new_in_verilog = append_csv(csv_file,new_in_verilog,pads_keys,unused_str='',base=csv_base)
+    if pd_csv_file != '' and new_in_verilog != []:
       append_csv(pd_csv_file,new_in_verilog,pads_keys,unused_str='')
       print 'Updating CSV file: %s' % pd_csv_file
     else:
@@ -141,19 +149,126 @@ def update_pads_csv_from_verilog(csv_file,verilog_file,pd_csv_file='',ignore_pre
     return False
 
 
+###############################################################################
+# Pad ring
+###############################################################################
+
+class PadRing(object):
+  """
+  Pads indexed by side, bump and position, built in one pass over the vglist.
+  Every row takes a position, including supply pads.  The optional 'bump', 'position' (1 to the number of positions on the side) and
+  'orientation' columns are checked when present.  Every problem is collected
+  in errors rather than stopping at the first.
+  """
+
+  def __init__(self,vglist,pads_per_side=pads_per_side):
+    assert len(pads_per_side) == 4, 'Need the number of pads on each of the 4 sides: %s' % str(pads_per_side)
+    self.pads_per_side = list(pads_per_side)
+    self.sides = [[] for side in range(4)]
+    self.bumps = {}
+    self.positions = [{} for side in range(4)]
+    self.errors = []
+    for row in vglist:
+      name = row['name']
+      side = row['side'].strip()
+      if side not in side_orientation:
+        self.errors.append('Pad %s: side "%s" is not 1 (left), 2 (top), 3 (right) or 4 (bottom)' % (name,side))
+        continue
+      s = int(side) - 1
+      self.sides[s].append(row)
+      orientation = row.get('orientation','').strip().upper()
+      if orientation and orientation != side_orientation[side]:
+        self.errors.append('Pad %s: orientation %s on side %s, which needs %s' % (name,orientation,side,side_orientation[side]))
+      bump = row.get('bump','').strip().upper()
+      if bump:
+        if bump in self.bumps:
+          self.errors.append('Pad %s: bump %s is already assigned to %s' % (name,bump,self.bumps[bump]['name']))
+        else:
+          self.bumps[bump] = row
+      position = row.get('position','').strip()
+      if position:
+        if not position.isdigit() or not 1 <= int(position) <= self.pads_per_side[s]:
+          self.errors.append('Pad %s: position %s is not between 1 and %d on side %s' % (name,position,self.pads_per_side[s],side))
+        elif int(position) in self.positions[s]:
+          self.errors.append('Pad %s: side %s position %s is already assigned to %s' % (name,side,position,self.positions[s][int(position)]['name']))
+        else:
+          self.positions[s][int(position)] = row
+    for s in range(4):
+      if len(self.sides[s]) > self.pads_per_side[s]:
+        self.errors.append('Side %d has %d pads, more than the %d positions' % (s+1,len(self.sides[s]),self.pads_per_side[s]))
+
+  def unused(self):
+    """ Number of unused positions on each side. """
+    return [max(self.pads_per_side[s] - len(self.sides[s]),0) for s in range(4)]
+
+  def free_positions(self,side):
+    """ Positions on side (1-4) that no pad claims, as (first, last) ranges. """
+    ranges = []
+    taken = self.positions[side-1]
+    first = None
+    for k in range(1,self.pads_per_side[side-1]+2):
+      if k not in taken and k <= self.pads_per_side[side-1]:
+        if first is None:
+          first = k
+      elif first is not None:
+        ranges.append((first,k-1))
+        first = None
+    return ranges
+
+
+def check_pads(vglist,pads_per_side=pads_per_side):
+  """
+  Check the pads fit the ring: sides, bump collisions, positions and
+  orientations.  Reports the free positions on every side, then asserts if
+  there were errors.  Returns the PadRing.
+  """
+  assert check_keys_exist(vglist,pads_keys), 'Pads CSV needs the columns: %s' % ', '.join(pads_keys)
+  ring = PadRing(vglist,pads_per_side)
+  for e in ring.errors:
+    print '** Error: %s' % e
+  for s, unused in enumerate(ring.unused()):
+    l = '** Side %d: %d of %d positions used, %d free' % (s+1,len(ring.sides[s]),ring.pads_per_side[s],unused)
+    if ring.positions[s]:
+      free = ', '.join(str(a) if a == b else '%d-%d' % (a,b) for a, b in ring.free_positions(s+1))
+      l += ' (unassigned positions: %s)' % (free if free else 'none')
+    print l
+  assert not ring.errors, 'Pad ring has %d errors' % len(ring.errors)
+  return ring
+
+
 ###############################################################################
 # Generate Verilog PADS module - ASIC
 ###############################################################################
 
-def gen_pads_module_asic(module_name,module_file,template_file,vglist):
-  """ Generate an _PADS module from a template file and a signal vglist """
+def unused_pad_cell(side,pad,inst):
+  """ Tied-off LIB_PAD instantiation for an unused position on side (1-4) """
+  l = in_cell + '\t#(.DIRECTION("UNUSED"),'
+  if (side == 1) or (side == 3):
+    l += '.ORIENTATION("H")'
+  elif (side == 2) or (side == 4):
+    l += '.ORIENTATION("V")'
+  l += ')\t'+inst+'\t('
+  l += '.PAD('+pad+')'
+  l += ',.IN(1\'b0)'
+  l += ',.OUT()'
+  l += ',.OEN(1\'b0)'
+  l += ',.DS(SC_PAD_DS),.SL(SC_PAD_SL),.ST(SC_PAD_ST),.RTE(SC_PAD_RTE));'
+  return l
+
+
+def gen_pads_module_asic(module_name,module_file,template_file,vglist,pads_per_side=pads_per_side,flat=False):
+  """
+  Generate an _PADS module from a template file and a signal vglist.
+  pads_per_side is the number of pad positions on each of the 4 sides.  The
+  unused positions are filled with tied-off cells, using one generate loop and
+  a PAD_UNUSED_<side> port array per side, or one line each if flat.
+  """
   assert check_keys_exist(vglist,pads_keys)
   
   # Find unused pad positions from vglist
-  unused_pos=[68,68,68,68]
-  for row in vglist:
-    side = int(row['side'])
-    unused_pos[(side-1)] -= 1
+  ring = PadRing(vglist,pads_per_side)
+  assert not ring.errors, 'Pad ring has errors, run check_pads(): %s' % ring.errors[0]
+  unused_pos = ring.unused()
 
   # Open template
   fi_template = open(template_file,"r")
@@ -192,9 +307,13 @@ def gen_pads_module_asic(module_name,module_file,template_file,vglist):
         unused_pad_num = unused_pos[side]
       else: 
         unused_pad_num = unused_pos[side] - 1
-      for k in range(unused_pad_num):
+      if flat:
+        for k in range(unused_pad_num):
+          fo.write(',\n')
+          fo.write('output\twire\tPAD_UNUSED_'+str(side+1)+'_'+str(k))
+      elif unused_pad_num > 0:
         fo.write(',\n')
-        fo.write('output\twire\tPAD_UNUSED_'+str(side+1)+'_'+str(k))
+        fo.write('output\twire\t['+str(unused_pad_num-1)+':0]\tPAD_UNUSED_'+str(side+1))
 
   # TOP signals
   fo.write(read_to_tag(fi_template,"VGEN: TOP LEVEL MODULE SIGNALS"))
@@ -291,7 +410,7 @@ def gen_pads_module_asic(module_name,module_file,template_file,vglist):
   fo.write('\n')
 
   # Add io cell instantiations for un-used bumps
-  fo.write('// Add Tied-off unused io-cells to fill out 272 bumps\n')
+  fo.write('// Add Tied-off unused io-cells to fill out '+str(sum(pads_per_side))+' bumps\n')
 #  for side in range(4):
 #    if len(unused_pos[side]) > 0:
 #      for k in range(len(unused_pos[side])):
@@ -301,21 +420,24 @@ def gen_pads_module_asic(module_name,module_file,template_file,vglist):
 
   for side in range(4):
     if unused_pos[side] > 0:
-      for k in range(unused_pos[side]):
-        if side == 3 and k == (unused_pos[side]-1):
-          fo.write('wire PAD_UNUSED_'+str(side+1)+'_'+str(k)+';\n')
-
-        l = in_cell + '\t#(.DIRECTION("UNUSED"),'
-        if ((side+1) == 1) or ((side+1) == 3):
-          l += '.ORIENTATION("H")'
-        elif ((side+1) == 2) or ((side+1) == 4):
-          l += '.ORIENTATION("V")'
-        l += ')\tuPAD_UNUSED_'+str(side+1)+'_'+str(k)+'\t('
-        l += '.PAD(PAD_UNUSED_'+str(side+1)+'_'+str(k)+')'
-        l += ',.IN(1\'b0)'
-        l += ',.OUT()'
-        l += ',.OEN(1\'b0)'
-        l += ',.DS(SC_PAD_DS),.SL(SC_PAD_SL),.ST(SC_PAD_ST),.RTE(SC_PAD_RTE));'
+      # The last unused position on side 4 is not a port
+      last = (side == 3)
+      num = unused_pos[side] - 1 if last else unused_pos[side]
+      if flat:
+        for k in range(num):
+          l = unused_pad_cell(side+1,'PAD_UNUSED_'+str(side+1)+'_'+str(k),'uPAD_UNUSED_'+str(side+1)+'_'+str(k))
+          l += '\t// Unused tied-off IO Cell: Side'+str(side+1)+' Position'+str(k)+'\n'
+          fo.write(l)
+      elif num > 0:
+        l = '// Unused tied-off IO Cells: Side'+str(side+1)+' Positions 0-'+str(num-1)+'\n'
+        l += 'for (genvar k=0; k<'+str(num)+'; k++) begin : g_unused_'+str(side+1)+'\n'
+        l += '  '+unused_pad_cell(side+1,'PAD_UNUSED_'+str(side+1)+'[k]','uPAD_UNUSED')+'\n'
+        l += 'end\n'
+        fo.write(l)
+      if last:
+        k = unused_pos[side] - 1
+        fo.write('wire PAD_UNUSED_'+str(side+1)+'_'+str(k)+';\n')
+        l = unused_pad_cell(side+1,'PAD_UNUSED_'+str(side+1)+'_'+str(k),'uPAD_UNUSED_'+str(side+1)+'_'+str(k))
         l += '\t// Unused tied-off IO Cell: Side'+str(side+1)+' Position'+str(k)+'\n'
         fo.write(l)
       fo.write('\n')
@@ -430,14 +552,19 @@ def main():
   # Setup parser.
   parser = argparse.ArgumentParser(description='Generate everything required for pads.')
   parser.add_argument('-u','--update', nargs='?', const='../TOP.sv', type=str, help='Read in specified verilog file, find any new registers and add to CSV.', required=False)
+  parser.add_argument('-I','--incdir', action='append', default=[], help='Include directory for `include when reading verilog (repeatable).', required=False)
+  parser.add_argument('-D','--define', action='append', default=[], help='Define a macro, NAME or NAME=VALUE, when reading verilog (repeatable).', required=False)
+  parser.add_argument('-k','--check', action='store_true', help='Read in CSV and check the pad ring: sides, bumps, positions and orientations.', required=False)
   parser.add_argument('-g','--generate', nargs='?', const='TOP_PADS', type=str, help='Read in CSV and generate top-level module containing pads, with specified module name.', required=False)
   parser.add_argument('-c','--csv', default='pads.csv', type=str, help='Specifies the csv file.', required=False)
   parser.add_argument('-o','--output', default='output', help='Specifies an output directory.', required=False)
+  parser.add_argument('-n','--pads-per-side', default=','.join(str(x) for x in pads_per_side), type=str, help='Number of pad positions per side: one number, or four comma separated (left,top,right,bottom).', required=False)
+  parser.add_argument('--flat', action='store_true', help='Instantiate every unused pad on its own line instead of in generate loops.', required=False)
   #parser.add_argument('-c','--clock', default='?clk', help='Specify the name of the clock in the instantiation template.', required=False)
   #parser.add_argument('-r','--reset', default='?rstn', help='Specify the name of the reset in the instantiation template.', required=False)
   args = parser.parse_args()
-  if not (args.generate or args.update):
-    parser.error('No action specified.  Please specify an action: --update or --generate')
+  if not (args.generate or args.update or args.check):
+    parser.error('No action specified.  Please specify an action: --update, --check or --generate')
   print 'Command line arguments: %s' + str(args)
 
   # Run scripts.
@@ -448,16 +575,24 @@ def main():
 
   if (args.update):
     print args.update
-    update_pads_csv_from_verilog(csv_file,verilog_file,pd_csv_file,ignore_prefix='SC_')
+    defines = dict((x.split('=',1) + [''])[:2] for x in args.define)
+    update_pads_csv_from_verilog(csv_file,verilog_file,pd_csv_file,ignore_prefix='SC_',incdirs=args.incdir,defines=defines)
+
+  sides = [int(x,0) for x in args.pads_per_side.split(',')]
+  if len(sides) == 1:
+    sides = sides * 4
+
+  if (args.check or args.generate):
+    # Read in the pads list and check it fits the ring
+    vglist = read_csv(csv_file,debug=False)
+    check_pads(vglist,sides)
 
   if (args.generate):
     module_name = args.generate
     module_file = args.output + '/' + module_name + '.sv'
     instance_file = args.output + '/' + module_name + '_instance.sv'
-    # Read in the pads list
-    vglist = read_csv(csv_file,debug=False)
     # generate verilog
-    gen_pads_module_asic(module_name,module_file,template_file,vglist)
+    gen_pads_module_asic(module_name,module_file,template_file,vglist,pads_per_side=sides,flat=args.flat)
     gen_pads_instance_asic(module_name,instance_file,vglist)
 
 
@@ -0,0 +1,159 @@
+# VGEN: HEADER
+
+
+import numpy as np
+
+
+class _RegModel(object):
+	"""
+	NumPy behavioural model of a generated register block, following the generated RTL.
+
+	FIELDS lists (name, word, start bit, nbits, access, reset value, count); arrays
+	take count consecutive words.  The word address is regbus.addr[9:2] relative to
+	base_offset.  RW fields hold the write data, read-only fields and counters read
+	back values set with set_input(), the map ID is a constant, and the counter
+	control keeps only its enable bit (clear and snapshot are pulses that read as
+	zero).  Unmapped words read as zero and ignore writes.
+
+	Counters do not count, and the clear and snapshot pulses have no effect: a
+	counter reads back its set_input() value, so snapshot() and counter_rates() of
+	the register class only see those values on the model.
+
+	apply() runs a batch of transactions in order without a Python loop.  The model
+	also provides read32/write32/read_many/write_many, so it can stand in for the
+	hardware as the transport of the generated register class.
+	"""
+
+	FIELDS = []
+	WORDS = 256
+
+	def __init__(self,base_offset=0):
+		self.base_offset = base_offset
+		self.rw_mask = np.zeros(self.WORDS,dtype=np.uint32)
+		self.ro_mask = np.zeros(self.WORDS,dtype=np.uint32)
+		self.const = np.zeros(self.WORDS,dtype=np.uint32)
+		self.reset_value = np.zeros(self.WORDS,dtype=np.uint32)
+		self.inputs = np.zeros(self.WORDS,dtype=np.uint32)
+		self._fields = {}
+		for name, word, start, nbits, access, rval, count in self.FIELDS:
+			mask = ((1 << nbits) - 1) << start
+			words = slice(word,word + max(count,1))
+			self._fields[name] = (word, start, nbits, max(count,1))
+			if access == 'rw':
+				self.rw_mask[words] |= mask
+				self.reset_value[words] |= (rval << start) & mask
+			elif access == 'counter_ctrl':
+				self.rw_mask[words] |= 1 << start
+				self.reset_value[words] |= (rval << start) & (1 << start)
+			elif access == 'id':
+				self.const[words] |= (rval << start) & mask
+			else:                   # r, counter, counter_sat
+				self.ro_mask[words] |= mask
+		self.reset()
+
+
+	###########################################################################
+	# State
+	###########################################################################
+
+	def reset(self):
+		""" Return the RW fields to their reset values.  Inputs are left as they are. """
+		self.state = self.reset_value.copy()
+
+	def _field_words(self,name,index):
+		word, start, nbits, count = self._fields[name.upper()]
+		words = np.arange(word,word + count) if index is None else word + np.asarray(index)
+		assert np.all((words >= word) & (words < word + count)), '%s has %d elements' % (name,count)
+		return words, start, ((1 << nbits) - 1) << start
+
+	def set_input(self,name,value,index=None):
+		""" Drive a read-only field or counter: one value, or one per element of an array. """
+		words, start, mask = self._field_words(name,index)
+		value = (np.asarray(value,dtype=np.uint64) << np.uint64(start)) & np.uint64(mask)
+		self.inputs[words] = (self.inputs[words] & ~np.uint32(mask)) | value.astype(np.uint32)
+
+	def output(self,name,index=None):
+		""" Value of an RW field as driven on the module output: an int, or an array for an array field. """
+		words, start, mask = self._field_words(name,index)
+		values = (self.state[words] & np.uint32(mask)) >> np.uint32(start)
+		return int(values[0]) if values.size == 1 and index is None and self._fields[name.upper()][3] == 1 else values
+
+
+	###########################################################################
+	# Transactions
+	###########################################################################
+
+	def word(self,addrs):
+		""" Word address decoded from bus addresses, as regbus.addr[9:2]. """
+		return ((np.asarray(addrs,dtype=np.int64) - self.base_offset) >> 2) & (self.WORDS - 1)
+
+	def apply(self,addrs,wdata,write):
+		"""
+		Apply a batch of transactions in order: arrays of addresses, write data and write
+		flags.  Returns the read data of every transaction (zero for writes).
+
+		Every write replaces all the RW bits of its word, so the value seen by a
+		transaction is the data of the last write to the same word at or before it, found
+		by sorting the batch by word and carrying the last write position forward.
+		"""
+		words = self.word(addrs)
+		n = len(words)
+		if n == 0:
+			return np.zeros(0,dtype=np.uint32)
+		wdata = (np.asarray(wdata,dtype=np.uint64) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+		write = np.asarray(write,dtype=bool)
+
+		# Last write to the same word, at or before each transaction (-1 if none)
+		order = np.argsort(words,kind='stable')
+		sorted_words = words[order]
+		last = np.where(write[order],sorted_words * n + order,-1)
+		np.maximum.accumulate(last,out=last)
+		own = (last >= 0) & (last // n == sorted_words)
+		prev = np.empty(n,dtype=np.int64)
+		prev[order] = np.where(own,last % n,-1)
+
+		current = np.where(prev >= 0,wdata[prev],self.state[words])
+		rdata = (current & self.rw_mask[words]) | (self.inputs[words] & self.ro_mask[words]) | self.const[words]
+		rdata[write] = 0
+
+		# The last transaction of each word leaves the final state
+		end = np.ones(n,dtype=bool)
+		end[:-1] = sorted_words[1:] != sorted_words[:-1]
+		end &= own
+		self.state[sorted_words[end]] = wdata[last[end] % n] & self.rw_mask[sorted_words[end]]
+		return rdata
+
+	def random_transactions(self,n,seed=0,write_fraction=0.5,mapped_only=True):
+		""" n random (addrs, wdata, write) transactions, to mapped words only unless mapped_only is False. """
+		rng = np.random.default_rng(seed)
+		mapped = np.flatnonzero(self.rw_mask | self.ro_mask | self.const)
+		if mapped_only and len(mapped):
+			words = rng.choice(mapped,n)
+		else:
+			words = rng.integers(0,self.WORDS,n)
+		wdata = rng.integers(0,1 << 32,n,dtype=np.uint64).astype(np.uint32)
+		return self.base_offset + 4 * words, wdata, rng.random(n) < write_fraction
+
+
+	###########################################################################
+	# Transport
+	###########################################################################
+
+	def read_many(self,addrs):
+		addrs = list(addrs)
+		return [int(x) for x in self.apply(addrs,np.zeros(len(addrs)),np.zeros(len(addrs),dtype=bool))]
+
+	def write_many(self,pairs):
+		pairs = list(pairs)
+		if pairs:
+			addrs, values = zip(*pairs)
+			self.apply(addrs,values,np.ones(len(pairs),dtype=bool))
+
+	def read32(self,addr):
+		return self.read_many([addr])[0]
+
+	def write32(self,addr,data):
+		self.write_many([(addr,data)])
+
+
+# VGEN: CLASS
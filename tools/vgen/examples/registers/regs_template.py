@@ -0,0 +1,374 @@
+# VGEN: HEADER
+
+
+import contextlib
+import json
+import os
+import sys
+import time
+
+
+class _RegBlock(object):
+	"""
+	Common accessors for a generated register block.
+
+	FIELDS maps each field name to (word offset, start bit, nbits, access, reset value).
+	ARRAYS maps each register array to (word offset, start bit, nbits, access, reset
+	value, count), with one element per word; element i is the field NAME[i], and
+	array(NAME) gives an indexable accessor.
+	COUNTERS maps each counter field or array to 'wrap' or 'sat', and COUNTER_CTRL
+	names the field with the counter enable, clear and snapshot bits.
+	FINGERPRINT is the register map fingerprint the block was generated with, read
+	back from FINGERPRINT_FIELD, so a host can check the chip matches this class and
+	keep shadow state per map.
+	The transport is any object providing read32(addr) and write32(addr,data).
+	If it also provides read_many(addrs) and write_many(pairs), bulk accesses are
+	handed over in one call, so a pipelined driver can keep them all in flight.
+
+	Words containing only RW fields are shadowed: once written (or read), further
+	reads and read-modify-writes are served from the shadow without touching the link.
+	"""
+
+	FIELDS = {}
+	ARRAYS = {}
+	COUNTERS = {}
+	COUNTER_CTRL = None
+	FINGERPRINT = None
+	FINGERPRINT_FIELD = None
+
+	def __init__(self,base_offset,transport=None):
+		self.base_offset = base_offset
+		self.transport = transport
+		if self.ARRAYS:         # Array elements become fields of this instance
+			self.FIELDS = dict(self.FIELDS)
+			for name, (offset, start, nbits, access, rval, count) in self.ARRAYS.items():
+				for i in range(count):
+					self.FIELDS['%s[%d]' % (name,i)] = (offset + 4*i, start, nbits, access, rval)
+		self._shadow = {}       # word offset -> value last written to / read from the chip
+		self._batch = None      # word offset -> [value, mask] staged inside batch()
+		self._batch_depth = 0
+
+		# Group the fields into words
+		self._word_mask = {}
+		self._cacheable = {}
+		for name, (offset, start, nbits, access, rval) in self.FIELDS.items():
+			self._word_mask[offset] = self._word_mask.get(offset,0) | self._field_mask(name)
+			self._cacheable[offset] = self._cacheable.get(offset,True) and (access == 'rw')
+
+
+	###########################################################################
+	# Helpers
+	###########################################################################
+
+	def _field(self,name):
+		return self.FIELDS[name.upper()]
+
+	def _field_mask(self,name):
+		offset, start, nbits, access, rval = self._field(name)
+		return ((1 << nbits) - 1) << start
+
+	def addr(self,name):
+		""" Bus address of the word holding the named field. """
+		return self.base_offset + self._field(name)[0]
+
+	def array(self,name):
+		""" Indexable accessor for a register array: regs.array('GAIN')[3], [:] or [0:8] = values. """
+		return _RegArray(self,name.upper())
+
+	def _read_words(self,offsets):
+		if not offsets:
+			return []
+		addrs = [self.base_offset + x for x in offsets]
+		if hasattr(self.transport,'read_many'):
+			values = list(self.transport.read_many(addrs))
+		else:
+			values = [self.transport.read32(a) for a in addrs]
+		for offset, value in zip(offsets,values):
+			if self._cacheable.get(offset,False):
+				self._shadow[offset] = value
+		return values
+
+	def _write_words(self,pairs):
+		pairs = list(pairs)
+		if hasattr(self.transport,'write_many'):
+			self.transport.write_many([(self.base_offset + x, v) for x, v in pairs])
+		else:
+			for offset, value in pairs:
+				self.transport.write32(self.base_offset + offset, value)
+		for offset, value in pairs:
+			if self._cacheable.get(offset,False):
+				self._shadow[offset] = value
+
+
+	###########################################################################
+	# Shadow state
+	###########################################################################
+
+	def invalidate(self,name=None):
+		""" Forget the shadow value of one field's word, or of every word. """
+		if name is None:
+			self._shadow = {}
+		else:
+			self._shadow.pop(self._field(name)[0],None)
+
+	def reset_shadow(self):
+		""" Assume the block has just come out of reset and load the shadow with reset values. """
+		self._shadow = {}
+		for name, (offset, start, nbits, access, rval) in self.FIELDS.items():
+			if self._cacheable[offset]:
+				self._shadow[offset] = self._shadow.get(offset,0) | ((rval << start) & self._field_mask(name))
+
+
+	###########################################################################
+	# Word access
+	###########################################################################
+
+	def read_word(self,offset,cached=True):
+		""" Read a whole word, from the shadow if it is valid and cached is set. """
+		if cached and offset in self._shadow:
+			return self._shadow[offset]
+		return self._read_words([offset])[0]
+
+	def write_word(self,offset,value):
+		""" Write a whole word (staged if inside a batch). """
+		if self._batch is not None:
+			self._batch[offset] = [value, 0xFFFFFFFF]
+		else:
+			self._write_words([(offset,value)])
+
+
+	###########################################################################
+	# Field access
+	###########################################################################
+
+	def read(self,name,cached=True):
+		""" Read a single field. """
+		offset, start, nbits, access, rval = self._field(name)
+		if self._batch is not None and offset in self._batch:
+			value, mask = self._batch[offset]
+			if mask & self._field_mask(name) == self._field_mask(name):
+				return (value >> start) & ((1 << nbits) - 1)
+		return (self.read_word(offset,cached) >> start) & ((1 << nbits) - 1)
+
+	def write(self,name,value):
+		""" Write a single field.  Other fields in the same word are preserved. """
+		offset, start, nbits, access, rval = self._field(name)
+		assert access not in ('r','counter','counter_sat','id'), 'Field %s is read-only' % name
+		if self._batch is None:
+			with self.batch():
+				return self.write(name,value)
+		old_value, old_mask = self._batch.get(offset,[0,0])
+		mask = self._field_mask(name)
+		self._batch[offset] = [(old_value & ~mask) | ((value << start) & mask), old_mask | mask]
+
+	def read_many(self,names,cached=True):
+		""" Read a list of fields, fetching each uncached word once in a single bulk access. """
+		offsets = [self._field(x)[0] for x in names]
+		wanted = sorted(set(x for x in offsets if not (cached and x in self._shadow)))
+		words = dict(zip(wanted,self._read_words(wanted)))
+		words.update((x, self._shadow[x]) for x in offsets if x not in words)
+		values = []
+		for name, offset in zip(names,offsets):
+			start, nbits = self._field(name)[1:3]
+			values.append((words[offset] >> start) & ((1 << nbits) - 1))
+		return values
+
+	def write_many(self,items):
+		""" Write several fields, given as a dict or a list of (name, value) pairs. """
+		if hasattr(items,'items'):
+			items = items.items()
+		with self.batch():
+			for name, value in items:
+				self.write(name,value)
+
+
+	###########################################################################
+	# Batching
+	###########################################################################
+
+	@contextlib.contextmanager
+	def batch(self):
+		"""
+		Coalesce field writes into one write per word, issued as a single bulk access on exit.
+		Batches may be nested; only the outermost one flushes.  If a nested batch
+		raises, the writes staged inside it are dropped, and the outer batch keeps
+		its own.
+		"""
+		outer = dict(self._batch) if self._batch_depth else None
+		if self._batch_depth == 0:
+			self._batch = {}
+		self._batch_depth += 1
+		done = False
+		try:
+			yield self
+			done = True
+		finally:
+			self._batch_depth -= 1
+			if not done and outer is not None:
+				self._batch = outer     # Back to the outer batch as it was before this one
+			if self._batch_depth == 0:
+				staged, self._batch = self._batch, None
+				if done:                # Drop the staged writes if the batch raised
+					self._flush(staged)
+
+	def _flush(self,staged):
+		# Words that are not fully covered need their other fields from the shadow or the chip
+		partial = [x for x in sorted(staged) if (staged[x][1] & self._word_mask.get(x,0xFFFFFFFF)) != self._word_mask.get(x,0xFFFFFFFF)]
+		fetch = [x for x in partial if x not in self._shadow]
+		words = dict(zip(fetch,self._read_words(fetch)))
+		pairs = []
+		for offset in sorted(staged):
+			value, mask = staged[offset]
+			if offset in partial:
+				base = words[offset] if offset in words else self._shadow[offset]
+				value = (base & ~mask) | (value & mask)
+			pairs.append((offset, value & 0xFFFFFFFF))
+		self._write_words(pairs)
+
+
+	###########################################################################
+	# Counters
+	###########################################################################
+
+	def counter_names(self):
+		""" Every counter field, with array counters expanded to their elements. """
+		names = []
+		for name in sorted(self.COUNTERS):
+			if name in self.ARRAYS:
+				names += ['%s[%d]' % (name,i) for i in range(self.ARRAYS[name][5])]
+			else:
+				names.append(name)
+		return names
+
+	def counters_enable(self,enable=True,clear=False):
+		""" Start or stop the counters, optionally clearing them. """
+		self._counters_enabled = enable
+		self.write(self.COUNTER_CTRL,(1 if enable else 0) | (2 if clear else 0))
+
+	def snapshot(self,clear=False):
+		"""
+		Capture every counter at the same cycle, then read them all in one bulk access.
+		Returns {name: count}.  If clear, the counters restart from zero after the capture.
+		"""
+		enabled = getattr(self,'_counters_enabled',self._field(self.COUNTER_CTRL)[4] & 1)
+		self.write(self.COUNTER_CTRL,(1 if enabled else 0) | 4 | (2 if clear else 0))
+		names = self.counter_names()
+		return dict(zip(names,self.read_many(names,cached=False)))
+
+	def _counter_delta(self,name,first,second):
+		nbits = self._field(name)[2]
+		if self.COUNTERS[name.split('[')[0]] == 'wrap':
+			return (second - first) % (1 << nbits)
+		return second - first
+
+	def counter_rates(self,interval=1.0,ref=None):
+		"""
+		Snapshot the counters interval seconds apart.  Returns {name: (count, rate, saturated)}
+		where rate is events per second, or per event of the ref counter (e.g. a cycle
+		counter, giving utilisation) if ref is given.  Wrapping counters are assumed to
+		wrap at most once in the interval.
+		"""
+		first = self.snapshot()
+		t = time.time()
+		time.sleep(interval)
+		second = self.snapshot()
+		elapsed = time.time() - t
+		deltas = dict((x, self._counter_delta(x,first[x],second[x])) for x in second)
+		per = float(deltas[ref.upper()]) if ref else elapsed
+		rates = {}
+		for name, delta in deltas.items():
+			saturated = self.COUNTERS[name.split('[')[0]] == 'sat' and second[name] == (1 << self._field(name)[2]) - 1
+			rates[name] = (second[name], delta / per if per else 0.0, saturated)
+		return rates
+
+	def counter_report(self,interval=1.0,ref=None,fo=sys.stdout):
+		""" Print the counts and rates from counter_rates(). """
+		rates = self.counter_rates(interval,ref)
+		fo.write('%-24s %14s %16s\n' % ('Counter', 'Count', 'Per '+ref.upper() if ref else 'Per second'))
+		for name in self.counter_names():
+			count, rate, saturated = rates[name]
+			fo.write('%-24s %14d %16.6g%s\n' % (name, count, rate, '  (saturated)' if saturated else ''))
+		return rates
+
+
+	###########################################################################
+	# Fingerprint
+	###########################################################################
+
+	def check_fingerprint(self):
+		""" Read the map ID register (one access) and check the chip has this register map. """
+		assert self.FINGERPRINT_FIELD, 'Register block was generated without a map ID register'
+		value = self.read(self.FINGERPRINT_FIELD,cached=False)
+		if value != self.FINGERPRINT:
+			raise ValueError('Register map fingerprint mismatch at 0x%x: chip 0x%08x, expected 0x%08x' % (self.addr(self.FINGERPRINT_FIELD),value,self.FINGERPRINT))
+		return value
+
+	def save_shadow(self,path):
+		""" Save the shadow state to a file, tagged with the map fingerprint. """
+		with open(path,'w') as f:
+			json.dump({'fingerprint': self.FINGERPRINT, 'base_offset': self.base_offset,
+				'shadow': dict(('%x' % k, v) for k, v in self._shadow.items())}, f)
+
+	def load_shadow(self,path,check=True):
+		"""
+		Restore shadow state saved by save_shadow(), if it was saved for this register map
+		and base address.  With check, the chip's map ID is checked first (one access).
+		Only valid if the chip has not been reset or written by anything else since.
+		Returns True if the shadow was restored.
+		"""
+		if check:
+			self.check_fingerprint()
+		if not os.path.isfile(path):
+			return False
+		with open(path) as f:
+			saved = json.load(f)
+		if saved.get('fingerprint') != self.FINGERPRINT or saved.get('base_offset') != self.base_offset:
+			return False
+		self._shadow = dict((int(k,16), v) for k, v in saved['shadow'].items())
+		return True
+
+
+class _RegArray(object):
+	"""
+	Element access to a register array of a _RegBlock.  Slices are read with one
+	bulk access and written inside one batch.
+	"""
+
+	def __init__(self,block,name):
+		self.block = block
+		self.name = name
+		self.count = block.ARRAYS[name][5]
+
+	def __len__(self):
+		return self.count
+
+	def _names(self,key):
+		if isinstance(key,slice):
+			return ['%s[%d]' % (self.name,i) for i in range(*key.indices(self.count))]
+		if key < 0:
+			key += self.count
+		assert 0 <= key < self.count, '%s has %d elements: %d' % (self.name,self.count,key)
+		return '%s[%d]' % (self.name,key)
+
+	def addr(self,i):
+		return self.block.addr(self._names(i))
+
+	def __getitem__(self,key):
+		names = self._names(key)
+		if isinstance(names,list):
+			return self.block.read_many(names)
+		return self.block.read(names)
+
+	def __setitem__(self,key,value):
+		names = self._names(key)
+		if isinstance(names,list):
+			values = list(value) if hasattr(value,'__iter__') else [value] * len(names)
+			assert len(values) == len(names), '%d values for %d elements of %s' % (len(values),len(names),self.name)
+			self.block.write_many(zip(names,values))
+		else:
+			self.block.write(names,value)
+
+
+# VGEN: CLASS
+
+
@@ -56,7 +56,7 @@ begin
   end	
 end
 
-assign regbus.rdata[31:0] = rdata_o[31:0];
+// VGEN: READ DATA
 
 
 //------------------------------------------------------------------------------
@@ -41,10 +41,12 @@ regs_keys = [
 # FIXME must check not only for new signals, but also for changes in existing signals
 
 
-def update_regs_csv_from_verilog(csv_file,verilog_file,match_prefix=''):
+def update_regs_csv_from_verilog(csv_file,verilog_file,match_prefix='',incdirs=[],defines={}):
   """
   Read in CSV and Verilog files,
   Any new signals anywhere in Verilog that match the prefix and do not exist in CSV are added to CSV.
+  verilog_file may be a list of files.  They are preprocessed with the include
+  directories and defines given, sharing the expansion of common headers.
   Will warn about any signals found in CSV that do not exist in Verilog.
   Return True if any new signals were added to csv.
   """
@@ -54,7 +56,8 @@ def update_regs_csv_from_verilog(csv_file,verilog_file,match_prefix=''):
   check_keys_exist(csv_vglist,regs_keys)
 
   # Read in verilog file to get all signals that match the prefix.
-  verilog_vglist = get_verilog_signals(verilog_file,match_prefix)
+  preprocessor = VerilogPreprocessor(incdirs,defines)
+  verilog_vglist = get_verilog_signals(verilog_file,match_prefix,preprocessor)
   
   # TODO check for changes in the contents of other fields
   # Compare the two lists, keep signals that are in verilog and not in CSV
@@ -74,7 +77,7 @@ def update_regs_csv_from_verilog(csv_file,verilog_file,match_prefix=''):
   if new_in_verilog != []: 
     print 'Found new signals in Verilog file (not listed in CSV):\n %s' % str([d['name'] for d in new_in_verilog])
     print 'Updating CSV file: %s' % csv_file
-    append_csv(csv_file,new_in_verilog,regs_keys,unused_str='')
+    new_in_verilog = append_csv(csv_file,new_in_verilog,regs_keys,unused_str='',base=csv_vglist)
 
   # Return true if new signals were added to FE csv
   if new_in_verilog != []:
@@ -88,7 +91,220 @@ def update_regs_csv_from_verilog(csv_file,verilog_file,match_prefix=''):
 ###############################################################################
 
 
-def gen_regs_module(module_name,module_file,template_file,regs):
+# Address decode and read mux options for gen_regs_module():
+#   decode      'compare'   compare regbus.addr in every write and read (default)
+#               'onehot'    one shared select per register word, used by the writes and reads
+#   read_mux    'if'        priority if chain (default)
+#               'case'      case on the word address
+#               'unique'    unique case on the word address
+#               'onehot'    AND-OR of the one-hot selects (needs decode='onehot')
+#   read_reg    register the read data, adding one cycle of read latency
+regs_decodes = ['compare','onehot']
+regs_read_muxes = ['if','case','unique','onehot']
+
+
+def addr_hex(idx):
+  """ Word address of a register, as used in the regbus.addr[9:2] compares """
+  return "8'h"+(hex(int(idx)).lstrip("0x") or "0")
+
+
+def reg_arrays(regs):
+  """
+  Expand register array rows, named like gain[64], into 'count' consecutive words from
+  idx (one element per word).  Scalar rows get a count of 0.  Returns a new list, and
+  leaves rows that have already been expanded as they are.
+  """
+  out = []
+  used = {}                       # word -> (idx, count) of the rows using it
+  for row in regs:
+    row = dict(row)
+    if 'count' not in row:
+      m = re.match(r'^(\w+)\[(\d+)\]$',row['name'].strip())
+      if m:
+        row['name'], row['count'] = m.group(1), int(m.group(2))
+        assert row['count'] > 0, 'Register array %s has no elements' % row['name']
+      else:
+        row['count'] = 0
+    idx, count = int(row['idx']), int(row['count'])
+    assert idx + max(count,1) <= 256, 'Register %s does not fit in the 256 word address space' % row['name']
+    # Arrays may only share words with arrays of the same index and length
+    for word in range(idx,idx+max(count,1)):
+      assert used.setdefault(word,(idx,count)) == (idx,count), 'Register %s overlaps another register or array at word %d' % (row['name'],word)
+    out.append(row)
+  return out
+
+
+def reg_words(regs):
+  """
+  Registers grouped by word, or by run of words for arrays: list of (idx, count, [rows])
+  in index order.  Fields may share a word, and arrays of the same length may share a run.
+  """
+  words = {}
+  for row in regs:
+    words.setdefault((int(row['idx']),int(row['count'])),[]).append(row)
+  return [(idx, count, rows) for (idx, count), rows in sorted(words.items())]
+
+
+def reg_members(regs):
+  """
+  C struct member holding each field: the first field of its word, or of its run of
+  words for arrays.  Returns a dict of field name -> member name.
+  """
+  members = {}
+  for idx, count, rows in reg_words(regs):
+    for row in rows:
+      members[row['name']] = rows[0]['name']
+  return members
+
+
+def array_dims(row):
+  """ Packed array dims of a register array, or an empty string for a scalar """
+  return "["+str(int(row['count'])-1)+":0]" if int(row['count']) else ""
+
+
+def reg_sel(row,decode,i='i'):
+  """ Write/read select of a register, or of element i of an array """
+  if decode == 'onehot':
+    return "sel_idx"+str(int(row['idx']))+("["+i+"]" if int(row['count']) else "")
+  return "(regbus.addr[9:2]=="+addr_hex(row['idx'])+("+"+i if int(row['count']) else "")+")"
+
+
+# Counter access types.  A counter counts its <name>_event input while enabled, and
+# reads back the value captured by the last snapshot.  One counter_ctrl field per
+# block holds the counter controls, bit 0 enable, bit 1 clear and bit 2 snapshot;
+# clear and snapshot act once per write.  A snapshot in the same write as a clear
+# captures the counts before they are cleared.
+counter_access = {
+  'counter':      'wrap',     # wraps to zero
+  'counter_sat':  'sat',      # saturates at all-ones
+  }
+
+
+def is_counter(row):
+  return row['access'].lower() in counter_access
+
+
+def counter_ctrl(regs):
+  """ The counter_ctrl field, checked, or None if the block has no counters """
+  ctrl = [row for row in regs if row['access'].lower() == 'counter_ctrl']
+  if not any(is_counter(row) for row in regs):
+    assert not ctrl, 'Counter control %s without any counters' % ctrl[0]['name']
+    return None
+  assert len(ctrl) == 1, 'Counters need exactly one counter_ctrl field, found %d' % len(ctrl)
+  assert int(ctrl[0]['nbits']) == 3 and not int(ctrl[0]['count']), 'Counter control %s must be a 3-bit scalar field' % ctrl[0]['name']
+  return ctrl[0]
+
+
+def reg_rdata(row):
+  """ Signal read back for a register: the port, the snapshot of a counter, or the map ID constant """
+  if is_counter(row):
+    return row['name']+"_snap"
+  if row['access'].lower() == 'counter_ctrl':
+    return row['name']+"_reg"
+  if is_map_id(row):
+    return row['name'].upper()
+  return row['name']
+
+
+# Keys that define the register map, hashed into the map ID register
+regs_fingerprint_keys = ['idx','name','nbits','start','access','rval']
+
+
+def is_map_id(row):
+  return row['access'].lower() == 'id'
+
+
+def regs_fingerprint(regs):
+  """
+  Fingerprint of the register map.  Rows are taken in (idx, start) order and the
+  numbers are parsed, so reordering the CSV or writing a value differently ('0x0'
+  or '0') leaves it unchanged.
+  """
+  rows = []
+  for row in regs:
+    row = dict((key,str(row.get(key,'')).strip().lower()) for key in regs_fingerprint_keys)
+    for key in ['idx','nbits','start']:
+      row[key] = int(row[key])
+    row['rval'] = int(row['rval'],0) if row['rval'] else 0
+    rows.append(row)
+  return fingerprint(sorted(rows,key=lambda r: (r['idx'],r['start'],r['name'])),regs_fingerprint_keys)
+
+
+def add_map_id(regs,idx,memmaps=[]):
+  """
+  Return regs with a read-only MAP_ID register at word idx, holding the fingerprint of
+  the register map.  The memmap_fingerprint() of each memory map vglist (the
+  MEMMAP_FINGERPRINT generated by vgen_memmap.py) is folded in.
+  """
+  for row in reg_arrays(regs):
+    assert not int(row['idx']) <= idx < int(row['idx'])+max(int(row['count']),1), 'MAP_ID at idx %d overlaps register %s' % (idx,row['name'])
+  fp = regs_fingerprint(regs)
+  for vglist in memmaps:
+    fp = fingerprint([{'memmap': '%08x' % memmap_fingerprint(parse_memmap(vglist))}],['memmap'],fp)
+  print "**Register map fingerprint: 0x%08x (MAP_ID at idx %d)" % (fp,idx)
+  return regs + [{
+    'idx': str(idx),
+    'name': 'map_id',
+    'nbits': '32',
+    'start': '0',
+    'access': 'id',
+    'test': '0',
+    'rval': '0x%08x' % fp,
+    'desc': 'Register map fingerprint',
+    }]
+
+
+def map_id(regs):
+  """ The map ID register, or None """
+  ids = [row for row in regs if is_map_id(row)]
+  assert len(ids) <= 1, 'More than one map ID register'
+  return ids[0] if ids else None
+
+
+def reg_reset(row):
+  """ Reset assignment of a register """
+  if int(row['rval'].rsplit('0x')[1]) == 0:
+    return " <= \'0;\n"
+  else:   # TODO really should get the correct number of digits for the reset value
+    return " <= " + row['nbits'] + "\'h" + row['rval'].rsplit("0x")[1] + ";\n"
+
+
+def clog2(n):
+  """ ceil(log2(n)), 0 for n <= 1 """
+  return (n-1).bit_length() if n > 1 else 0
+
+
+def regs_logic_depth(regs,decode='compare',read_mux='if',read_reg=False):
+  """
+  Rough logic depth estimate of each block of the generated module, in 2-input gate levels.
+  Returns a list of (block, structure, depth).
+  """
+  nwords = sum(max(count,1) for idx, count, rows in reg_words(regs))
+  cmp_depth = clog2(8)                 # 8-bit compare against a constant
+  blocks = []
+  if decode == 'onehot':
+    blocks.append(('address decode','%d shared one-hot selects' % nwords,cmp_depth))
+  else:
+    blocks.append(('address decode','compare per write and read',cmp_depth))
+  blocks.append(('register write','write_en & select',cmp_depth+1))
+  if read_mux == 'if':
+    blocks.append(('read mux','if chain over %d words' % nwords,cmp_depth+nwords))
+  elif read_mux == 'onehot':
+    blocks.append(('read mux','AND-OR over %d words' % nwords,cmp_depth+1+clog2(nwords)))
+  else:
+    blocks.append(('read mux','%s over %d words' % ('unique case' if read_mux == 'unique' else 'case',nwords),cmp_depth+1+clog2(nwords)))
+  if read_reg:
+    blocks.append(('read data','registered, +1 cycle latency',0))
+  else:
+    blocks.append(('read data','combinational from read mux',blocks[-1][2]))
+  counters = [row for row in regs if is_counter(row)]
+  if counters:
+    width = max(int(row['nbits']) for row in counters)
+    blocks.append(('counters','%d-bit increment, enable, clear' % width,clog2(width)+3))
+  return blocks
+
+
+def gen_regs_module(module_name,module_file,template_file,regs,decode='compare',read_mux='if',read_reg=False):
   """ Generate a CSR module from a template file and a signal list """
 
   # Check the required keys are present (others will be ignored)
@@ -103,6 +319,12 @@ def gen_regs_module(module_name,module_file,template_file,regs):
     'desc'      # simple informative description
     ]
   assert check_keys_exist(regs,csr_keys)
+  assert decode in regs_decodes, 'Unknown decode: %s' % decode
+  assert read_mux in regs_read_muxes, 'Unknown read mux: %s' % read_mux
+  assert read_mux != 'onehot' or decode == 'onehot', 'The onehot read mux needs the onehot decode'
+  regs = reg_arrays(regs)
+  words = reg_words(regs)
+  ctrl = counter_ctrl(regs)
 
   # Open template
   fi_template = open(template_file,"r")
@@ -130,56 +352,182 @@ def gen_regs_module(module_name,module_file,template_file,regs):
   fo.write(read_to_tag(fi_template,"VGEN: MODULE NAME"))
   fo.write(module_name+"\n")
   
-  # Port list inputs
-  fo.write(read_to_tag(fi_template,"VGEN: INPUTS TO REGS"))
+  # Port list: (declaration, comment) of the inputs and the outputs
+  inputs = []
+  outputs = []
   for n, row in enumerate(regs):
     if (row['access'] == "r"):
-      l = "input  logic "+reg_dims(row)+" "+row['name']+",\t"
-      l += "/* idx #"+str(n)+": "+row['desc']+" */" + "\n"
-      fo.write(l)
-  
+      inputs.append(("input  logic "+array_dims(row)+reg_dims(row)+" "+row['name'],
+        "\t/* idx #"+str(n)+": "+row['desc']+" */"))
+    elif is_counter(row):
+      inputs.append(("input  logic "+(array_dims(row)+" " if int(row['count']) else "")+row['name']+"_event",
+        "\t/* idx #"+str(n)+": "+row['desc']+" (event) */"))
+    elif (row['access'] == "rw"):
+      outputs.append(("output logic " + array_dims(row) + reg_dims(row) + " " + row['name'],
+        "\t /* idx #"+str(n)+": "+row['desc']+" */"))
+  ports = inputs + outputs
+  commas = [","] * (len(ports)-1) + [""]    # no comma after the last port
+
+  # Port list inputs
+  fo.write(read_to_tag(fi_template,"VGEN: INPUTS TO REGS"))
+  for (decl, comment), comma in zip(inputs,commas):
+    fo.write(decl+comma+comment+"\n")
+
   # Port list outputs
   fo.write(read_to_tag(fi_template,"VGEN: OUTPUTS FROM REGS"))
-  first = True
-  for n, row in enumerate(regs):
-    if (row['access'] == "rw"):
-      l = ""
-      if first:           # Nastyness to avoid final comma in list
-        first = False
-      else:
-        l += ",\n"
-      l += "output logic " + reg_dims(row) + " " + row['name'] + "\t"
-      l += " /* idx #"+str(n)+": "+row['desc']+" */"
-      fo.write(l)
+  l = "\n".join(decl+comma+comment for (decl, comment), comma in zip(outputs,commas[len(inputs):]))
+  fo.write(l)
  
   # Register write 
   fo.write(read_to_tag(fi_template,"VGEN: REG WRITE"))
+  if decode == 'onehot':
+    l = "// Shared one-hot address decode, one select per register word\n"
+    for idx, count, rows in words:
+      if count:
+        l += "logic ["+str(count-1)+":0] sel_idx"+str(idx)+";\n"
+        l += "for (genvar i=0; i<"+str(count)+"; i++) begin : g_sel_idx"+str(idx)+"\n"
+        l += "  assign sel_idx"+str(idx)+"[i] = (regbus.addr[9:2]=="+addr_hex(idx)+"+i);\n"
+        l += "end\n"
+      else:
+        l += "logic sel_idx"+str(idx)+";\n"
+        l += "assign sel_idx"+str(idx)+" = (regbus.addr[9:2]=="+addr_hex(idx)+");\n"
+    fo.write(l+"\n")
   for n, row in enumerate(regs):
-    if row['access'] == "rw":
+    if row['access'] == "rw" and int(row['count']):
+      # One generate loop per array, one element per word
+      l = "// idx #"+str(n)+": "+row['name']+"["+str(row['count'])+"]\n"
+      l += "logic " + array_dims(row) + reg_dims(row) + " "+row['name']+"_reg;\n"
+      l += "for (genvar i=0; i<"+str(row['count'])+"; i++) begin : g_"+row['name']+"\n"
+      l += "  always@(posedge clk or negedge rstn) begin\n"
+      l += "    if(~rstn) begin\n      "
+      l += row['name']+"_reg[i]" + reg_dims(row) + reg_reset(row)
+      l += "    end else begin\n"
+      l += "      if(regbus.write_en & "+reg_sel(row,decode)+") "
+      l += row['name'] + "_reg[i]" + reg_dims(row) + " <= regbus.wdata" + reg_dims(row)
+      l += ";\n    end\n  end\nend\n"
+      l += "assign "+row['name']+" = "+row['name']+"_reg;\n\n"
+      fo.write(l)
+    elif row['access'] == "rw":
       l = "// idx #"+str(n)+"\n"
       l += "logic " + reg_dims(row) + " "+row['name']+"_reg;\n"
       l += "always@(posedge clk or negedge rstn) begin\n"
       l += "  if(~rstn) begin\n    "
-      l += row['name']+"_reg" + reg_dims(row)
-      if int(row['rval'].rsplit('0x')[1]) == 0:
-        l += " <= \'0;\n"
-      else:   # TODO really should get the correct number of digits for the reset value
-        l += " <= " + row['nbits'] + "\'h" + row['rval'].rsplit("0x")[1] + ";\n"
+      l += row['name']+"_reg" + reg_dims(row) + reg_reset(row)
       l += "  end else begin\n"
-      l += "    if(regbus.write_en & (regbus.addr[9:2]==8'h"+(hex(int(row['idx'])).lstrip("0x") or "0")+")) "
+      l += "    if(regbus.write_en & "+reg_sel(row,decode)+") "
       l += row['name'] + "_reg" + reg_dims(row) + " <= regbus.wdata" + reg_dims(row)
       l += ";\n  end\nend\n"
       l += "assign "+row['name']+reg_dims(row)+" = "+row['name']+"_reg"+reg_dims(row)+";\n\n"
       fo.write(l)
+
+  # Performance counters
+  if ctrl:
+    l = "// idx #"+str(regs.index(ctrl))+": counter control, [0] enable, [1] clear, [2] snapshot\n"
+    l += "logic " + reg_dims(ctrl) + " "+ctrl['name']+"_reg;\n"
+    l += "always@(posedge clk or negedge rstn) begin\n"
+    l += "  if(~rstn) begin\n    "
+    l += ctrl['name']+"_reg" + reg_dims(ctrl) + reg_reset(ctrl)
+    l += "  end else begin\n"
+    l += "    "+ctrl['name']+"_reg["+str(int(ctrl['start'])+2)+":"+str(int(ctrl['start'])+1)+"] <= '0;\t// clear and snapshot last one cycle\n"
+    l += "    if(regbus.write_en & "+reg_sel(ctrl,decode)+") "
+    l += ctrl['name'] + "_reg" + reg_dims(ctrl) + " <= regbus.wdata" + reg_dims(ctrl)
+    l += ";\n  end\nend\n"
+    l += "logic cnt_en, cnt_clr, cnt_snap;\n"
+    for k, sig in enumerate(['cnt_en','cnt_clr','cnt_snap']):
+      l += "assign "+sig+" = "+ctrl['name']+"_reg["+str(int(ctrl['start'])+k)+"];\n"
+    fo.write(l+"\n")
+  for n, row in enumerate(regs):
+    if is_counter(row):
+      mode = counter_access[row['access'].lower()]
+      count = int(row['count'])
+      l = "// idx #"+str(n)+": "+("wrapping" if mode == 'wrap' else "saturating")+" counter of "+row['name']+"_event"+(", "+str(count)+" elements" if count else "")+"\n"
+      l += "logic " + array_dims(row) + reg_dims(row) + " "+row['name']+"_cnt, "+row['name']+"_snap;\n"
+      ind = ""
+      i = ""
+      if count:               # One generate loop per counter array
+        l += "for (genvar i=0; i<"+str(count)+"; i++) begin : g_"+row['name']+"\n"
+        ind = "  "
+        i = "[i]"
+      cnt, snap = row['name']+"_cnt"+i+reg_dims(row), row['name']+"_snap"+i+reg_dims(row)
+      l += ind+"always@(posedge clk or negedge rstn) begin\n"
+      l += ind+"  if(~rstn) begin\n"
+      l += ind+"    "+cnt+" <= '0;\n"
+      l += ind+"    "+snap+" <= '0;\n"
+      l += ind+"  end else begin\n"
+      l += ind+"    if(cnt_snap) "+snap+" <= "+cnt+";\n"
+      l += ind+"    if(cnt_clr) "+cnt+" <= '0;\n"
+      if mode == 'wrap':
+        l += ind+"    else if(cnt_en & "+row['name']+"_event"+i+") "+cnt+" <= "+cnt+" + 1'b1;\n"
+      else:
+        l += ind+"    else if(cnt_en & "+row['name']+"_event"+i+" & ~&"+cnt+") "+cnt+" <= "+cnt+" + 1'b1;\n"
+      l += ind+"  end\n"
+      l += ind+"end\n"
+      if count:
+        l += "end\n"
+      fo.write(l+"\n")
+
+  # Register map fingerprint
+  for n, row in enumerate(regs):
+    if is_map_id(row):
+      l = "// idx #"+str(n)+": register map fingerprint\n"
+      l += "localparam logic [31:0] "+reg_rdata(row)+" = 32'h"+row['rval'].rsplit("0x")[1]+";\n\n"
+      fo.write(l)
   
   # Register read
   fo.write(read_to_tag(fi_template,"VGEN: REG READ"))
-  for n, row in enumerate(regs):
-    l = "    if(regbus.addr[9:2]==8'h"+(hex(int(row['idx'])).lstrip("0x") or "0")+") "
-    l += l + "rdata_o"+reg_dims(row)+" = "+row['name']+reg_dims(row)+";\t"
-    l = l +" // idx #"+str(n)+"\n"
+  if read_mux == 'if':
+    for n, row in enumerate(regs):
+      if int(row['count']):
+        l = "    for (int i=0; i<"+str(row['count'])+"; i++) if"+reg_sel(row,'compare')+" "
+        l += "rdata_o"+reg_dims(row)+" = "+reg_rdata(row)+"[i]"+reg_dims(row)+";\t"
+      else:
+        l = "    if"+reg_sel(row,'compare')+" "
+        l += "rdata_o"+reg_dims(row)+" = "+reg_rdata(row)+reg_dims(row)+";\t"
+      l = l +" // idx #"+str(n)+"\n"
+      fo.write(l)
+  elif read_mux == 'onehot':
+    for n, row in enumerate(regs):
+      if int(row['count']):
+        l = "    for (int i=0; i<"+str(row['count'])+"; i++) "
+        l += "rdata_o"+reg_dims(row)+" = rdata_o"+reg_dims(row)+" | ({"+row['nbits']+"{"+reg_sel(row,decode)+"}} & "
+        l += reg_rdata(row)+"[i]"+reg_dims(row)+");\t // idx #"+str(n)+"\n"
+      else:
+        l = "    rdata_o"+reg_dims(row)+" = rdata_o"+reg_dims(row)+" | ({"+row['nbits']+"{"+reg_sel(row,decode)+"}} & "
+        l += reg_rdata(row)+reg_dims(row)+");\t // idx #"+str(n)+"\n"
+      fo.write(l)
+  else:
+    # Arrays decode as a range of words, which needs case inside
+    inside = any(count for idx, count, rows in words)
+    l = "    "+("unique " if read_mux == 'unique' else "")+"case (regbus.addr[9:2])"+(" inside" if inside else "")+"\n"
+    for idx, count, rows in words:
+      if count:
+        l += "      ["+addr_hex(idx)+":"+addr_hex(idx+count-1)+"]: begin\n"
+        for row in rows:
+          l += "        rdata_o"+reg_dims(row)+" = "+reg_rdata(row)+"[regbus.addr[9:2]-"+addr_hex(idx)+"]"+reg_dims(row)+";\n"
+      else:
+        l += "      "+addr_hex(idx)+": begin\n"
+        for row in rows:
+          l += "        rdata_o"+reg_dims(row)+" = "+reg_rdata(row)+reg_dims(row)+";\n"
+      l += "      end\n"
+    l += "      default: ;\n"
+    l += "    endcase\n"
     fo.write(l)
-  
+
+  # Read data, optionally registered
+  fo.write(read_to_tag(fi_template,"VGEN: READ DATA"))
+  if read_reg:
+    l = "// Registered read data: regbus.rdata is valid the cycle after read_en\n"
+    l += "logic [31:0] rdata_q;\n"
+    l += "always@(posedge clk or negedge rstn) begin\n"
+    l += "  if(~rstn) begin\n    rdata_q[31:0] <= '0;\n"
+    l += "  end else begin\n"
+    l += "    if(regbus.read_en) rdata_q[31:0] <= rdata_o[31:0];\n"
+    l += "  end\nend\n"
+    l += "assign regbus.rdata[31:0] = rdata_q[31:0];\n"
+  else:
+    l = "assign regbus.rdata[31:0] = rdata_o[31:0];\n"
+  fo.write(l)
+
   # Rest of template
   fo.write(read_to_tag(fi_template,""))
   fo.write(banner_end())
@@ -187,6 +535,11 @@ def gen_regs_module(module_name,module_file,template_file,regs):
   # Close files
   fo.close()
   fi_template.close()
+
+  # Logic depth estimate of each block
+  print "**Logic depth estimate (2-input gate levels):"
+  for block, structure, depth in regs_logic_depth(regs,decode,read_mux,read_reg):
+    print "**  %-16s %-36s %3d" % (block,structure,depth)
   
 
 
@@ -196,6 +549,15 @@ def gen_regs_module(module_name,module_file,template_file,regs):
 
 def gen_regs_instance(module_name,instance_file,regs,clock='?clk',reset='?rstn'):
   """ Generate an instantiation template for the register module """
+  regs = reg_arrays(regs)
+  # Counters connect their event inputs; the counter control has no port
+  ports = []
+  for row in regs:
+    if is_counter(row):
+      row = dict(row, name=row['name']+'_event', nbits='0', start='0')
+    if row['access'].lower() != 'counter_ctrl' and not is_map_id(row):
+      ports.append(row)
+  regs = ports
 
   fo = open(instance_file,"w")
   print "**Writing module instantiation template to file \""+fo.name+"\""
@@ -204,7 +566,8 @@ def gen_regs_instance(module_name,instance_file,regs,clock='?clk',reset='?rstn')
   # list of signals
   fo.write("// START\n")
   for n, row in enumerate(regs):
-    l = "logic "+reg_dims(row)+" "+row['name']+";\n"
+    dims = array_dims(row)+reg_dims(row)
+    l = "logic "+(dims+" " if dims else "")+row['name']+";\n"
     fo.write(l)
   
   # module instantiation
@@ -223,7 +586,7 @@ def gen_regs_instance(module_name,instance_file,regs,clock='?clk',reset='?rstn')
       first = False
     else:
       l += ",\n"
-    l += "."+row['name']+"("+row['name']+reg_dims(row)+")"
+    l += "."+row['name']+"("+row['name']+("" if int(row['count']) else reg_dims(row))+")"
     l += "\t/* idx "+row['idx']+" */"
     fo.write(l)
   
@@ -244,6 +607,7 @@ def gen_regs_instance(module_name,instance_file,regs,clock='?clk',reset='?rstn')
 
 def gen_regs_docs(module_name,md_file,regs):
   """ Generate markdown documentation for the register module """
+  regs = reg_arrays(regs)
 
   fo = open(md_file,"w")
   print "**Writing module documentation to markdown file \""+fo.name+"\""
@@ -266,12 +630,18 @@ def gen_regs_docs(module_name,md_file,regs):
   last_reg = 0
   for n, row in enumerate(regs):
     l = ""
+    count = int(row['count'])
     if (int(row['idx']) > (last_reg+1)): l += "|\n"    # insert a gap if address is not contiguous
-    last_reg = int(row['idx'])
+    last_reg = max(last_reg,int(row['idx'])+max(count,1)-1)
     l += "| "
-    l += hex(int(row['idx']) *4)+" | "                 # Address
-    l += "**"+(row['name']).upper()+"** | "            # Signal name
+    l += hex(int(row['idx']) *4)                       # Address, or address range of an array
+    if count: l += " - "+hex((int(row['idx'])+count-1) *4)
+    l += " | "
+    l += "**"+(row['name']).upper()+("["+str(count)+"]" if count else "")+"** | "   # Signal name
     if (row['access'] == "r"): l += "R | "             # Read / write access
+    elif is_counter(row): l += "R ("+("wrapping" if counter_access[row['access'].lower()] == 'wrap' else "saturating")+" counter) | "
+    elif is_map_id(row): l += "R (map fingerprint "+row['rval']+") | "
+    elif (row['access'] == "counter_ctrl"): l += "RW (counter control: [0] enable, [1] clear, [2] snapshot) | "
     else:               l += "RW | "
     l += (row['nbits'])+" | "                          # bit width 
     l += (row['start'])+" | "                          # start bit position
@@ -294,6 +664,7 @@ def gen_regs_docs(module_name,md_file,regs):
 
 def gen_regs_cheader(module_name,cheader_file,regs):
   """ Generate C header with definitions for the register module """
+  regs = reg_arrays(regs)
 
   fo = open(cheader_file,"w")
   print "**Writing register map to C header file \""+fo.name+"\""
@@ -303,6 +674,8 @@ def gen_regs_cheader(module_name,cheader_file,regs):
   l = "#ifndef "+module_name.upper()+"_H \n"
   l += "#define "+module_name.upper()+"_H \n"
   l += "\n\n"
+  if map_id(regs):      # expected value of the MAP_ID register
+    l += "#define "+module_name.upper()+"_FINGERPRINT\t("+map_id(regs)['rval']+"UL)\n\n"
   fo.write(l)
    
   # start struct definition
@@ -315,21 +688,28 @@ def gen_regs_cheader(module_name,cheader_file,regs):
   for n, row in enumerate(regs):
     l = ""
     
+    if (int(row['idx']) < current_reg):    # Field shares a word with the previous member
+      l += "\t\t/* "+row['name'].upper()+" "+reg_dims(row)+" in Offset: "+hex(int(row['idx']) *4)+" */\n"
+      fo.write(l)
+      continue
+
     while (int(row['idx']) != current_reg): 
       l += "\t\tuint32_t RESERVED"+str(current_reg)+";\n"   # Use RESERVED if address is not contiguous
       current_reg = current_reg + 1
     else :
-      current_reg = current_reg + 1
+      current_reg = current_reg + max(int(row['count']),1)  # Arrays take one word per element
 
     l += "\t"                            # insert the macro for volatile / static depending on R/W
-    if (row['access'] == 'r'):  l += "__I "
+    if (row['access'] == 'r') or is_counter(row) or is_map_id(row):  l += "__I "
     else:                       l += "__IO "
 
     l += "uint32_t "                               # data type
-    l += row['name'].upper()+";\t\t"               # Signal name
+    l += row['name'].upper()                       # Signal name
+    if int(row['count']): l += "["+str(row['count'])+"]"
+    l += ";\t\t"
     l += "/* "                                     # open a comment to hold some info
     l += "Offset: "+hex(int(row['idx']) *4)+" "    # Address
-    if (row['access'] == "r"):  l += "(R/ ) "      # Read / write access
+    if (row['access'] == "r") or is_counter(row) or is_map_id(row):  l += "(R/ ) "      # Read / write access
     else:                       l += "(R/W) "
     l += (row['desc'])                             # signal description
     l += " */\n"                                   # close comment
@@ -338,6 +718,15 @@ def gen_regs_cheader(module_name,cheader_file,regs):
   # close the struct
   l = "} "+module_name.upper()+"_TypeDef;\n\n"
   fo.write(l)
+
+  # position and mask of each field in its word (or array element)
+  l = "/* Field positions and masks */\n"
+  for n, row in enumerate(regs):
+    field = module_name.upper()+"_"+row['name'].upper()
+    l += "#define "+field+"_Pos\t"+str(int(row['start']))+"\n"
+    l += "#define "+field+"_Msk\t("+hex((1 << int(row['nbits']))-1).rstrip("L")+"UL << "+field+"_Pos)\n"
+  l += "\n"
+  fo.write(l)
  
   # close the header guard
   l = "#endif\n\n"
@@ -352,22 +741,64 @@ def gen_regs_cheader(module_name,cheader_file,regs):
 # Python class
 ###############################################################################
 
-def gen_regs_python(module_name,output_file,regs):
-  """ Generate Python module with dictionary containing definitions for the register module """
+def gen_regs_python(module_name,output_file,regs,template_file='regs_template.py'):
+  """ Generate Python module with a class containing definitions and accessors for the register module """
+  regs = reg_arrays(regs)
+
+  # Open template
+  fi_template = open(template_file,"r")
 
   fo = open(output_file,"w")
-  print "**Writing register map dictionary to python module \""+fo.name+"\""
+  print "**Writing register map class to python module \""+fo.name+"\""
   
   # comment line and header guards
   fo.write("# "+banner_start())
+  fo.write(read_to_tag(fi_template,"VGEN: HEADER"))
+
+  # The accessor base class comes from the template
+  fo.write(read_to_tag(fi_template,"VGEN: CLASS"))
    
   # start struct definition
-  l = "class "+module_name.title()+"(object):\n"
+  l = "class "+module_name.title()+"(_RegBlock):\n"
+  fo.write(l)
+
+  # field table used by the accessors: name -> (offset, start, nbits, access, rval)
+  l = "\n\tFIELDS = {\n"
+  for n, row in enumerate(regs):
+    if not int(row['count']):
+      l += "\t\t'"+row['name'].upper()+"': ("+hex(int(row['idx']) *4)+", "+row['start']+", "+row['nbits']+", '"+row['access'].lower()+"', "+row['rval']+"),\n"
+  l += "\t}\n"
   fo.write(l)
+
+  # register arrays: name -> (offset, start, nbits, access, rval, count), one word per element
+  if any(int(row['count']) for row in regs):
+    l = "\n\tARRAYS = {\n"
+    for n, row in enumerate(regs):
+      if int(row['count']):
+        l += "\t\t'"+row['name'].upper()+"': ("+hex(int(row['idx']) *4)+", "+row['start']+", "+row['nbits']+", '"+row['access'].lower()+"', "+row['rval']+", "+str(row['count'])+"),\n"
+    l += "\t}\n"
+    fo.write(l)
+
+  # counters: field or array name -> 'wrap' or 'sat', and the field holding the counter controls
+  ctrl = counter_ctrl(regs)
+  if ctrl:
+    l = "\n\tCOUNTERS = {\n"
+    for n, row in enumerate(regs):
+      if is_counter(row):
+        l += "\t\t'"+row['name'].upper()+"': '"+counter_access[row['access'].lower()]+"',\n"
+    l += "\t}\n"
+    l += "\tCOUNTER_CTRL = '"+ctrl['name'].upper()+"'\n"
+    fo.write(l)
+
+  # register map fingerprint, and the field it is read from
+  if map_id(regs):
+    l = "\n\tFINGERPRINT = "+map_id(regs)['rval']+"\n"
+    l += "\tFINGERPRINT_FIELD = '"+map_id(regs)['name'].upper()+"'\n"
+    fo.write(l)
   
-  # add a constructor to allow the base_offset to be set for the regs
-  l = "\n\tdef __init__(self,base_offset):\n"
-  l += "\t\tself.base_offset = base_offset\n\n\n"
+  # add a constructor to allow the base_offset and transport to be set for the regs
+  l = "\n\tdef __init__(self,base_offset,transport=None):\n"
+  l += "\t\t_RegBlock.__init__(self,base_offset,transport)\n\n"
   fo.write(l)
 
   # Generate each item in the struct
@@ -375,23 +806,66 @@ def gen_regs_python(module_name,output_file,regs):
   for n, row in enumerate(regs):
     l = ""
     
-    while (int(row['idx']) != current_reg): 
+    while (int(row['idx']) > current_reg): 
       l += "\t\tself.RESERVED"+str(current_reg)+" = None\n"   # Use RESERVED if address is not contiguous
       current_reg = current_reg + 1
-    else :
-      current_reg = current_reg + 1
+    current_reg = max(current_reg,int(row['idx'])+max(int(row['count']),1))   # Fields may share a word
 
-    l += "\t\tself."+row['name'].upper()+" = self.base_offset + "+hex(int(row['idx']) *4)  # Name and Address
+    if int(row['count']):                                     # Arrays get a list of element addresses
+      l += "\t\tself."+row['name'].upper()+" = [self.base_offset + "+hex(int(row['idx']) *4)+" + 4*i for i in range("+str(row['count'])+")]"
+    else:
+      l += "\t\tself."+row['name'].upper()+" = self.base_offset + "+hex(int(row['idx']) *4)  # Name and Address
     l += "\t\t# "+(row['desc'])                              # signal description in comment
     l += "\n"
     fo.write(l)
   
   # close the class
-  l += "\n\n"
+  fo.write("\n\n")
+
+  # Rest of template
+  fo.write(read_to_tag(fi_template,""))
+  fo.write("# "+banner_end())
+  fo.close()
+  fi_template.close()
+
+
+###############################################################################
+# Python behavioural model
+###############################################################################
+
+def gen_regs_model(module_name,output_file,regs,template_file='regs_model_template.py'):
+  """
+  Generate a NumPy behavioural model of the register module, usable as a transport for the Python class.
+  Counters are modelled as inputs (set_input()): the enable, clear and snapshot of the counter control are not.
+  """
+  regs = reg_arrays(regs)
+  counter_ctrl(regs)
+
+  # Open template
+  fi_template = open(template_file,"r")
+
+  fo = open(output_file,"w")
+  print "**Writing behavioural model to python module \""+fo.name+"\""
+
+  fo.write("# "+banner_start())
+  fo.write(read_to_tag(fi_template,"VGEN: HEADER"))
+
+  # The model base class comes from the template
+  fo.write(read_to_tag(fi_template,"VGEN: CLASS"))
+
+  l = "class "+module_name.title()+"Model(_RegModel):\n"
+  # field table: (name, word, start, nbits, access, rval, count)
+  l += "\n\tFIELDS = [\n"
+  for n, row in enumerate(regs):
+    l += "\t\t('"+row['name'].upper()+"', "+str(int(row['idx']))+", "+row['start']+", "+row['nbits']+", '"+row['access'].lower()+"', "+row['rval']+", "+str(row['count'])+"),\n"
+  l += "\t]\n\n\n"
   fo.write(l)
 
+  # Rest of template
+  fo.write(read_to_tag(fi_template,""))
   fo.write("# "+banner_end())
   fo.close()
+  fi_template.close()
 
 
 ###############################################################################
@@ -399,8 +873,19 @@ def gen_regs_python(module_name,output_file,regs):
 ###############################################################################
 
 
+def ctest_names(module_name,row,members):
+  """ C test names of a field: the word holding it, its _Pos/_Msk prefix, and the error statement """
+  reg = "SM2_"+module_name.upper()+"->"+members[row['name']].upper()+("[i]" if int(row['count']) else "")
+  field = module_name.upper()+"_"+row['name'].upper()
+  err = "{num_errors += 1; puts(\"ERROR: "+row['name'].upper()+"\");}"
+  return reg, field, err
+
+
 def gen_regs_ctest(module_name,output_file,regs):
   """ Generate C header with definitions for the register module """
+  regs = reg_arrays(regs)
+  members = reg_members(regs)
+  loop = "\tint i;\n" if any(int(row['count']) for row in regs) else ""
  
   # Write a header for the test
   fo = open(output_file[0],"w")
@@ -449,13 +934,21 @@ def gen_regs_ctest(module_name,output_file,regs):
   # start of initial value test function
   l = "// This test is intended to check initial (reset) values of registers\n"
   l += "int "+module_name+"_initial_value_test(void) {\n"
-  l += "\tint num_errors=0;\n\n"
+  l += "\tint num_errors=0;\n"+loop+"\n"
   fo.write(l)
  
-  # Generate test for each register
+  # Generate test for each register, through the struct member holding its word
   l = ""
   for n, row in enumerate(regs):
-    l += "\tif (SM2_"+module_name.upper()+"->"+row['name'].upper()+" != 0)\t\t{num_errors += 1; puts(\"ERROR: "+row['name'].upper()+"\");}\n"
+    reg, field, err = ctest_names(module_name,row,members)
+    if int(row['count']):   # one loop per array
+      l += "\tfor (i=0; i<"+str(row['count'])+"; i++)\n\t"
+      l += "\tif (("+reg+" & "+field+"_Msk) != 0)\t\t"+err+"\n"
+      continue
+    if is_map_id(row):      # the map ID must match the generated register map
+      l += "\tif ("+reg+" != "+row['rval']+")\t\t"+err+"\n"
+      continue
+    l += "\tif (("+reg+" & "+field+"_Msk) != 0)\t\t"+err+"\n"
   l += "\n\n"
   fo.write(l)
 
@@ -468,17 +961,24 @@ def gen_regs_ctest(module_name,output_file,regs):
   # start of write read test function
   l = "// This test is intended to check write read to registers\n"
   l += "int "+module_name+"_write_read_test(void) {\n"
-  l += "\tint num_errors=0;\n\n"
+  l += "\tint num_errors=0;\n"+loop+"\n"
   fo.write(l)
  
-  # Generate test for each register
+  # Generate test for each register: all-1s then all-0s, checking the field bits of the word
   l = ""
   for n, row in enumerate(regs):
-    if (row['access'].lower()=="rw"):
-      l += "\tSM2_"+module_name.upper()+"->"+row['name'].upper()+" = 0xFFFFFFFF;\t// write all-1s\n"
-      l += "\tif (SM2_"+module_name.upper()+"->"+row['name'].upper()+" != (0xFFFFFFFF >> (32-"+row['nbits']+")))\t\t{num_errors += 1; puts(\"ERROR: "+row['name'].upper()+"\");}\t// check field is all-1s\n"
-      l += "\tSM2_"+module_name.upper()+"->"+row['name'].upper()+" = 0x0;\t// clear field\n"
-      l += "\tif (SM2_"+module_name.upper()+"->"+row['name'].upper()+" != 0x0)\t\t{num_errors += 1; puts(\"ERROR: "+row['name'].upper()+"\");}\t// check field is all-0s\n"
+    if (row['access'].lower()!="rw"):
+      continue
+    reg, field, err = ctest_names(module_name,row,members)
+    t = "\t\t" if int(row['count']) else "\t"
+    if int(row['count']):   # one loop per array
+      l += "\tfor (i=0; i<"+str(row['count'])+"; i++) {\n"
+    l += t+reg+" = 0xFFFFFFFF;\t// write all-1s\n"
+    l += t+"if ((("+reg+" & "+field+"_Msk) >> "+field+"_Pos) != (0xFFFFFFFF >> (32-"+row['nbits']+")))\t\t"+err+"\t// check field is all-1s\n"
+    l += t+reg+" = 0x0;\t// clear field\n"
+    l += t+"if (("+reg+" & "+field+"_Msk) != 0x0)\t\t"+err+"\t// check field is all-0s\n"
+    if int(row['count']):
+      l += "\t}\n"
   l += "\n\n"
   fo.write(l)
 
@@ -518,13 +1018,20 @@ def test():
 def main():
 
   parser = argparse.ArgumentParser(description='Generate memory-mapped registers.')
-  parser.add_argument('-u','--update', nargs='?', const='DEFAULT', type=str, help='Read in specified verilog file, find new registers and store back to CSV', required=False)
+  parser.add_argument('-u','--update', nargs='?', const='DEFAULT', type=str, help='Read in specified verilog file (or comma separated files), find new registers and store back to CSV', required=False)
+  parser.add_argument('-I','--incdir', action='append', default=[], help='Include directory for `include when reading verilog (repeatable).', required=False)
+  parser.add_argument('-D','--define', action='append', default=[], help='Define a macro, NAME or NAME=VALUE, when reading verilog (repeatable).', required=False)
   parser.add_argument('-g','--generate', nargs='?', const='DEFAULT', help='Read in specified CSV and generate module and associated collateral.', required=False)
   parser.add_argument('-p','--prefix', default='DEFAULT', type=str, help='Specifies the prefix for signals.', required=False)
   parser.add_argument('-c','--csv', default='DEFAULT', type=str, help='Specifies the csv file.', required=False)
   parser.add_argument('-o','--output', default='output', help='Specifies an output directory', required=False)
   parser.add_argument('-clk','--clock', default='?clk', help='Specify the name of the clock in the instantiation template.', required=False)
   parser.add_argument('-rst','--reset', default='?rstn', help='Specify the name of the reset in the instantiation template.', required=False)
+  parser.add_argument('-d','--decode', default='compare', choices=regs_decodes, help='Address decode: compare per register, or shared one-hot selects.', required=False)
+  parser.add_argument('-m','--read-mux', default='if', choices=regs_read_muxes, help='Read mux structure.', required=False)
+  parser.add_argument('--read-reg', action='store_true', help='Register the read data (one cycle of read latency).', required=False)
+  parser.add_argument('--id', nargs='?', const=255, type=int, help='Add a read-only MAP_ID register holding the register map fingerprint, at the specified word (default 255).', required=False)
+  parser.add_argument('--id-with', nargs='*', default=[], help='Memory map CSV files (as read by vgen_memmap.py) whose fingerprints are folded into MAP_ID.', required=False)
   args = parser.parse_args()
   if not (args.generate or args.update):
     parser.error('No action specified.  Please specify an action: --update or --generate')
@@ -533,7 +1040,8 @@ def main():
   # Run scripts
   
   if (args.update):
-    update_regs_csv_from_verilog(args.csv,args.update,match_prefix=args.prefix)
+    defines = dict((x.split('=',1) + [''])[:2] for x in args.define)
+    update_regs_csv_from_verilog(args.csv,args.update.split(','),match_prefix=args.prefix,incdirs=args.incdir,defines=defines)
  
   if (args.generate):
     # Module name is derived from the CSV filename
@@ -543,12 +1051,15 @@ def main():
 
     # Read in the register list
     regs = read_csv(args.generate,debug=True)
+    if args.id is not None:
+      regs = add_map_id(regs,args.id,[read_csv(x) for x in args.id_with])
 
     # generate verilog
-    gen_regs_module(module,outdir+'/'+module+'.sv','regs_template.sv',regs)
+    gen_regs_module(module,outdir+'/'+module+'.sv','regs_template.sv',regs,decode=args.decode,read_mux=args.read_mux,read_reg=args.read_reg)
     gen_regs_instance(module,outdir+'/'+module+'.inst.sv',regs,clock=args.clock,reset=args.reset)
     gen_regs_docs(module,outdir+'/'+module+'.md',regs)
-    gen_regs_python(module,outdir+'/'+module+'.py',regs)
+    gen_regs_python(module,outdir+'/'+module+'.py',regs,'regs_template.py')
+    gen_regs_model(module,outdir+'/'+module+'_model.py',regs,'regs_model_template.py')
     gen_regs_cheader(module,outdir+'/'+module.upper()+'.h',regs)
     gen_regs_ctest(module,[outdir+'/'+module+'_test.h',outdir+'/'+module+'_test.c'],regs)
 